@@ -0,0 +1,196 @@
+"""
+가짜 모델(mock_model)로 파이프라인 엔진의 처리량을 재는 벤치마크입니다.
+네트워크와 API 할당량 없이 대표적인 워크플로우 모양(직렬 체인, 넓은 팬아웃, 깊은 체인 x 100배치)을 실행하고
+초당 이미지 수, 노드 지연 시간 백분위수, 최대 메모리(RSS), 업로드/저장 바이트 수를 보고합니다.
+모양마다 새 프로세스에서 실행하므로 최대 RSS가 서로 섞이지 않습니다.
+
+명령줄 사용 예:
+    python -m benchmark
+    python -m benchmark --shape fanout --latency-ms 200 --error-rate 0.05 --json bench.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from image_payload import PayloadCache
+from mock_model import MockGenerativeModel
+from model_client import DEFAULT_CONFIG, ModelClient
+from output_writer import writer_options_from_config
+from pipeline_engine import PipelineEngine, app_base_dir
+from pipeline_graph import GLOBAL_INPUT, PREVIOUS_NODE, PipelineGraph
+from run_trace import NODE_SPAN
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 모양 이름 -> (노드 수, 배치 수)
+SHAPES = {
+    "linear": (8, 4),
+    "fanout": (33, 4),
+    "deep": (10, 100),
+}
+
+
+def build_node_specs(shape, node_count):
+    """벤치마크용 워크플로우의 노드 spec 리스트입니다. fanout은 루트 하나에 나머지가 모두 자식으로 붙습니다."""
+    specs = []
+    for index in range(node_count):
+        if index == 0:
+            parent = GLOBAL_INPUT
+        elif shape == "fanout":
+            parent = "node_1"
+        else:
+            parent = PREVIOUS_NODE
+        specs.append({"name": f"node_{index + 1}", "prompt": f"step {index + 1}", "image_path": None, "parent": parent})
+    return specs
+
+
+def peak_rss_mb():
+    """이 프로세스의 최대 RSS(MB)입니다. 측정할 수 없는 플랫폼에서는 None입니다."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux는 KB, macOS는 바이트 단위입니다.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else None
+
+
+def run_benchmark(shape, args):
+    """모양 하나를 실행하고 측정값 dict를 돌려줍니다."""
+    node_count, iterations = SHAPES[shape]
+    node_count = args.nodes or node_count
+    iterations = args.batches or iterations
+
+    config = dict(DEFAULT_CONFIG)
+    config.update({
+        "model_name": "mock-image-model",
+        "max_concurrent_requests": args.concurrency,
+        "requests_per_minute": 0,
+        "retry_base_delay": args.retry_base_delay,
+        "output_fsync": not args.no_fsync,
+    })
+    model = MockGenerativeModel(latency_ms=args.latency_ms, latency_sigma=args.latency_sigma, error_rate=args.error_rate,
+                                no_image_rate=args.no_image_rate, image_size=args.image_size, image_format=args.image_format,
+                                seed=args.seed)
+    client = ModelClient(None, config, model=model)
+    graph = PipelineGraph(build_node_specs(shape, node_count))
+
+    with tempfile.TemporaryDirectory(prefix="bananafy-bench-") as work_dir:
+        base_image_path = os.path.join(work_dir, "base.png")
+        Image.effect_noise((args.image_size, args.image_size), 64).convert("RGB").save(base_image_path)
+        engine = PipelineEngine(client, {"prompt": "benchmark"}, os.path.join(work_dir, "out"),
+                                payloads=PayloadCache.from_config(config), writer_options=writer_options_from_config(config))
+
+        started = time.perf_counter()
+        engine.run(graph, base_image_path, shape, iterations=iterations, parallel_batches=args.parallel_batches, use_cache=False)
+        wall_seconds = time.perf_counter() - started
+
+    spans = engine.last_tracer.spans
+    node_durations = sorted(span["duration"] for span in spans if span["name"] == NODE_SPAN and "error" not in span)
+    images = len(node_durations)
+    return {
+        "shape": shape,
+        "nodes": node_count,
+        "batches": iterations,
+        "images": images,
+        "wall_seconds": wall_seconds,
+        "images_per_second": images / wall_seconds if wall_seconds > 0 else None,
+        "latency_p50": _percentile(node_durations, 0.50),
+        "latency_p95": _percentile(node_durations, 0.95),
+        "latency_p99": _percentile(node_durations, 0.99),
+        "latency_max": node_durations[-1] if node_durations else None,
+        "upload_bytes": sum(span.get("bytes", 0) for span in spans if span["name"] == "payloads"),
+        "generated_bytes": sum(span.get("bytes", 0) for span in spans if span["name"] == "generate"),
+        "written_bytes": sum(span.get("bytes", 0) for span in spans if span["name"] == "save"),
+        "requests": engine.last_request_stats["requests"],
+        "retries": engine.last_request_stats["retries"],
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def format_results(results):
+    """측정값 리스트를 표 형태의 문자열로 만듭니다."""
+    header = f"{'모양':<8}{'이미지':>8}{'시간(s)':>10}{'이미지/s':>10}{'p50(s)':>9}{'p95(s)':>9}{'p99(s)':>9}{'최대(s)':>9}" \
+             f"{'RSS(MB)':>9}{'업로드(MB)':>11}{'저장(MB)':>10}{'재시도':>7}"
+    lines = [header]
+    for r in results:
+        rss = f"{r['peak_rss_mb']:.0f}" if r["peak_rss_mb"] is not None else "-"
+        lines.append(
+            f"{r['shape']:<8}{r['images']:>8}{r['wall_seconds']:>10.2f}{r['images_per_second']:>10.1f}"
+            f"{r['latency_p50']:>9.3f}{r['latency_p95']:>9.3f}{r['latency_p99']:>9.3f}{r['latency_max']:>9.3f}"
+            f"{rss:>9}{r['upload_bytes'] / 1e6:>11.1f}{r['written_bytes'] / 1e6:>10.1f}{r['retries']:>7}"
+        )
+    return "\n".join(lines)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="가짜 모델로 파이프라인 엔진의 처리량을 잽니다.")
+    parser.add_argument("--shape", choices=["all"] + list(SHAPES), default="all", help="워크플로우 모양 (기본값: 모두)")
+    parser.add_argument("--nodes", type=int, help="노드 수 (기본값: 모양별 기본값)")
+    parser.add_argument("--batches", type=int, help="배치 수 (기본값: 모양별 기본값)")
+    parser.add_argument("--parallel-batches", type=int, default=4, help="동시에 실행할 최대 배치 수")
+    parser.add_argument("--concurrency", type=int, default=16, help="동시에 보낼 최대 요청 수")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="가짜 모델 지연 시간의 중앙값 (ms)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="지연 시간 로그 정규 분포의 폭 (0이면 고정)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="일시적인 서버 오류를 돌려줄 요청 비율")
+    parser.add_argument("--no-image-rate", type=float, default=0.0, help="이미지 없는 응답을 돌려줄 요청 비율")
+    parser.add_argument("--retry-base-delay", type=float, default=0.05, help="재시도 백오프의 시작 대기 시간 (초)")
+    parser.add_argument("--image-size", type=int, default=1024, help="가짜 결과 이미지의 한 변 길이")
+    parser.add_argument("--image-format", default="PNG", help="가짜 결과 이미지 형식 (PNG/JPEG/WEBP)")
+    parser.add_argument("--no-fsync", action="store_true", help="결과물 저장 시 fsync를 하지 않습니다")
+    parser.add_argument("--seed", type=int, default=1234, help="지연 시간/오류 난수 시드")
+    parser.add_argument("--json", help="측정값을 JSON 파일로도 저장합니다")
+    parser.add_argument("--emit-json", action="store_true", help=argparse.SUPPRESS)
+    return parser
+
+
+def _child_argv(args, shape):
+    """모양 하나를 새 프로세스에서 실행할 때 넘길 인자입니다."""
+    argv = ["--shape", shape, "--emit-json"]
+    for name in ("nodes", "batches", "parallel_batches", "concurrency", "latency_ms", "latency_sigma", "error_rate",
+                 "no_image_rate", "retry_base_delay", "image_size", "image_format", "seed"):
+        value = getattr(args, name)
+        if value is not None:
+            argv += ["--" + name.replace("_", "-"), str(value)]
+    if args.no_fsync:
+        argv.append("--no-fsync")
+    return argv
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+
+    if args.emit_json:
+        print(json.dumps(run_benchmark(args.shape, args)))
+        return 0
+
+    shapes = list(SHAPES) if args.shape == "all" else [args.shape]
+    results = []
+    for shape in shapes:
+        completed = subprocess.run([sys.executable, "-m", "benchmark"] + _child_argv(args, shape),
+                                   cwd=app_base_dir(), capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"오류: '{shape}' 벤치마크가 실패했습니다.\n{completed.stderr}", file=sys.stderr)
+            return 1
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
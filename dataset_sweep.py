@@ -0,0 +1,230 @@
+"""
+폴더(또는 glob 패턴)에 있는 여러 기본 이미지에 같은 워크플로우를 차례로 적용하는 데이터셋 스윕입니다.
+이미지는 처리할 차례가 되었을 때만 읽고, 동시에 처리하는 입력 수는 max_parallel_inputs개로 제한합니다.
+입력마다 '<출력 폴더>/<스윕 이름>/<입력 이름>/'에 결과물을 쓰고 그 옆에 실행 매니페스트를 남기므로,
+다시 실행하면 끝난 입력은 건너뛰고 중간에 끊긴 입력은 이어서 처리합니다.
+
+명령줄 사용 예:
+    python -m dataset_sweep --workflow workflows/sample.json --base-images characters/ --system-prompt prompts/prompts_template.json
+    python -m dataset_sweep --workflow workflows/sample.json --base-images "characters/**/*.png" --parallel-inputs 4 ...
+"""
+import argparse
+import asyncio
+import copy
+import glob
+import os
+import sys
+import time
+
+from pipeline_engine import add_run_arguments, budget_from_args, engine_from_args, metrics_exporter_from_args, safe_name
+from run_manifest import RunManifest
+from run_progress import format_duration
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+DEFAULT_MAX_PARALLEL_INPUTS = 2
+
+# 입력이 끝나지 않아도 진행 상황을 다시 알리는 간격(초)
+SWEEP_REPORT_SECONDS = 5.0
+
+
+def list_base_images(source):
+    """
+    source(폴더 또는 glob 패턴)에 해당하는 이미지 파일 경로를 이름 순서로 돌려줍니다.
+    파일 이름만 모으고 이미지는 열지 않습니다.
+    """
+    if os.path.isdir(source):
+        paths = (entry.path for entry in os.scandir(source) if entry.is_file())
+    else:
+        paths = glob.iglob(source, recursive=True)
+    return sorted(path for path in paths if path.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def input_name(path):
+    """
+    입력별 결과물 폴더 이름입니다. 확장자까지 포함한 파일 이름('char01.png' -> 'char01_png')으로 정하므로
+    같은 폴더에 확장자만 다른 파일이 있어도 겹치지 않고, 다시 실행할 때 어떤 입력이 함께 있든 항상 같습니다.
+    """
+    return safe_name(os.path.basename(path).replace(".", "_")) or "input"
+
+
+class SweepProgress:
+    """
+    스윕 진행 상황입니다. 처리 속도와 남은 시간은 이번 실행에서 실제로 처리한 입력만으로 계산합니다.
+    describe()에 엔진의 RunProgress.snapshot()을 함께 주면, 입력 하나가 끝나기 전에도 노드 단위 처리 속도로
+    남은 시간을 계산합니다.
+    """
+
+    def __init__(self, total, units_per_input=0):
+        self.total = total
+        # 입력 하나를 처리할 때 실행하는 노드 수 (노드 수 x 배치 수)
+        self.units_per_input = units_per_input
+        self.completed = 0
+        self.skipped = 0
+        self.failed = []
+        # 예산이 부족해 끝내지 못한 입력 경로
+        self.refused = []
+        # 아직 작업자가 가져가지 않은 입력 수
+        self.waiting = total
+        self.started = time.monotonic()
+
+    @property
+    def finished(self):
+        return self.completed + self.skipped + len(self.failed) + len(self.refused)
+
+    def rate_per_minute(self):
+        elapsed = time.monotonic() - self.started
+        return self.completed / elapsed * 60 if elapsed > 0 and self.completed else None
+
+    def eta_seconds(self):
+        rate = self.rate_per_minute()
+        return (self.total - self.finished) / rate * 60 if rate else None
+
+    def node_eta_seconds(self, node_snapshot):
+        """가져가지 않은 입력의 노드 수와 처리 중인 입력의 남은 노드 수를 최근 노드 처리 속도로 나눈 남은 시간입니다."""
+        images_per_minute = node_snapshot["images_per_minute"]
+        if not images_per_minute:
+            return None
+        remaining = self.waiting * self.units_per_input + node_snapshot["queued"] + node_snapshot["in_flight"]
+        return remaining / images_per_minute * 60
+
+    def describe(self, node_snapshot=None):
+        text = f"스윕 {self.finished}/{self.total} (완료 {self.completed}, 건너뜀 {self.skipped}, 실패 {len(self.failed)}"
+        text += f", 예산 부족 {len(self.refused)})" if self.refused else ")"
+        rate = self.rate_per_minute()
+        eta = self.node_eta_seconds(node_snapshot) if node_snapshot else None
+        if eta is None and rate:
+            eta = self.eta_seconds()
+        if rate:
+            text += f" - 분당 {rate:.1f}개"
+        if node_snapshot and node_snapshot["images_per_minute"]:
+            text += f" - 이미지 분당 {node_snapshot['images_per_minute']:.1f}장, 실행 중 {node_snapshot['in_flight']}"
+        if eta is not None and self.finished < self.total:
+            text += f", 남은 시간 약 {format_duration(eta)}"
+        return text
+
+
+def is_input_finished(engine, graph, base_image_path, name, iterations):
+    """같은 설정으로 이 입력의 모든 (배치, 노드)가 이미 기록되어 있으면 True입니다. 결과물 파일은 읽지 않습니다."""
+    completed = RunManifest.read_completed(engine.manifest_path(name), engine.run_fingerprint(graph, base_image_path))
+    return completed is not None and len(completed) >= len(graph) * iterations
+
+
+async def sweep_async(engine, graph, sweep_name, paths, iterations=1, parallel_batches=1, max_parallel_inputs=DEFAULT_MAX_PARALLEL_INPUTS,
+                      use_cache=True, budget=None):
+    """
+    paths의 각 이미지를 기본 이미지로 graph를 iterations번 실행하고 SweepProgress를 돌려줍니다.
+    한 입력이 실패해도 나머지 입력은 계속 처리하며, 실패한 입력은 progress.failed에 (경로, 오류)로 남습니다.
+    budget(RunBudget)은 스윕 전체가 함께 쓰며, 예산이 부족해 끝내지 못했거나 시작하지 않은 입력은 progress.refused에 남습니다.
+    진행 상황은 입력이 끝날 때마다, 그리고 입력을 처리하는 동안에도 SWEEP_REPORT_SECONDS마다 알립니다.
+    """
+    # 입력별 결과물 폴더가 '<출력 폴더>/<스윕 이름>/' 아래에 생기도록 출력 폴더만 바꾼 엔진을 씁니다.
+    sweep_engine = copy.copy(engine)
+    sweep_engine.output_dir = engine.workflow_output_dir(sweep_name)
+    progress = SweepProgress(len(paths), len(graph) * iterations)
+    pending = ((path, input_name(path)) for path in paths)
+
+    def report():
+        # 복사한 엔진도 RunProgress는 원래 엔진과 같은 객체를 쓰므로 모든 입력의 노드 진행이 합쳐져 있습니다.
+        engine.on_event("update_status", progress.describe(engine.progress.snapshot()))
+        engine.on_event("sweep_progress", progress)
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(SWEEP_REPORT_SECONDS)
+            report()
+
+    async def worker():
+        # 작업자마다 다음 입력을 하나씩 가져가므로, 아직 차례가 오지 않은 입력은 열지도 않습니다.
+        for path, name in pending:
+            progress.waiting -= 1
+            try:
+                finished = await asyncio.to_thread(is_input_finished, sweep_engine, graph, path, name, iterations)
+                if finished:
+                    progress.skipped += 1
+                elif budget is not None and budget.refused_batches:
+                    # 한 번 거절한 예산은 이후 배치를 모두 거절하므로 남은 입력은 열지 않습니다.
+                    progress.refused.append(path)
+                else:
+                    await sweep_engine.run_async(graph, path, name, iterations, parallel_batches, use_cache, resume=True, budget=budget)
+                    if budget is not None and budget.refused_batches and not await asyncio.to_thread(
+                            is_input_finished, sweep_engine, graph, path, name, iterations):
+                        progress.refused.append(path)
+                    else:
+                        progress.completed += 1
+            except Exception as e:
+                progress.failed.append((path, e))
+                engine.on_event("update_status", f"'{os.path.basename(path)}' 처리 중 오류: {e}")
+            report()
+
+    reporter_task = asyncio.create_task(reporter())
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, max_parallel_inputs))))
+    finally:
+        reporter_task.cancel()
+    return progress
+
+
+def run_sweep(engine, graph, sweep_name, source, iterations=1, parallel_batches=1, max_parallel_inputs=DEFAULT_MAX_PARALLEL_INPUTS,
+              use_cache=True, budget=None):
+    """source(폴더 또는 glob 패턴)의 모든 이미지에 대해 스윕을 실행합니다. 이미지가 하나도 없으면 ValueError입니다."""
+    paths = list_base_images(source)
+    if not paths:
+        raise ValueError(f"'{source}'에서 처리할 이미지({', '.join(IMAGE_EXTENSIONS)})를 찾을 수 없습니다.")
+    return engine.client.run(sweep_async(engine, graph, sweep_name, paths, iterations, parallel_batches, max_parallel_inputs, use_cache,
+                                         budget))
+
+
+# --- 명령줄 실행 ---
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(prog="python -m dataset_sweep",
+                                     description="폴더(또는 glob 패턴)의 모든 기본 이미지에 Bananafy 워크플로우를 실행합니다.")
+    parser.add_argument("--base-images", required=True, help="기본 이미지 폴더 또는 glob 패턴 (예: \"chars/**/*.png\")")
+    parser.add_argument("--parallel-inputs", type=int, default=DEFAULT_MAX_PARALLEL_INPUTS, help="동시에 처리할 최대 기본 이미지 수")
+    return add_run_arguments(parser)
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+
+    def print_event(command, data):
+        # 입력이 많으므로 결과물 하나하나가 아니라 진행 상황과 오류만 출력합니다.
+        if command == "update_status" and (data.startswith("스윕 ") or "오류" in data):
+            print(data, flush=True)
+
+    try:
+        engine, graph, sweep_name = engine_from_args(args, on_event=print_event)
+    except (OSError, ValueError) as e:
+        print(f"오류: {e}", file=sys.stderr)
+        return 1
+
+    budget = budget_from_args(args)
+    exporter = metrics_exporter_from_args(args, engine, sweep_name)
+    try:
+        progress = run_sweep(engine, graph, sweep_name, args.base_images, iterations=max(1, args.batches),
+                             parallel_batches=max(1, args.parallel_batches), max_parallel_inputs=max(1, args.parallel_inputs),
+                             use_cache=not args.no_cache, budget=budget if budget.limited else None)
+    except Exception as e:
+        print(f"스윕 실행 중 오류가 발생했습니다: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if exporter is not None:
+            exporter.close()
+        if budget.limited:
+            print(budget.describe())
+
+    print(f"스윕 완료! 입력 {progress.total}개 중 {progress.completed}개 처리, {progress.skipped}개는 이미 처리되어 건너뛰었습니다.")
+    if progress.failed:
+        print(f"실패한 입력 {len(progress.failed)}개 (다시 실행하면 이어서 처리합니다):", file=sys.stderr)
+        for path, error in progress.failed:
+            print(f"  {path}: {error}", file=sys.stderr)
+    if progress.refused:
+        print(f"예산이 부족해 입력 {len(progress.refused)}개를 끝내지 못했습니다. 예산을 늘리고 다시 실행하면 이어서 처리합니다.", file=sys.stderr)
+    if progress.failed or progress.refused:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
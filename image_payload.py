@@ -0,0 +1,209 @@
+"""
+모델에 올려보낼 이미지를 미리 줄이고 다시 인코딩하는 전처리 단계와,
+모델이 돌려준 인코딩된 이미지를 그대로 들고 다니는 EncodedImage를 제공합니다.
+파일에서 읽는 이미지(기본 이미지, 참조 이미지)는 경로와 수정 시각을 키로 인코딩 결과를 메모리에 캐시하므로,
+같은 참조 이미지를 여러 노드와 배치가 써도 디코딩과 인코딩은 한 번만 일어납니다.
+노드 결과물은 업로드 조건(형식, 최대 변 길이)을 이미 만족하면 디코딩 없이 원본 바이트를 그대로 다음 노드에 보냅니다.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+
+from PIL import Image
+
+UPLOAD_FORMATS = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "PNG": "image/png",
+}
+
+DEFAULT_UPLOAD_MAX_EDGE = 2048
+DEFAULT_UPLOAD_FORMAT = "JPEG"
+DEFAULT_UPLOAD_QUALITY = 92
+
+# 메모리에 남겨둘 파일 인코딩 결과의 최대 개수
+DEFAULT_MAX_CACHED_FILES = 64
+
+
+def sniff_mime_type(data):
+    """이미지 바이트의 앞부분으로 MIME 형식을 추정합니다. 알 수 없으면 image/png로 봅니다."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/png"
+
+
+class EncodedImage:
+    """
+    인코딩된 이미지 바이트를 주 표현으로 들고 다니는 결과물입니다.
+    크기는 헤더만 읽어 알아내고, 픽셀(image)은 미리보기나 재인코딩처럼 실제로 필요할 때 한 번만 디코딩합니다.
+    spill()로 바이트를 임시 파일로 내보내면 메모리에서는 빠지고, data를 읽을 때마다 파일에서 다시 읽습니다.
+    """
+
+    def __init__(self, data, mime_type=None):
+        self._data = data
+        self.mime_type = mime_type or sniff_mime_type(data)
+        self._size = None
+        self._image = None
+        self._spill_path = None
+        self._lock = threading.Lock()
+
+    @property
+    def data(self):
+        data = self._data
+        if data is None:
+            with open(self._spill_path, 'rb') as f:
+                data = f.read()
+        return data
+
+    @property
+    def spilled(self):
+        return self._spill_path is not None
+
+    def resident_bytes(self):
+        """메모리에 올라와 있는 크기(인코딩된 바이트 + 디코딩된 픽셀)의 추정치입니다."""
+        total = len(self._data) if self._data is not None else 0
+        image = self._image
+        if image is not None:
+            total += image.width * image.height * len(image.getbands())
+        return total
+
+    def release_pixels(self):
+        """디코딩해둔 픽셀을 놓습니다. 다시 필요하면 바이트에서 새로 디코딩합니다."""
+        with self._lock:
+            self._image = None
+
+    def spill(self, spill_dir=None):
+        """바이트를 spill_dir(없으면 시스템 임시 폴더)의 임시 파일로 내보내고 메모리에서 놓습니다."""
+        with self._lock:
+            if self._spill_path is not None:
+                return
+            fd, path = tempfile.mkstemp(suffix=".spill", dir=spill_dir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self._data)
+            # 이 객체가 사라지거나 프로그램이 끝나면 임시 파일도 지웁니다.
+            weakref.finalize(self, _remove_spill_file, path)
+            self._spill_path = path
+            self._data = None
+            self._image = None
+
+    @property
+    def size(self):
+        if self._size is None:
+            if self._image is not None:
+                self._size = self._image.size
+            else:
+                with Image.open(io.BytesIO(self.data)) as header:
+                    self._size = header.size
+        return self._size
+
+    @property
+    def image(self):
+        """디코딩된 PIL 이미지입니다. 여러 스레드에서 동시에 불러도 디코딩은 한 번만 일어납니다."""
+        with self._lock:
+            if self._image is None:
+                image = Image.open(io.BytesIO(self.data))
+                image.load()
+                self._image = image
+            return self._image
+
+
+def _remove_spill_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class Payload:
+    """인코딩된 업로드용 이미지 바이트와 그 해시입니다. as_part()는 generate_content에 그대로 넣을 수 있습니다."""
+
+    __slots__ = ("data", "mime_type", "digest")
+
+    def __init__(self, data, mime_type):
+        self.data = data
+        self.mime_type = mime_type
+        self.digest = hashlib.sha256(data).hexdigest()
+
+    def as_part(self):
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+class PayloadCache:
+    """업로드 전처리 설정(최대 변 길이, 형식, 품질)과 파일 인코딩 결과 캐시를 함께 관리합니다."""
+
+    def __init__(self, max_edge=DEFAULT_UPLOAD_MAX_EDGE, image_format=DEFAULT_UPLOAD_FORMAT, quality=DEFAULT_UPLOAD_QUALITY,
+                 max_cached_files=DEFAULT_MAX_CACHED_FILES):
+        image_format = image_format.upper()
+        if image_format not in UPLOAD_FORMATS:
+            raise ValueError(f"지원하지 않는 업로드 형식입니다: {image_format} (가능한 값: {', '.join(UPLOAD_FORMATS)})")
+        self.max_edge = max_edge
+        self.image_format = image_format
+        self.quality = quality
+        self.max_cached_files = max_cached_files
+        self._lock = threading.Lock()
+        self._files = OrderedDict()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_edge=config.get("upload_max_edge", DEFAULT_UPLOAD_MAX_EDGE),
+            image_format=config.get("upload_format", DEFAULT_UPLOAD_FORMAT),
+            quality=config.get("upload_quality", DEFAULT_UPLOAD_QUALITY),
+        )
+
+    def encode(self, image):
+        """PIL 이미지를 최대 변 길이 이하로 줄이고 설정된 형식으로 인코딩합니다."""
+        if self.max_edge and max(image.size) > self.max_edge:
+            image = image.copy()
+            image.thumbnail((self.max_edge, self.max_edge), Image.Resampling.LANCZOS)
+
+        if self.image_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        buffer = io.BytesIO()
+        if self.image_format == "PNG":
+            image.save(buffer, format="PNG")
+        else:
+            image.save(buffer, format=self.image_format, quality=self.quality)
+        return Payload(buffer.getvalue(), UPLOAD_FORMATS[self.image_format])
+
+    def encoded_payload(self, encoded):
+        """
+        EncodedImage를 업로드용 Payload로 바꿉니다.
+        지원하는 형식이고 최대 변 길이 이하이면 원본 바이트를 그대로 쓰고, 아니면 디코딩해서 다시 인코딩합니다.
+        """
+        if encoded.mime_type in UPLOAD_FORMATS.values() and (not self.max_edge or max(encoded.size) <= self.max_edge):
+            return Payload(encoded.data, encoded.mime_type)
+        return self.encode(encoded.image)
+
+    def file_payload(self, path):
+        """파일을 전처리한 결과를 돌려줍니다. 경로, 수정 시각, 크기가 같으면 캐시된 결과를 씁니다."""
+        stat = os.stat(path)
+        identity = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            payload = self._files.get(identity)
+            if payload is not None:
+                self._files.move_to_end(identity)
+                return payload
+
+        # 원본이 클 때는 JPEG draft 모드로 필요한 크기에 가깝게만 디코딩합니다.
+        with Image.open(path) as image:
+            if self.max_edge:
+                image.draft("RGB", (self.max_edge, self.max_edge))
+            payload = self.encode(image)
+
+        with self._lock:
+            self._files[identity] = payload
+            while len(self._files) > self.max_cached_files:
+                self._files.popitem(last=False)
+        return payload
@@ -1,26 +1,57 @@
-import sys
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog, scrolledtext
-import google.generativeai as genai
-from PIL import Image, ImageTk
+from PIL import ImageTk
 import json
-import io
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import partial
 import threading
 import queue
-
-# API 키를 저장할 파일 이름
-API_KEY_FILE = "api_key.txt"
+import sqlite3
+import time
+from pipeline_graph import GLOBAL_INPUT, PREVIOUS_NODE, PipelineGraph, PipelineGraphError, new_node_id
+from result_cache import ResultCache
+from image_payload import PayloadCache
+from output_store import memory_limit_from_config
+from output_writer import writer_options_from_config
+from preview_cache import PreviewCache
+from model_client import get_model_client, load_config, warm_up
+from rate_limit import format_request_stats
+from run_trace import format_trace_summary
+from run_progress import start_metrics_exporter
+from run_budget import budget_from_config, plan_run
+from dataset_sweep import DEFAULT_MAX_PARALLEL_INPUTS, list_base_images, sweep_async
+from job_queue import QUEUE_FILE, JobQueue, format_jobs, make_job_spec
+from pipeline_engine import (
+    API_KEY_FILE, PipelineEngine, app_base_dir, changed_references, global_signature, load_system_prompt_file,
+    load_workflow_file, plan_incremental_reuse, save_workflow_file
+)
+
+# UI 큐를 한 번 처리할 때 쓸 수 있는 최대 시간(초)과, 큐가 비어 있을 때 다시 확인하기까지의 간격(ms)
+UI_QUEUE_BUDGET_SECONDS = 0.03
+UI_QUEUE_IDLE_MS = 100
+
+# 노드 편집기: 노드 행 하나의 높이와 행 사이 간격(픽셀), 이름 입력 후 입력 선택 검사까지의 지연(ms)
+NODE_ROW_HEIGHT = 330
+NODE_ROW_GAP = 10
+PARENT_REFRESH_DELAY_MS = 300
+
+# 실행 완료 창에 보여줄 느린 노드 수
+TRACE_SUMMARY_NODES = 5
+
+# 작업 대기열 상태 창에 보여줄 최근 작업 수
+JOB_STATUS_LIMIT = 15
+
+# 실행 중 진행 표시줄(완료/전체, 처리 속도, 남은 시간)을 다시 그리는 간격(ms)
+PROGRESS_REFRESH_MS = 1000
 
 class ImagePipelineApp:
 
 
     def clear_pipeline(self):
         """현재 파이프라인의 모든 노드를 GUI에서 제거하고 리스트를 비웁니다."""
-        for node in self.pipeline_nodes:
-            node["frame"].destroy()
         self.pipeline_nodes.clear()
+        self._layout_node_rows()
         self.update_status("파이프라인이 초기화되었습니다.")
 
     def save_workflow(self):
@@ -35,33 +66,9 @@ class ImagePipelineApp:
         )
         if not filepath: return
 
-        workflow_data = []
-        for node in self.pipeline_nodes:
-            # --- BUG FIX: 부모 노드(연결 정보)를 함께 저장합니다. ---
-            parent_selection = node["parent_var"].get()
-            # --- [EXE 빌드 수정] 이미지 경로를 상대 경로로 변환하여 저장 ---
-            relative_image_path = None
-            if node["node_image_path"]:
-                try:
-                    # BASE_DIR를 기준으로 상대 경로 계산
-                    relative_image_path = os.path.relpath(node["node_image_path"], self.BASE_DIR)
-                except ValueError:
-                    # 다른 드라이브에 있는 경우 등 상대 경로 계산이 불가능하면 절대 경로 유지
-                    relative_image_path = node["node_image_path"]
-
-            node_data = {
-                "name": node["name_entry"].get(),
-                "prompt": node["prompt_entry"].get(),
-                "image_path": relative_image_path, # 변환된 상대 경로 저장
-                "parent": parent_selection
-            }
-            # -------------------------------------------------------------
-            # ----------------------------------------------------
-            workflow_data.append(node_data)
-        
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(workflow_data, f, indent=2, ensure_ascii=False)
+            # --- [EXE 빌드 수정] 이미지 경로는 BASE_DIR 기준 상대 경로로 변환되어 저장됩니다 ---
+            save_workflow_file(filepath, self._collect_node_specs(), self.BASE_DIR)
 
             self.is_workflow_saved = True # [로드맵 5] 저장 성공 시 플래그 True
             # [로드맵 6] 현재 워크플로우 이름 업데이트
@@ -80,31 +87,22 @@ class ImagePipelineApp:
         if not filepath: return
         
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                workflow_data = json.load(f)
+            # --- [EXE 빌드 수정] 상대 경로는 BASE_DIR 기준 절대 경로로 변환되어 읽힙니다 ---
+            node_specs = load_workflow_file(filepath, self.BASE_DIR)
             
             self.clear_pipeline()
             
-            for node_data in workflow_data:
-                # --- [EXE 빌드 수정] 상대 경로를 다시 절대 경로로 변환하여 사용 ---
-                image_path = node_data.get("image_path", None)
-                if image_path and not os.path.isabs(image_path):
-                    # 경로가 상대 경로이면, BASE_DIR와 조합하여 절대 경로로 만듦
-                    image_path = os.path.join(self.BASE_DIR, image_path)
-                
-                parent_name = node_data.get("parent", "이전 노드")
-                self.add_pipeline_node(
-                    name=node_data.get("name", ""),
-                    prompt=node_data.get("prompt", ""),
-                    image_path=image_path, # 변환된 절대 경로 사용
-                    parent_name=parent_name
-                )
-                # -------------------------------------------------------------
+            # 노드는 한 번에 추가하고, 입력 선택 검사와 위젯 생성도 한 번만 합니다.
+            self.add_pipeline_nodes(node_specs)
             self.is_workflow_saved = True # [로드맵 5] 로드 성공 시 플래그 True
             # [로드맵 6] 현재 워크플로우 이름 업데이트
             self.current_workflow_name = os.path.splitext(os.path.basename(filepath))[0]
             
-            self.update_status(f"'{os.path.basename(filepath)}'에서 워크플로우를 불러왔습니다.")
+            status = f"'{os.path.basename(filepath)}'에서 워크플로우를 불러왔습니다."
+            changed = changed_references(node_specs)
+            if changed:
+                status += f" (저장 이후 참조 이미지가 바뀌거나 없어진 노드: {', '.join(changed)})"
+            self.update_status(status)
         except Exception as e:
             messagebox.showerror("불러오기 실패", f"워크플로우 로드 중 오류 발생: {e}")
 
@@ -114,16 +112,14 @@ class ImagePipelineApp:
         self.root.geometry("1200x800")
         
         # --- [EXE 빌드 수정] 프로그램의 절대 경로를 기준점으로 설정 ---
-        if getattr(sys, 'frozen', False):
-            # .exe로 실행될 경우
-            self.BASE_DIR = os.path.dirname(os.path.abspath(sys.executable))
-        else:
-            # .py 스크립트로 실행될 경우
-            self.BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+        self.BASE_DIR = app_base_dir()
         
         self.PROMPT_DIR = os.path.join(self.BASE_DIR, "prompts")
         self.WORKFLOW_DIR = os.path.join(self.BASE_DIR, "workflows")
         self.OUTPUT_DIR = os.path.join(self.BASE_DIR, "img")
+        self.CACHE_DIR = os.path.join(self.BASE_DIR, "cache")
+        # 모델 이름 등은 BASE_DIR의 config.json에서 읽습니다. (없으면 기본값)
+        self.config = load_config(self.BASE_DIR)
         # -----------------------------------------------------------
 
         # 변수 초기화
@@ -132,10 +128,24 @@ class ImagePipelineApp:
         self.system_prompt_data = {}
         self.pipeline_nodes = []
         self.node_outputs = {}
+        # --- [노드 편집기] 미뤄둔 입력 선택 검사와 행 배치 작업, 화면에 보이는 노드를 보여주는 행 위젯 ---
+        self._parent_refresh_job = None
+        self._layout_job = None
+        self._node_rows = []
+        # ----------------------------------------------------------
+        # --- [증분 실행] 마지막으로 성공한 실행의 노드별 설정 서명 ---
+        self.last_run_signatures = {}
+        self.last_run_global_signature = None
+        # ------------------------------------------------------
         self.api_key = self.load_api_key()
 
         # --- [스레딩] GUI 업데이트를 위한 큐 생성 ---
         self.ui_queue = queue.Queue()
+        # --- [미리보기] 썸네일은 작업자 스레드에서 만들고, 완성된 작은 이미지만 메인 스레드로 넘깁니다 ---
+        self.preview_cache = PreviewCache()
+        self.preview_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="preview")
+        self._preview_tokens = {}
+        # ---------------------------------------------------------------------------------------
         # ----------------------------------------
 
         # --- [로드맵 5] 워크플로우 저장 상태 플래그 ---
@@ -152,41 +162,87 @@ class ImagePipelineApp:
         os.makedirs(self.OUTPUT_DIR, exist_ok=True)
         # ---------------------------------------------
 
+        # --- [결과 캐시] 입력이 같은 노드는 API를 다시 호출하지 않도록 디스크 캐시를 사용 ---
+        self.result_cache = ResultCache(self.CACHE_DIR)
+        # 업로드 이미지 전처리 결과도 실행 사이에 재사용합니다.
+        self.payload_cache = PayloadCache.from_config(self.config)
+        # ---------------------------------------------------------------------------
+
+        # --- [작업 대기열] 처음 쓸 때 BASE_DIR의 jobs.sqlite3를 엽니다 ---
+        self.job_queue = None
+        # ------------------------------------------------------------
+
+        # --- [진행 상황] 실행 중인 엔진의 진행 상황과 지표 파일 내보내기 ---
+        self.active_progress = None
+        self.metrics_exporter = None
+        self._progress_job = None
+        # 전체 실행, 폴더 실행, 개별 노드 실행 중 하나라도 진행 중이면 True입니다.
+        self.run_active = False
+        # ------------------------------------------------------------
+
         self.setup_ui()
 
         if not self.api_key:
             self.request_api_key()
 
-        # --- [스레딩] 100ms마다 큐를 확인하는 루프 시작 ---
-        self.root.after(100, self.process_ui_queue)
+        # --- [스레딩] UI 큐를 확인하는 루프 시작 ---
+        self.root.after(UI_QUEUE_IDLE_MS, self.process_ui_queue)
         # ---------------------------------------------
 
+        # --- [빠른 시작] 창이 뜬 뒤 백그라운드에서 SDK를 불러오고 모델 클라이언트를 미리 만들어 둡니다 ---
+        self.root.after_idle(lambda: warm_up(self.api_key, self.config))
+        # -------------------------------------------------------------------------------------
+
     def process_ui_queue(self):
-        """UI 큐를 주기적으로 확인하여 GUI 업데이트 작업을 처리합니다."""
+        """
+        UI 큐에 쌓인 메시지를 시간 예산(UI_QUEUE_BUDGET_SECONDS) 안에서 한꺼번에 처리합니다.
+        상태 메시지는 마지막 것만, 같은 라벨의 이미지 표시는 마지막 요청만 반영합니다.
+        처리하지 못한 메시지가 남아 있으면 바로 다시 실행되고, 비어 있으면 UI_QUEUE_IDLE_MS 뒤에 다시 확인합니다.
+        """
+        deadline = time.monotonic() + UI_QUEUE_BUDGET_SECONDS
+        latest_status = None
+        pending_images = {}
         try:
-            # 큐에서 메시지를 논블로킹으로 가져옴
-            message = self.ui_queue.get_nowait()
-            
-            # 메시지 포맷: (명령, 데이터)
-            command, data = message
-            
-            if command == "update_status":
-                self.update_status(data)
-            elif command == "display_image":
-                # 데이터: (결과 이미지, 대상 노드 정보)
-                image, target_node = data
-                self.display_image(image, target_node["result_image_label"])
-            elif command == "show_info":
-                messagebox.showinfo("완료", data)
-            elif command == "show_error":
-                messagebox.showerror("오류", data)
-
-        except queue.Empty:
-            # 큐가 비어있으면 아무것도 하지 않음
-            pass
+            while time.monotonic() < deadline:
+                try:
+                    # 메시지 포맷: (명령, 데이터)
+                    command, data = self.ui_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if command == "update_status":
+                    latest_status = data
+                elif command == "display_image":
+                    # 데이터: (결과 이미지, 대상 노드 정보)
+                    image, target_node = data
+                    pending_images[id(target_node)] = (target_node, image)
+                elif command == "show_preview":
+                    # 데이터: (썸네일 작업 Future, 대상 라벨, 요청 토큰)
+                    self.show_preview(*data)
+                elif command in ("show_info", "show_error", "ask_yes_no"):
+                    # 대화 상자가 뜨는 동안 화면이 멈추므로, 그 전까지의 상태를 먼저 반영합니다.
+                    if latest_status is not None:
+                        self.update_status(latest_status)
+                        latest_status = None
+                    if command == "show_info":
+                        messagebox.showinfo("완료", data)
+                    elif command == "show_error":
+                        messagebox.showerror("오류", data)
+                    else:
+                        # 데이터: (제목, 질문, 작업자 스레드가 답을 기다리는 Future)
+                        title, question, answer = data
+                        try:
+                            answer.set_result(messagebox.askyesno(title, question))
+                        finally:
+                            if not answer.done():
+                                answer.set_result(False)
         finally:
-            # 100ms 후에 다시 이 함수를 호출
-            self.root.after(100, self.process_ui_queue)
+            for target_node, image in pending_images.values():
+                self.show_node_result(target_node, image)
+            if latest_status is not None:
+                self.update_status(latest_status)
+            delay = 1 if not self.ui_queue.empty() else UI_QUEUE_IDLE_MS
+            self.root.after(delay, self.process_ui_queue)
 
     def start_pipeline_thread(self):
         """파이프라인 실행을 위한 작업자 스레드를 생성하고 시작합니다."""
@@ -203,11 +259,212 @@ class ImagePipelineApp:
             return
         # -----------------------------------------------------------------
 
-        self.execute_btn.config(state="disabled", text="실행 중...")
+        # --- [병렬 실행] 위젯 상태를 메인 스레드에서 읽어 의존성 그래프를 미리 검증합니다 ---
+        node_specs = self._collect_node_specs()
+        try:
+            graph = PipelineGraph(node_specs)
+        except PipelineGraphError as e:
+            messagebox.showerror("파이프라인 오류", f"실행 전에 파이프라인 연결 오류가 발견되었습니다:\n{e}")
+            return
+
+        iterations = self._spinbox_value(self.batch_spinbox)
+        parallel_batches = self._spinbox_value(self.parallel_batch_spinbox)
+        use_cache = not self.bypass_cache_var.get()
+        # -----------------------------------------------------------------
+
+        # --- [증분 실행] 마지막 실행 이후 바뀐 노드와 그 하위 노드만 다시 실행합니다 ---
+        node_signatures = {graph.ids[i]: graph.node_signature(i) for i in range(len(graph))}
+        current_global_signature = global_signature(self.base_image_path, self.system_prompt_data)
+        reuse = {}
+        # 이전 결과물은 마지막 실행의 마지막 배치 것 하나뿐이므로, 배치가 여러 개이면 모든 노드를 다시 실행합니다.
+        if self.incremental_var.get() and iterations > 1:
+            self.update_status("배치가 여러 개이면 증분 실행을 쓰지 않고 모든 노드를 다시 실행합니다.")
+        elif self.incremental_var.get() and current_global_signature == self.last_run_global_signature:
+            reuse = plan_incremental_reuse(graph, node_signatures, self.last_run_signatures, self.node_outputs)
+            if len(reuse) == len(graph):
+                messagebox.showinfo("변경 없음", "마지막 실행 이후 변경된 노드가 없습니다.")
+                return
+            self.update_status(f"변경된 노드 {len(graph) - len(reuse)}개만 다시 실행합니다.")
+        run_signature = (current_global_signature, node_signatures)
+        # ---------------------------------------------------------------------------
+
+        # --- [헤드리스 엔진] 실행에 필요한 값은 모두 메인 스레드에서 엔진에 넘겨둡니다 ---
+        nodes = list(self.pipeline_nodes)
+        engine = self._create_engine(on_event=partial(self._on_engine_event, nodes))
+        run_options = dict(
+            base_image_path=self.base_image_path, workflow_name=self.current_workflow_name,
+            iterations=iterations, parallel_batches=parallel_batches, use_cache=use_cache, reuse=reuse,
+            resume=self.resume_var.get()
+        )
+        # ---------------------------------------------------------------------------
+
+        # --- [예산] config.json의 실행당 예산을 적용합니다 (예상 호출 수 확인은 작업자 스레드에서 합니다) ---
+        budget = budget_from_config(self.config)
+        run_options["budget"] = budget if budget.limited else None
+        self.update_status("실행 계획을 세우는 중...")
+        # ---------------------------------------------------------------------------
+
+        self._set_run_buttons_running(True)
+        self._watch_progress(engine)
         
-        thread = threading.Thread(target=self.execute_pipeline, daemon=True)
+        thread = threading.Thread(target=self.execute_pipeline, args=(engine, graph, run_options, run_signature), daemon=True)
         thread.start()
 
+    def start_sweep_thread(self):
+        """
+        [데이터셋 스윕] 폴더를 골라 그 안의 모든 이미지를 기본 이미지로 삼아 워크플로우를 실행합니다.
+        결과물은 '<출력 폴더>/<워크플로우 이름>/<입력 파일 이름>/'에 저장되고, 이미 처리된 입력은 건너뜁니다.
+        """
+        if not all([self.system_prompt_data, self.pipeline_nodes, self.api_key]):
+            messagebox.showwarning("준비 부족", "시스템 프롬프트, API키, 그리고 하나 이상의 노드가 필요합니다.")
+            return
+        try:
+            graph = PipelineGraph(self._collect_node_specs())
+        except PipelineGraphError as e:
+            messagebox.showerror("파이프라인 오류", f"실행 전에 파이프라인 연결 오류가 발견되었습니다:\n{e}")
+            return
+
+        source_dir = filedialog.askdirectory(title="기본 이미지 폴더 선택")
+        if not source_dir: return
+        paths = list_base_images(source_dir)
+        if not paths:
+            messagebox.showwarning("이미지 없음", "선택한 폴더에 처리할 이미지가 없습니다.")
+            return
+        if not messagebox.askyesno("폴더 일괄 실행", f"이미지 {len(paths)}개에 워크플로우 '{self.current_workflow_name}'을(를) 실행합니다.\n"
+                                                  "이미 처리된 이미지는 건너뜁니다. 계속하시겠습니까?"):
+            return
+
+        nodes = list(self.pipeline_nodes)
+        engine = self._create_engine(on_event=partial(self._on_engine_event, nodes))
+        sweep_options = dict(
+            iterations=self._spinbox_value(self.batch_spinbox), parallel_batches=self._spinbox_value(self.parallel_batch_spinbox),
+            max_parallel_inputs=DEFAULT_MAX_PARALLEL_INPUTS, use_cache=not self.bypass_cache_var.get()
+        )
+        self._set_run_buttons_running(True)
+        self._watch_progress(engine)
+
+        thread = threading.Thread(target=self.execute_sweep, args=(engine, graph, paths, sweep_options), daemon=True)
+        thread.start()
+
+    def _get_job_queue(self):
+        if self.job_queue is None:
+            self.job_queue = JobQueue(os.path.join(self.BASE_DIR, QUEUE_FILE))
+        return self.job_queue
+
+    def submit_job(self):
+        """[작업 대기열] 현재 노드 설정, 기본 이미지, 시스템 프롬프트, 반복 설정을 작업 하나로 대기열에 넣습니다."""
+        if not all([self.base_image_path, self.system_prompt_data, self.pipeline_nodes]):
+            messagebox.showwarning("준비 부족", "기본 이미지, 시스템 프롬프트, 그리고 하나 이상의 노드가 필요합니다.")
+            return
+        priority = simpledialog.askinteger("작업 우선순위", "우선순위를 입력하세요. (클수록 먼저 실행됩니다)", initialvalue=0)
+        if priority is None: return
+        try:
+            spec = make_job_spec(self.current_workflow_name, self._collect_node_specs(), self.system_prompt_data, self.OUTPUT_DIR,
+                                 base_image=self.base_image_path, batches=self._spinbox_value(self.batch_spinbox),
+                                 parallel_batches=self._spinbox_value(self.parallel_batch_spinbox),
+                                 use_cache=not self.bypass_cache_var.get())
+            job_id = self._get_job_queue().submit(spec, priority)
+        except (PipelineGraphError, ValueError, OSError, sqlite3.Error) as e:
+            messagebox.showerror("작업 추가 실패", f"작업을 대기열에 넣지 못했습니다:\n{e}")
+            return
+        self.update_status(f"작업 #{job_id} '{self.current_workflow_name}'을(를) 대기열에 넣었습니다. (우선순위 {priority})")
+
+    def show_job_status(self):
+        """[작업 대기열] 최근 작업의 상태를 보여줍니다."""
+        try:
+            lines = format_jobs(self._get_job_queue().list_jobs(JOB_STATUS_LIMIT))
+        except (OSError, sqlite3.Error) as e:
+            messagebox.showerror("오류", f"작업 대기열을 읽을 수 없습니다:\n{e}")
+            return
+        text = "\n".join(lines) if lines else "대기열이 비어 있습니다."
+        messagebox.showinfo("작업 대기열", text + "\n\n대기 중인 작업은 'python -m job_queue worker'가 실행합니다.")
+
+    def _spinbox_value(self, spinbox):
+        """(메인 스레드 전용) 스핀박스의 값을 1 이상의 정수로 읽습니다. 숫자가 아니면 1입니다."""
+        try:
+            return max(1, int(spinbox.get()))
+        except ValueError:
+            return 1
+
+    def _set_run_buttons_running(self, running):
+        """실행 중에는 전체 실행, 폴더 실행, 노드별 실행 버튼을 모두 막습니다."""
+        self.run_active = running
+        if running:
+            self.execute_btn.config(state="disabled", text="실행 중...")
+            self.sweep_btn.config(state="disabled")
+        else:
+            self.execute_btn.config(state="normal", text="전체 파이프라인 실행")
+            self.sweep_btn.config(state="normal")
+        for row in self._node_rows:
+            row["run_node_btn"].config(state="disabled" if running else "normal")
+
+    def _watch_progress(self, engine):
+        """(메인 스레드) 실행이 끝날 때까지 engine의 진행 상황을 주기적으로 표시하고, 설정되어 있으면 지표 파일로 내보냅니다."""
+        self.active_progress = engine.progress
+        metrics_file = self.config["metrics_file"]
+        if metrics_file:
+            try:
+                self.metrics_exporter = start_metrics_exporter(
+                    os.path.join(self.BASE_DIR, metrics_file), engine.progress, engine.client,
+                    {"workflow": self.current_workflow_name}, self.config["metrics_interval_seconds"])
+            except OSError as e:
+                self.update_status(f"진행 지표 파일을 만들 수 없습니다: {e}")
+        self._refresh_progress()
+
+    def _refresh_progress(self):
+        if self._progress_job is not None:
+            self.root.after_cancel(self._progress_job)
+            self._progress_job = None
+        if self.active_progress is None:
+            return
+        self.progress_label.config(text=self.active_progress.describe())
+        self._progress_job = self.root.after(PROGRESS_REFRESH_MS, self._refresh_progress)
+
+    def _finish_run(self):
+        """(메인 스레드) 실행이 끝나면 진행 상황을 마지막으로 한 번 표시하고 실행 버튼을 다시 켭니다."""
+        if self.active_progress is not None:
+            self.progress_label.config(text=self.active_progress.describe())
+            self.active_progress = None
+        self._refresh_progress()
+        self._set_run_buttons_running(False)
+
+    def _close_metrics_exporter(self):
+        """(작업자 스레드) 지표 파일에 마지막 값을 쓰고 내보내기를 멈춥니다."""
+        exporter, self.metrics_exporter = self.metrics_exporter, None
+        if exporter is not None:
+            exporter.close()
+
+    def _create_engine(self, on_event=None):
+        """현재 전역 설정으로 파이프라인 엔진을 만듭니다. 모델 클라이언트는 실행마다 새로 만들지 않고 재사용합니다."""
+        client = get_model_client(self.api_key, self.config)
+        return PipelineEngine(client, self.system_prompt_data, self.OUTPUT_DIR, result_cache=self.result_cache, on_event=on_event,
+                              payloads=self.payload_cache, writer_options=writer_options_from_config(self.config),
+                              output_memory_limit=memory_limit_from_config(self.config),
+                              trace=self.config["trace_runs"], chrome_trace=self.config["chrome_trace"],
+                              deterministic=self.config["deterministic_requests"])
+
+    def _on_engine_event(self, nodes, command, data):
+        """(작업자 스레드에서 호출됨) 엔진의 진행 이벤트를 UI 큐 메시지로 바꿉니다."""
+        if command == "update_status":
+            self.ui_queue.put(("update_status", data))
+        elif command == "node_finished":
+            batch_index, node_index, image, path = data
+            self.ui_queue.put(("display_image", (image, nodes[node_index])))
+
+    def _collect_node_specs(self):
+        """(메인 스레드 전용) 각 노드의 현재 값을 워크플로우 형식의 dict 리스트로 읽어옵니다."""
+        return [
+            {
+                "name": node["name"],
+                "prompt": node["prompt"],
+                "image_path": node["node_image_path"],
+                "parent": node["parent"],
+                "id": node["id"],
+                "parent_id": node["parent_id"]
+            }
+            for node in self.pipeline_nodes
+        ]
+
     def _mark_dirty(self, event=None):
         """워크플로우가 수정되었음을 표시하는 'dirty flag'를 설정합니다."""
         if self.is_workflow_saved: # 상태가 변경될 때만 메시지 업데이트
@@ -252,6 +509,15 @@ class ImagePipelineApp:
         btn_load.pack(side=tk.RIGHT, expand=True, fill=tk.X, padx=(5, 0))
         # ------------------------------------------------
 
+        # --- [작업 대기열] 현재 설정을 작업으로 넣어두면 작업자(python -m job_queue worker)가 차례로 실행합니다 ---
+        job_frame = tk.Frame(global_frame)
+        job_frame.pack(fill=tk.X, pady=(0, 10))
+        btn_submit_job = tk.Button(job_frame, text="작업 대기열에 추가", command=self.submit_job)
+        btn_submit_job.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(0, 5))
+        btn_job_status = tk.Button(job_frame, text="대기열 상태", command=self.show_job_status)
+        btn_job_status.pack(side=tk.RIGHT, expand=True, fill=tk.X, padx=(5, 0))
+        # ---------------------------------------------------------------------------------------
+
         btn_img = tk.Button(global_frame, text="1. 기본 이미지 선택 (캐릭터 등)", command=self.select_base_image)
         btn_img.pack(fill=tk.X, pady=5)
         self.base_image_preview = tk.Label(global_frame, text="기본 이미지 미리보기", relief=tk.RIDGE)
@@ -268,13 +534,18 @@ class ImagePipelineApp:
         btn_add_node = tk.Button(pipeline_container, text="+ 파이프라인 노드 추가", command=self.add_pipeline_node, bg="green", fg="white")
         btn_add_node.pack(fill=tk.X, pady=5)
         
-        canvas = tk.Canvas(pipeline_container)
+        # 스크롤 영역은 노드 수 x 행 높이이고, 보이는 노드만 재사용하는 행 위젯으로 그립니다.
+        canvas = tk.Canvas(pipeline_container, yscrollincrement=NODE_ROW_HEIGHT // 10)
         scrollbar = tk.Scrollbar(pipeline_container, orient="vertical", command=canvas.yview)
-        self.pipeline_frame = tk.Frame(canvas)
+        self.pipeline_canvas = canvas
+
+        def on_canvas_scroll(first, last):
+            scrollbar.set(first, last)
+            # 스크롤로 새로 보이게 된 노드를 행에 연결합니다.
+            self._schedule_row_layout()
 
-        self.pipeline_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-        canvas.create_window((0, 0), window=self.pipeline_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
+        canvas.bind("<Configure>", lambda e: self._schedule_row_layout())
+        canvas.configure(yscrollcommand=on_canvas_scroll)
         canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
         
@@ -289,48 +560,111 @@ class ImagePipelineApp:
         self.execute_btn.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
         # ----------------------------------------------------
 
+        # --- [데이터셋 스윕] 폴더의 모든 이미지를 기본 이미지로 삼아 같은 워크플로우를 실행합니다 ---
+        self.sweep_btn = tk.Button(run_frame, text="폴더 일괄 실행", command=self.start_sweep_thread, height=2)
+        self.sweep_btn.pack(side=tk.LEFT, padx=(5, 0), fill=tk.Y)
+
         batch_label = tk.Label(run_frame, text="반복:")
         batch_label.pack(side=tk.LEFT, padx=(10, 2))
         self.batch_spinbox = tk.Spinbox(run_frame, from_=1, to=100, width=5, font=("Helvetica", 12))
         self.batch_spinbox.pack(side=tk.LEFT, fill=tk.Y, expand=True)
+
+        # --- [배치 병렬] 동시에 실행할 최대 배치 수 (1이면 기존처럼 순차 실행) ---
+        parallel_label = tk.Label(run_frame, text="동시 배치:")
+        parallel_label.pack(side=tk.LEFT, padx=(10, 2))
+        self.parallel_batch_spinbox = tk.Spinbox(run_frame, from_=1, to=16, width=4, font=("Helvetica", 12))
+        self.parallel_batch_spinbox.pack(side=tk.LEFT, fill=tk.Y, expand=True)
+
+        # --- [결과 캐시] 체크하면 캐시를 무시하고 모든 노드를 새로 생성합니다 ---
+        self.bypass_cache_var = tk.BooleanVar(self.root, value=False)
+        bypass_cache_check = tk.Checkbutton(run_frame, text="캐시 무시 (강제 재생성)", variable=self.bypass_cache_var)
+        bypass_cache_check.pack(side=tk.LEFT, padx=(10, 0))
+
+        # --- [증분 실행] 체크하면 마지막 실행 이후 바뀐 노드와 그 하위 노드만 실행합니다 ---
+        self.incremental_var = tk.BooleanVar(self.root, value=False)
+        incremental_check = tk.Checkbutton(run_frame, text="변경된 노드만 실행", variable=self.incremental_var)
+        incremental_check.pack(side=tk.LEFT, padx=(10, 0))
+
+        # --- [이어하기] 체크하면 같은 설정으로 중단된 실행의 매니페스트를 읽어 끝난 배치/노드를 건너뜁니다 ---
+        self.resume_var = tk.BooleanVar(self.root, value=False)
+        resume_check = tk.Checkbutton(run_frame, text="중단된 실행 이어하기", variable=self.resume_var)
+        resume_check.pack(side=tk.LEFT, padx=(10, 0))
         # -----------------------------------------------------------
         self.status_label = tk.Label(bottom_frame, text="준비 완료", bd=1, relief=tk.SUNKEN, anchor=tk.W)
         self.status_label.pack(side=tk.BOTTOM, fill=tk.X)
+        # --- [진행 상황] 완료/전체, 실행 중/대기, 분당 처리량, 남은 시간 ---
+        self.progress_label = tk.Label(bottom_frame, text="", bd=1, relief=tk.SUNKEN, anchor=tk.W)
+        self.progress_label.pack(side=tk.BOTTOM, fill=tk.X)
 
     def add_pipeline_node(self, name="", prompt="", image_path=None, parent_name="previous"):
+        """파이프라인 끝에 새 노드를 하나 추가합니다."""
+        node_index = len(self.pipeline_nodes)
+        self._create_node(name, prompt, image_path, parent_name)
+        self._schedule_parent_refresh()
+        # 새 노드가 보이도록 맨 아래로 스크롤합니다.
+        self._layout_node_rows()
+        self.pipeline_canvas.yview_moveto(1.0)
+
+        if not name:
+            self.update_status(f"노드 #{node_index + 1} 추가됨.")
+            self._mark_dirty()
+
+    def add_pipeline_nodes(self, node_specs):
+        """
+        (워크플로우 불러오기) 노드 spec 리스트의 노드를 한 번에 추가합니다.
+        노드 ID와 ID로 지정된 부모 연결을 그대로 유지합니다.
         """
-        파이프라인에 새 노드를 추가합니다.
-        '부모 노드'를 지정할 수 있는 드롭다운 메뉴를 포함합니다.
+        for spec in node_specs:
+            self._create_node(spec["name"], spec["prompt"], spec["image_path"], spec["parent"], spec.get("id"), spec.get("parent_id"))
+        self._schedule_parent_refresh()
+        self._schedule_row_layout()
+
+    def _create_node(self, name, prompt, image_path, parent_name, node_id=None, parent_id=None):
+        """
+        노드 하나의 값을 만듭니다. 노드는 위젯 없이 값(이름, 프롬프트, 입력, 참조 이미지, 마지막 결과물)만 들고 있고,
+        화면에 보이는 노드만 _layout_node_rows가 재사용하는 행 위젯에 연결해 보여줍니다.
+        입력은 parent_id(부모 노드의 ID)가 기준이고, parent는 드롭다운에 보여줄 이름입니다.
         """
         node_index = len(self.pipeline_nodes)
-        node_frame = tk.LabelFrame(self.pipeline_frame, text=f"Node Index #{node_index + 1}", padx=10, pady=10)
-        node_frame.pack(fill=tk.X, pady=5, padx=5)
+        if parent_name == "previous": parent = PREVIOUS_NODE
+        elif parent_name == "global": parent = GLOBAL_INPUT
+        else: parent = parent_name
+
+        node_info = {
+            "name": name if name else f"노드_{node_index + 1}", "prompt": prompt, "parent": parent,
+            "node_image_path": image_path, "result": None, "id": node_id or new_node_id(), "parent_id": parent_id
+        }
+        self.pipeline_nodes.append(node_info)
+        return node_info
+
+    def _build_node_row(self):
+        """노드 하나를 보여줄 행 위젯을 만듭니다. 행은 스크롤할 때 다른 노드에 다시 연결해 재사용합니다."""
+        node_frame = tk.LabelFrame(self.pipeline_canvas, padx=10, pady=10)
+        row = {"frame": node_frame, "node": None, "index": None, "loading": False,
+               "name_var": tk.StringVar(self.root), "prompt_var": tk.StringVar(self.root), "parent_var": tk.StringVar(self.root)}
 
         top_pane = tk.Frame(node_frame)
         top_pane.pack(fill=tk.X, pady=(0, 5))
-        
+
         parent_label = tk.Label(top_pane, text="입력:")
         parent_label.pack(side=tk.LEFT, padx=(0, 5))
-        parent_var = tk.StringVar(self.root)
-        # OptionMenu는 나중에 update_all_parent_dropdowns에서 채워지므로 초기값만 설정
-        parent_dropdown = tk.OptionMenu(top_pane, parent_var, "이전 노드")
+        # 메뉴 항목은 드롭다운을 열 때마다 _rebuild_parent_menu가 최신 노드 이름으로 채웁니다.
+        parent_dropdown = tk.OptionMenu(top_pane, row["parent_var"], PREVIOUS_NODE)
+        parent_dropdown["menu"].configure(postcommand=partial(self._rebuild_parent_menu, row))
         parent_dropdown.pack(side=tk.LEFT, padx=(0, 10))
-        
+
         name_label = tk.Label(top_pane, text="노드 이름:")
         name_label.pack(side=tk.LEFT, padx=(10, 5))
-        name_entry = tk.Entry(top_pane)
+        name_entry = tk.Entry(top_pane, textvariable=row["name_var"])
         name_entry.pack(fill=tk.X, expand=True)
-        default_name = name if name else f"노드_{node_index + 1}"
-        name_entry.insert(0, default_name)
-        name_entry.bind("<KeyRelease>", self.update_all_parent_dropdowns)
+        name_entry.bind("<KeyRelease>", self._schedule_parent_refresh)
 
         # --- [로드맵 4] 개별 노드 실행 버튼 추가 ---
-        # node_info를 미리 정의해야 lambda에서 참조 가능
-        node_info = {} 
-        run_node_btn = tk.Button(top_pane, text="▶ 실행", command=lambda: self.execute_single_node(node_info), fg="blue", font=("Helvetica", 8))
+        run_node_btn = tk.Button(top_pane, text="▶ 실행", command=lambda: self.execute_single_node(row["node"]), fg="blue", font=("Helvetica", 8),
+                                 state="disabled" if self.run_active else "normal")
         run_node_btn.pack(side=tk.RIGHT, padx=(5,0))
         # -----------------------------------------
-        
+
         content_frame = tk.Frame(node_frame)
         content_frame.pack(fill=tk.BOTH, expand=True)
         left_pane = tk.Frame(content_frame)
@@ -338,78 +672,168 @@ class ImagePipelineApp:
         right_pane = tk.Frame(content_frame)
         right_pane.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
 
-        # --- BUG FIX: node_info 딕셔너리를 모든 위젯이 생성된 후에 만듭니다. ---
-        node_info = {
-            "frame": node_frame, "name_entry": name_entry, "parent_var": parent_var,
-            "parent_dropdown": parent_dropdown, "node_image_path": image_path
-        }
-
-        node_image_btn = tk.Button(left_pane, text="노드 참조 이미지 불러오기 (포즈 등)", command=lambda: self.select_node_image(node_info))
+        node_image_btn = tk.Button(left_pane, text="노드 참조 이미지 불러오기 (포즈 등)", command=lambda: self.select_node_image(row["node"]))
         node_image_btn.pack(fill=tk.X)
         node_image_preview = tk.Label(left_pane, text="참조 이미지 없음", bg="gray95", relief=tk.SUNKEN)
         node_image_preview.pack(fill=tk.X, pady=5)
-        if image_path and os.path.exists(image_path):
-            self.display_image(image_path, node_image_preview)
 
         prompt_label = tk.Label(left_pane, text="보조 프롬프트:")
         prompt_label.pack(anchor=tk.W, pady=(10, 0))
-        prompt_entry = tk.Entry(left_pane)
+        prompt_entry = tk.Entry(left_pane, textvariable=row["prompt_var"])
         prompt_entry.pack(fill=tk.X, pady=2)
-        prompt_entry.insert(0, prompt)
         prompt_entry.bind("<KeyRelease>", self._mark_dirty)
-        
+
         result_image_label = tk.Label(right_pane, text="결과 미리보기", bg="gray90")
         result_image_label.pack(fill=tk.BOTH, expand=True)
 
-        remove_btn = tk.Button(node_frame, text="X", fg="red", command=lambda: self.remove_node(node_frame))
+        remove_btn = tk.Button(node_frame, text="X", fg="red", command=lambda: self.remove_node(row["node"]))
         remove_btn.place(relx=1.0, rely=0, anchor='ne')
 
-        # node_info 딕셔너리에 나머지 위젯 정보를 추가합니다.
-        node_info.update({
-            "frame": node_frame, "name_entry": name_entry, "parent_var": parent_var,
-            "parent_dropdown": parent_dropdown, "node_image_path": image_path,
-            "prompt_entry": prompt_entry, "result_image_label": result_image_label,
-            "node_image_preview": node_image_preview
+        row.update({
+            "window": self.pipeline_canvas.create_window(0, 0, window=node_frame, anchor="nw", state="hidden"),
+            "parent_dropdown": parent_dropdown, "result_image_label": result_image_label,
+            "node_image_preview": node_image_preview, "run_node_btn": run_node_btn
         })
-        # -------------------------------------------------------------------
+        # 입력한 이름과 프롬프트는 바로 연결된 노드의 값에 씁니다. (노드를 연결하는 중에 바뀐 값은 쓰지 않습니다)
+        row["name_var"].trace_add("write", partial(self._store_row_value, row, "name"))
+        row["prompt_var"].trace_add("write", partial(self._store_row_value, row, "prompt"))
+        return row
+
+    def _store_row_value(self, row, key, *trace_args):
+        if row["node"] is not None and not row["loading"]:
+            row["node"][key] = row[f"{key}_var"].get()
+
+    def _bind_node_row(self, row, node, index):
+        """행을 index번째 노드에 연결합니다. 이미 같은 노드를 보여주고 있으면 바뀐 값만 다시 씁니다."""
+        rebind = row["node"] is not node
+        row["node"], row["index"] = node, index
+        row["loading"] = True
+        try:
+            for key in ("name", "prompt", "parent"):
+                # 같은 값을 다시 쓰면 입력 중인 커서 위치가 바뀌므로 다를 때만 씁니다.
+                if row[f"{key}_var"].get() != node[key]:
+                    row[f"{key}_var"].set(node[key])
+        finally:
+            row["loading"] = False
+        row["frame"].config(text=f"노드 #{index + 1}")
+        if not rebind:
+            return
+        # 다른 노드의 미리보기가 늦게 도착해도 표시되지 않도록 먼저 라벨을 비웁니다.
+        for label, source, empty_text in ((row["node_image_preview"], node["node_image_path"], "참조 이미지 없음"),
+                                          (row["result_image_label"], node["result"], "결과 미리보기")):
+            self._preview_tokens.pop(label, None)
+            label.config(image="", text=empty_text)
+            label.image = None
+            if source is not None and (not isinstance(source, str) or os.path.exists(source)):
+                self.display_image(source, label)
+
+    def _row_for(self, node_info):
+        """node_info를 보여주고 있는 행입니다. 화면 밖의 노드이면 None입니다."""
+        for row in self._node_rows:
+            if row["node"] is node_info:
+                return row
+        return None
 
-        self.pipeline_nodes.append(node_info)
-        
-        # parent_var의 값을 설정하고 모든 드롭다운을 업데이트합니다.
-        if parent_name == "previous": parent_var.set("이전 노드")
-        elif parent_name == "global": parent_var.set("전역 기본 이미지")
-        else: parent_var.set(parent_name)
-        self.update_all_parent_dropdowns()
-        
-        if not name:
-            self.update_status(f"노드 #{node_index + 1} 추가됨.")
+    def _schedule_row_layout(self):
+        if self._layout_job is None:
+            self._layout_job = self.root.after_idle(self._layout_node_rows)
+
+    def _layout_node_rows(self):
+        """
+        스크롤 위치에서 보이는 노드만 행 위젯에 연결해 배치합니다. 노드가 몇 개이든 행 위젯은 화면을 채울 만큼만 만들고,
+        index번째 노드는 항상 (index % 행 수)번째 행이 보여주므로 조금 스크롤해도 이미 보이던 행은 다시 연결하지 않습니다.
+        """
+        self._layout_job = None
+        canvas = self.pipeline_canvas
+        width = canvas.winfo_width()
+        count = len(self.pipeline_nodes)
+        canvas.configure(scrollregion=(0, 0, width, count * NODE_ROW_HEIGHT))
+        first = min(max(0, int(canvas.canvasy(0)) // NODE_ROW_HEIGHT), max(0, count - 1))
+        visible = min(count - first, canvas.winfo_height() // NODE_ROW_HEIGHT + 2)
+        while len(self._node_rows) < visible:
+            self._node_rows.append(self._build_node_row())
+
+        shown = set()
+        for index in range(first, first + visible):
+            row = self._node_rows[index % len(self._node_rows)]
+            shown.add(id(row))
+            self._bind_node_row(row, self.pipeline_nodes[index], index)
+            canvas.coords(row["window"], 0, index * NODE_ROW_HEIGHT)
+            canvas.itemconfigure(row["window"], width=width, height=NODE_ROW_HEIGHT - NODE_ROW_GAP, state="normal")
+        for row in self._node_rows:
+            if id(row) not in shown:
+                row["node"] = row["index"] = None
+                canvas.itemconfigure(row["window"], state="hidden")
+
+    def show_node_result(self, node_info, image):
+        """노드의 결과 미리보기를 기록하고, 노드가 화면에 보이고 있으면 표시합니다."""
+        node_info["result"] = image
+        row = self._row_for(node_info)
+        if row is not None:
+            self.display_image(image, row["result_image_label"])
+
+    def _rebuild_parent_menu(self, row):
+        """(드롭다운을 열 때 호출됨) 행에 연결된 노드의 입력 선택 메뉴를 현재 노드 이름 목록으로 채웁니다. 자기 자신은 뺍니다."""
+        node_info = row["node"]
+        options = [(PREVIOUS_NODE, None), (GLOBAL_INPUT, None)]
+        options += [(node["name"], node["id"]) for node in self.pipeline_nodes if node is not node_info]
+        menu = row["parent_dropdown"]["menu"]
+        menu.delete(0, "end")
+        for label, parent_id in options:
+            # --- BUG FIX: partial을 사용하여 각 command가 올바른 변수를 참조하도록 수정 ---
+            # 선택한 항목의 이름과 노드 ID를 미리 '박제'해서 새로운 함수를 만듭니다.
+            menu.add_command(label=label, command=partial(self._select_parent, node_info, label, parent_id))
+            # -------------------------------------------------------------------------
+
+    def _select_parent(self, node_info, label, parent_id):
+        """입력 드롭다운에서 항목을 골랐을 때: 노드를 고르면 이름이 아니라 그 노드의 ID로 연결합니다."""
+        node_info["parent"] = label
+        node_info["parent_id"] = parent_id
+        self._refresh_visible_rows()
+        self._mark_dirty()
+
+    def _refresh_visible_rows(self):
+        """화면에 보이는 행에 노드의 현재 값(이름, 입력, 번호)을 다시 씁니다."""
+        for row in self._node_rows:
+            if row["node"] is not None:
+                self._bind_node_row(row, row["node"], row["index"])
+
+    def _schedule_parent_refresh(self, event=None):
+        """노드 이름을 입력하는 동안에는 미뤄두었다가, 입력이 멈추면 한 번만 입력 선택을 검사합니다."""
+        if event: # 실제 키 입력으로 호출된 경우에만 dirty 처리
             self._mark_dirty()
+        if self._parent_refresh_job is not None:
+            self.root.after_cancel(self._parent_refresh_job)
+        self._parent_refresh_job = self.root.after(PARENT_REFRESH_DELAY_MS, self.update_all_parent_dropdowns)
 
     def update_all_parent_dropdowns(self, event=None):
-        """모든 노드의 부모 선택 드롭다운 메뉴를 최신 노드 이름 목록으로 업데이트합니다."""
-        current_node_names = [node["name_entry"].get() for node in self.pipeline_nodes]
-        new_options = ["이전 노드", "전역 기본 이미지"] + current_node_names
-        
+        """
+        입력 드롭다운에 보이는 이름을 부모 노드의 현재 이름으로 맞춥니다. (부모 이름을 바꿔도 연결은 유지됩니다)
+        부모 노드가 삭제되었거나, ID 없이 이름으로만 가리키는 노드가 없으면 '이전 노드'로 되돌립니다.
+        메뉴 항목은 드롭다운을 열 때 만들어지므로 여기서는 노드의 값만 고치고 보이는 행만 다시 씁니다.
+        """
+        self._parent_refresh_job = None
+        names_by_id = {node["id"]: node["name"] for node in self.pipeline_nodes}
+        ids_by_name = {}
+        for node_id, name in names_by_id.items():
+            ids_by_name.setdefault(name, []).append(node_id)
         for node in self.pipeline_nodes:
-            dropdown = node["parent_dropdown"]
-            parent_var = node["parent_var"]
-            current_selection = parent_var.get()
-
-            menu = dropdown["menu"]
-            menu.delete(0, "end")
-
-            for option in new_options:
-                # --- BUG FIX: partial을 사용하여 각 command가 올바른 변수를 참조하도록 수정 ---
-                # "parent_var.set" 이라는 함수에 "option" 이라는 값을 미리 '박제'해서 새로운 함수를 만듭니다.
-                command = partial(parent_var.set, option)
-                menu.add_command(label=option, command=command)
-                # -------------------------------------------------------------------------
-
-            if current_selection in new_options:
-                parent_var.set(current_selection)
-            else:
-                parent_var.set("이전 노드")
-        
+            if node["parent_id"] is None and node["parent"] not in (PREVIOUS_NODE, GLOBAL_INPUT):
+                # 이름으로만 지정된 입력(이전 형식)은 이름이 하나뿐일 때 ID로 연결합니다.
+                # 같은 이름이 여러 개이면 그대로 두어 실행할 때 어느 노드인지 고르도록 알립니다.
+                candidates = ids_by_name.get(node["parent"], [])
+                if len(candidates) == 1:
+                    node["parent_id"] = candidates[0]
+                elif not candidates:
+                    node["parent"] = PREVIOUS_NODE
+            if node["parent_id"] is not None:
+                if node["parent_id"] in names_by_id:
+                    node["parent"] = names_by_id[node["parent_id"]]
+                else:
+                    node["parent_id"] = None
+                    node["parent"] = PREVIOUS_NODE
+        self._refresh_visible_rows()
+
         if event: # 실제 키 입력으로 호출된 경우에만 dirty 처리
             self._mark_dirty()
 
@@ -418,24 +842,21 @@ class ImagePipelineApp:
         path = filedialog.askopenfilename(filetypes=(("이미지 파일", "*.png *.jpg *.jpeg *.webp"), ("모든 파일", "*.*")))
         if path:
             node_info["node_image_path"] = path
-            self.display_image(path, node_info["node_image_preview"])
+            row = self._row_for(node_info)
+            if row is not None:
+                self.display_image(path, row["node_image_preview"])
             self.update_status(f"노드 #{self.pipeline_nodes.index(node_info) + 1}에 참조 이미지 로드됨.")
             self._mark_dirty()
 
-    def remove_node(self, node_frame_to_remove):
-        for i, node in enumerate(self.pipeline_nodes):
-            if node["frame"] == node_frame_to_remove:
-                self.pipeline_nodes.pop(i)
-                break
-        node_frame_to_remove.destroy()
-        self.reindex_nodes()
+    def remove_node(self, node_info):
+        self.pipeline_nodes.remove(node_info)
+        # 뒤의 노드들이 한 칸씩 당겨지므로 보이는 행을 다시 연결합니다.
+        self._layout_node_rows()
+        # 지운 노드를 입력으로 쓰던 노드는 '이전 노드'로 되돌립니다.
+        self._schedule_parent_refresh()
         self.update_status("노드 제거됨.")
         self._mark_dirty()
 
-    def reindex_nodes(self):
-        for i, node in enumerate(self.pipeline_nodes):
-            node["frame"].config(text=f"노드 #{i + 1}")
-
     def select_base_image(self):
         path = filedialog.askopenfilename(filetypes=(("이미지 파일", "*.png *.jpg *.jpeg *.webp"), ("모든 파일", "*.*")))
         if path:
@@ -447,127 +868,104 @@ class ImagePipelineApp:
         path = filedialog.askopenfilename(initialdir=self.PROMPT_DIR, filetypes=(("JSON 파일", "*.json"), ("모든 파일", "*.*")))
         if path:
             try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    self.system_prompt_data = json.load(f)
-                    pretty_json = json.dumps(self.system_prompt_data, indent=2, ensure_ascii=False)
-                    self.system_prompt_preview.config(state='normal')
-                    self.system_prompt_preview.delete('1.0', tk.END)
-                    self.system_prompt_preview.insert(tk.END, pretty_json)
-                    self.system_prompt_preview.config(state='disabled')
-                    self.update_status("시스템 프롬프트 로드 완료.")
+                self.system_prompt_data = load_system_prompt_file(path)
+                pretty_json = json.dumps(self.system_prompt_data, indent=2, ensure_ascii=False)
+                self.system_prompt_preview.config(state='normal')
+                self.system_prompt_preview.delete('1.0', tk.END)
+                self.system_prompt_preview.insert(tk.END, pretty_json)
+                self.system_prompt_preview.config(state='disabled')
+                self.update_status("시스템 프롬프트 로드 완료.")
             except Exception as e:
                 messagebox.showerror("오류", f"JSON 파일 로드 실패: {e}")
 
     def display_image(self, image_source, label_widget):
-        FIXED_DISPLAY_HEIGHT = 150
+        """
+        (메인 스레드 전용) 미리보기 작업을 작업자 스레드에 맡깁니다. 완성되면 UI 큐의 show_preview로 라벨에 표시됩니다.
+        image_source는 파일 경로, EncodedImage, PIL 이미지 중 하나입니다.
+        """
+        # 같은 라벨에 여러 번 요청하면 마지막 요청의 결과만 표시합니다.
+        token = object()
+        self._preview_tokens[label_widget] = token
+        future = self.preview_pool.submit(self.preview_cache.render, image_source)
+        future.add_done_callback(lambda f: self.ui_queue.put(("show_preview", (f, label_widget, token))))
+
+    def show_preview(self, future, label_widget, token):
+        """(메인 스레드 전용) 작업자 스레드가 만든 썸네일을 라벨에 표시합니다."""
+        if self._preview_tokens.get(label_widget) is not token:
+            return
+        del self._preview_tokens[label_widget]
         try:
-            if isinstance(image_source, str): img = Image.open(image_source)
-            else: img = image_source.copy()
-            img_w, img_h = img.size
-            if img_h == 0: return
-            ratio = img_w / img_h
-            new_h = FIXED_DISPLAY_HEIGHT
-            new_w = int(new_h * ratio)
-            resized_img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(resized_img)
+            preview = future.result()
+            if preview is None: return
+            if not label_widget.winfo_exists(): return
+            photo = ImageTk.PhotoImage(preview)
             label_widget.config(image=photo, text="")
             label_widget.image = photo
         except Exception as e:
             self.update_status(f"이미지 표시 오류: {e}")
             
     def update_status(self, message):
+        # 화면 갱신은 Tk 이벤트 루프에 맡깁니다. (메인 스레드를 막기 직전에만 update_idletasks를 직접 부릅니다)
         self.status_label.config(text=message)
-        self.root.update_idletasks()
 
-    def execute_pipeline(self):
-        """(작업자 스레드에서 실행됨) 파이프라인의 핵심 로직을 수행합니다."""
+    def _confirm_run_plan(self, engine, graph, run_options):
+        """
+        (작업자 스레드에서 실행됨) [예산] 예상 API 호출 수를 세어 상태 표시줄에 알리고,
+        confirm_calls_above보다 많으면 UI 큐로 메인 스레드에 확인 대화 상자를 띄워 답을 기다립니다. 실행을 계속하면 True입니다.
+        """
         try:
-            # 1. 반복 횟수 가져오기 (이 작업은 스레드에 안전합니다)
-            try:
-                iterations = int(self.batch_spinbox.get())
-            except ValueError:
-                iterations = 1
-
-            # 2. API 설정 (기존과 동일)
-            genai.configure(api_key=self.api_key)
-            model = genai.GenerativeModel('gemini-2.5-flash-image-preview')
-            system_prompt = self.system_prompt_data.get("prompt", "")
-
-            # 3. 전체 파이프라인을 반복 횟수만큼 실행
-            for batch_index in range(iterations):
-                # GUI 업데이트: 큐를 통해 상태 메시지 전송
-                self.ui_queue.put(("update_status", f"--- 배치 {batch_index + 1}/{iterations} 시작 ---"))
-
-                # 결과물 캐시 초기화 (기존과 동일)
-                self.node_outputs = {
-                    "전역 기본 이미지": Image.open(self.base_image_path)
-                }
-                
-                # 현재 배치의 파이프라인 노드를 순서대로 실행
-                for i, node in enumerate(self.pipeline_nodes):
-                    node_name = node["name_entry"].get().strip()
-                    if not node_name: node_name = f"이름없는_노드_{i+1}"
-                    
-                    # GUI 업데이트: 큐를 통해 상태 메시지 전송
-                    self.ui_queue.put(("update_status", f"배치 {batch_index + 1}/{iterations} - 노드 '{node_name}' 실행 중..."))
-
-                    # 3-1. 입력 이미지 결정 (기존 로직과 완전히 동일)
-                    parent_selection = node["parent_var"].get()
-                    input_image = None
-                    if parent_selection == "이전 노드":
-                        if i == 0:
-                            input_image = self.node_outputs["전역 기본 이미지"]
-                        else:
-                            previous_node_name = self.pipeline_nodes[i - 1]["name_entry"].get().strip()
-                            if not previous_node_name: previous_node_name = f"이름없는_노드_{i}"
-                            if previous_node_name not in self.node_outputs: raise ValueError(f"'{previous_node_name}' 노드의 결과물을 찾을 수 없습니다.")
-                            input_image = self.node_outputs[previous_node_name]
-                    else:
-                        if parent_selection not in self.node_outputs: raise ValueError(f"입력으로 지정된 '{parent_selection}'는 아직 실행되지 않았거나 존재하지 않는 노드입니다.")
-                        input_image = self.node_outputs[parent_selection]
-
-                    # 3-2. API 호출 (기존 로직과 완전히 동일)
-                    aux_prompt = node["prompt_entry"].get()
-                    instructional_prefix = "You are an image generation pipeline. Follow the user's instructions precisely. Generate a single image as the output. Do not respond with text."
-                    full_prompt = f"{instructional_prefix}\n\n## System Prompt:\n{system_prompt}\n\n## User Instruction for this step:\n{aux_prompt}"
-                    contents = [full_prompt, input_image]
-                    if node["node_image_path"]:
-                        contents.append(Image.open(node["node_image_path"]))
-                    
-                    response = model.generate_content(contents)
-                    
-                    generated_image = None
-                    for part in response.candidates[0].content.parts:
-                        if part.inline_data:
-                            generated_image = Image.open(io.BytesIO(part.inline_data.data))
-                            break
-                    if generated_image is None: raise ValueError(f"모델이 이미지를 반환하지 않았습니다. 응답: {response.text}")
-
-                    # 3-3. 결과물 저장 (기존 로직과 완전히 동일)
-                    safe_workflow_name = "".join(c for c in self.current_workflow_name if c.isalnum() or c in (' ', '_')).rstrip().replace(' ', '_')
-                    workflow_output_dir = os.path.join(self.OUTPUT_DIR, safe_workflow_name)
-                    os.makedirs(workflow_output_dir, exist_ok=True)
-                    
-                    safe_filename = "".join(c for c in node_name if c.isalnum() or c in (' ', '_')).rstrip().replace(' ', '_')
-                    if not safe_filename: safe_filename = f"node_{i + 1}"
-                    
-                    if iterations > 1:
-                        output_filename = f"{safe_filename}_batch{batch_index + 1}.png"
-                    else:
-                        output_filename = f"{safe_filename}.png"
-                        
-                    final_path = os.path.join(workflow_output_dir, output_filename)
-                    generated_image.save(final_path)
-
-                    # 3-4. 결과물을 다음 노드와 GUI를 위해 기록
-                    self.node_outputs[node_name] = generated_image
-                    
-                    # GUI 업데이트: 큐를 통해 이미지 표시 요청
-                    self.ui_queue.put(("display_image", (generated_image, node)))
-
-            # 4. 모든 작업 완료 메시지
-            final_status = f"파이프라인 실행 완료! 총 {len(self.pipeline_nodes) * iterations}개의 이미지가 저장되었습니다."
+            plan = plan_run(engine, graph, run_options["base_image_path"], run_options["workflow_name"], run_options["iterations"],
+                            run_options["use_cache"], run_options["reuse"], run_options["resume"])
+        except (OSError, ValueError) as e:
+            self.ui_queue.put(("update_status", f"오류 발생: {e}"))
+            self.ui_queue.put(("show_error", f"실행 계획을 세울 수 없습니다:\n{e}"))
+            return False
+        self.ui_queue.put(("update_status", plan.describe()))
+        confirm_calls_above = self.config["confirm_calls_above"]
+        if not confirm_calls_above or plan.calls <= confirm_calls_above:
+            return True
+        message = plan.describe().replace(" - ", "\n")
+        if run_options["budget"] is not None:
+            message += "\n\n실행당 예산이 설정되어 있어, 예산으로 끝낼 수 없는 배치는 시작하지 않습니다."
+        answer = Future()
+        self.ui_queue.put(("ask_yes_no", ("실행 확인", f"{message}\n\n계속하시겠습니까?", answer)))
+        if answer.result():
+            return True
+        self.ui_queue.put(("update_status", "실행을 취소했습니다."))
+        return False
+
+    def execute_pipeline(self, engine, graph, run_options, run_signature=None):
+        """(작업자 스레드에서 실행됨) 엔진으로 전체 파이프라인을 실행하고 결과를 UI 큐로 알립니다.
+
+        graph와 run_options는 메인 스레드에서 미리 읽어둔 값이므로 여기서는 위젯을 직접 읽지 않습니다.
+        """
+        try:
+            # [예산] 실행 계획은 이미지 전처리와 캐시 읽기가 필요하므로 메인 스레드가 아니라 여기서 셉니다.
+            if not self._confirm_run_plan(engine, graph, run_options):
+                return
+            cache_hits_before = self.result_cache.hits
+            iterations = run_options["iterations"]
+            budget = run_options.get("budget")
+
+            # 개별 노드 실행을 위해 마지막 배치의 결과물을 남겨둡니다.
+            self.node_outputs = engine.run(graph, **run_options)
+            if run_signature:
+                self.last_run_global_signature, self.last_run_signatures = run_signature
+
+            # 모든 작업 완료 메시지
+            cache_hits = self.result_cache.hits - cache_hits_before
+            finished_batches = iterations - len(budget.refused_batches) if budget is not None else iterations
+            final_status = f"파이프라인 실행 완료! 총 {(len(graph) - len(run_options['reuse'])) * finished_batches}개의 이미지가 저장되었습니다. (캐시 재사용 {cache_hits}개, {format_request_stats(engine.last_request_stats)})"
             final_info = "파이프라인 실행이 완료되었습니다!\n각 노드의 결과가 개별 파일로 저장되었습니다."
+            # [예산] 예산이 부족해 시작하지 않은 배치가 있으면 알려줍니다.
+            if budget is not None:
+                final_info += f"\n\n{budget.describe()}"
+                if budget.refused_batches:
+                    final_info += "\n예산을 늘리고 '중단된 실행 이어하기'를 켜서 실행하면 남은 배치를 이어서 실행합니다."
+            # [실행 추적] p95 기준으로 가장 느린 노드 몇 개를 함께 보여줍니다.
+            slowest = dict(sorted(engine.last_trace_summary.items(), key=lambda item: item[1]["p95"], reverse=True)[:TRACE_SUMMARY_NODES])
+            if slowest:
+                final_info += "\n\n느린 노드 (p95 기준):\n" + "\n".join(format_trace_summary(slowest))
             self.ui_queue.put(("update_status", final_status))
             self.ui_queue.put(("show_info", final_info))
 
@@ -581,88 +979,79 @@ class ImagePipelineApp:
         finally:
             # 작업이 성공하든 실패하든, 마지막에 버튼을 다시 활성화해야 합니다.
             # 이 작업은 메인 스레드에서 직접 처리해야 하므로, 간단한 트릭을 사용합니다.
-            self.root.after(0, lambda: self.execute_btn.config(state="normal", text="전체 파이프라인 실행"))
+            self._close_metrics_exporter()
+            self.root.after(0, self._finish_run)
+
+    def execute_sweep(self, engine, graph, paths, sweep_options):
+        """(작업자 스레드에서 실행됨) 폴더의 이미지마다 파이프라인을 실행하고 진행 상황과 결과를 UI 큐로 알립니다."""
+        try:
+            progress = engine.client.run(sweep_async(engine, graph, self.current_workflow_name, paths, **sweep_options))
+            final_info = f"폴더 일괄 실행이 끝났습니다.\n입력 {progress.total}개 중 {progress.completed}개 처리, {progress.skipped}개 건너뜀"
+            if progress.failed:
+                final_info += f", {len(progress.failed)}개 실패\n\n실패한 입력 (다시 실행하면 이어서 처리합니다):\n"
+                final_info += "\n".join(f"{os.path.basename(path)}: {error}" for path, error in progress.failed[:10])
+            self.ui_queue.put(("update_status", progress.describe()))
+            self.ui_queue.put(("show_info", final_info))
+        except Exception as e:
+            self.ui_queue.put(("update_status", f"오류 발생: {e}"))
+            self.ui_queue.put(("show_error", f"폴더 일괄 실행 중 오류가 발생했습니다:\n{e}"))
+        finally:
+            self._close_metrics_exporter()
+            self.root.after(0, self._finish_run)
+
+    def _record_single_node_signature(self, graph, index):
+        """
+        [증분 실행] 개별 실행한 노드는 최신 상태로 기록하고,
+        이전 결과물을 입력으로 만들어졌던 하위 노드는 다음 증분 실행에서 다시 실행되도록 합니다.
+        """
+        self.last_run_signatures[graph.ids[index]] = graph.node_signature(index)
+        for child in graph.descendants(graph.children[index]):
+            self.last_run_signatures.pop(graph.ids[child], None)
 
     def execute_single_node(self, target_node):
-        """지정된 단일 노드만 독립적으로 실행합니다."""
+        """지정된 단일 노드만 독립적으로 실행합니다. 입력 검증은 메인 스레드에서, API 호출은 작업자 스레드에서 합니다."""
+        if self.run_active:
+            return
         if not all([self.base_image_path, self.system_prompt_data, self.api_key]):
             messagebox.showwarning("준비 부족", "개별 노드를 실행하려면 최소한 전역 기본 이미지, 시스템 프롬프트, API키가 필요합니다.")
             return
 
-        try:
-            node_name = target_node["name_entry"].get().strip()
-            if not node_name:
-                messagebox.showwarning("이름 필요", "실행할 노드의 이름이 비어있습니다.")
-                return
-
-            self.update_status(f"개별 노드 '{node_name}' 실행 준비...")
-
-            # 1. 입력 이미지 결정 (캐시된 결과물 사용)
-            parent_selection = target_node["parent_var"].get()
-            input_image = None
-            
-            # 'node_outputs' 캐시가 비어있다면, 전역 이미지를 채워준다.
-            if not self.node_outputs:
-                self.node_outputs["전역 기본 이미지"] = Image.open(self.base_image_path)
-
-            if parent_selection == "이전 노드":
-                # 현재 노드의 인덱스를 찾아 이전 노드의 이름을 알아낸다.
-                try:
-                    current_index = self.pipeline_nodes.index(target_node)
-                    if current_index == 0:
-                        input_image = self.node_outputs["전역 기본 이미지"]
-                    else:
-                        previous_node_name = self.pipeline_nodes[current_index - 1]["name_entry"].get().strip()
-                        if not previous_node_name: raise KeyError
-                        input_image = self.node_outputs[previous_node_name]
-                except (ValueError, KeyError):
-                    messagebox.showerror("오류", f"이전 노드의 결과물을 찾을 수 없습니다. 먼저 전체 파이프라인이나 이전 노드를 실행해주세요.")
-                    return
-            else:
-                if parent_selection not in self.node_outputs:
-                    messagebox.showerror("오류", f"입력으로 지정된 '{parent_selection}'의 결과물을 찾을 수 없습니다. 먼저 전체 파이프라인이나 해당 노드를 실행해주세요.")
-                    return
-                input_image = self.node_outputs[parent_selection]
-
-            # 2. API 호출 (execute_pipeline과 로직 공유)
-            genai.configure(api_key=self.api_key)
-            model = genai.GenerativeModel('gemini-2.5-flash-image-preview')
-            system_prompt = self.system_prompt_data.get("prompt", "")
-            
-            aux_prompt = target_node["prompt_entry"].get()
-            instructional_prefix = "You are an image generation pipeline..." # (이하 프롬프트 구성 동일)
-            full_prompt = f"{instructional_prefix}\n\n## System Prompt:\n{system_prompt}\n\n## User Instruction for this step:\n{aux_prompt}"
-            
-            contents = [full_prompt, input_image]
-            if target_node["node_image_path"]:
-                contents.append(Image.open(target_node["node_image_path"]))
-            
-            self.update_status(f"개별 노드 '{node_name}' 실행 중...")
-            response = model.generate_content(contents)
-            
-            generated_image = None
-            for part in response.candidates[0].content.parts:
-                if part.inline_data:
-                    generated_image = Image.open(io.BytesIO(part.inline_data.data))
-                    break
-            if generated_image is None: raise ValueError("모델이 이미지를 반환하지 않았습니다.")
-
-            # 3. 결과 저장 및 캐시 업데이트
-            safe_workflow_name = "".join(c for c in self.current_workflow_name if c.isalnum() or c in (' ', '_')).rstrip().replace(' ', '_')
-            workflow_output_dir = os.path.join(self.OUTPUT_DIR, safe_workflow_name)
-            os.makedirs(workflow_output_dir, exist_ok=True)
-            safe_filename = "".join(c for c in node_name if c.isalnum() or c in (' ', '_')).rstrip().replace(' ', '_')
-            output_filename = f"{safe_filename}_single.png" # 단일 실행임을 표시
-            final_path = os.path.join(workflow_output_dir, output_filename)
-            generated_image.save(final_path)
+        node_name = target_node["name"].strip()
+        if not node_name:
+            messagebox.showwarning("이름 필요", "실행할 노드의 이름이 비어있습니다.")
+            return
 
-            self.node_outputs[node_name] = generated_image
-            self.display_image(generated_image, target_node["result_image_label"])
-            self.update_status(f"개별 노드 '{node_name}' 실행 완료! '{final_path}'에 저장됨.")
+        # 1. 입력 연결 확인 (입력 이미지는 엔진이 캐시된 결과물에서 찾습니다)
+        try:
+            graph = PipelineGraph(self._collect_node_specs())
+        except PipelineGraphError as e:
+            messagebox.showerror("파이프라인 오류", f"실행 전에 파이프라인 연결 오류가 발견되었습니다:\n{e}")
+            return
+        index = self.pipeline_nodes.index(target_node)
+
+        # 2. API 호출 및 결과 저장 (execute_pipeline과 같은 엔진을 작업자 스레드에서 사용)
+        engine = self._create_engine(on_event=partial(self._on_engine_event, list(self.pipeline_nodes)))
+        self.update_status(f"개별 노드 '{node_name}' 실행 준비...")
+        self._set_run_buttons_running(True)
+        thread = threading.Thread(target=self._run_single_node_thread,
+                                  args=(engine, graph, index, target_node, not self.bypass_cache_var.get()), daemon=True)
+        thread.start()
 
+    def _run_single_node_thread(self, engine, graph, index, target_node, use_cache):
+        """(작업자 스레드에서 실행됨) 노드 하나를 실행하고 결과를 UI 큐로 알립니다."""
+        node_name = graph.names[index]
+        try:
+            generated_image, final_path = engine.run_single_node(
+                graph, index, self.node_outputs, self.base_image_path, self.current_workflow_name, use_cache=use_cache
+            )
+            self._record_single_node_signature(graph, index)
+            self.ui_queue.put(("display_image", (generated_image, target_node)))
+            self.ui_queue.put(("update_status", f"개별 노드 '{node_name}' 실행 완료! '{final_path}'에 저장됨."))
         except Exception as e:
-            self.update_status(f"오류 발생: {e}")
-            messagebox.showerror("오류", f"개별 노드 실행 중 오류가 발생했습니다:\n{e}")
+            self.ui_queue.put(("update_status", f"오류 발생: {e}"))
+            self.ui_queue.put(("show_error", f"개별 노드 실행 중 오류가 발생했습니다:\n{e}"))
+        finally:
+            self.root.after(0, self._finish_run)
     
 
 if __name__ == "__main__":
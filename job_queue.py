@@ -0,0 +1,451 @@
+"""
+여러 워크플로우 실행을 작업(job)으로 쌓아두고 우선순위 순서로 처리하는 로컬 작업 대기열입니다.
+작업은 SQLite 파일(jobs.sqlite3)에 저장되므로 GUI와 명령줄 어디서든 추가하고 상태를 볼 수 있고,
+오래 실행되는 작업자(worker) 프로세스 하나가 작업을 꺼내 속도 제한이 걸린 모델 클라이언트 하나를 함께 쓰며 실행합니다.
+작업에는 제출한 순간의 노드 설정과 시스템 프롬프트가 그대로 담기므로, 이후에 워크플로우 파일을 고쳐도 대기 중인 작업은 바뀌지 않습니다.
+결과물과 매니페스트는 작업마다 '<출력 폴더>/<작업 이름>_job<작업 ID>/'에 따로 쓰므로, 같은 워크플로우의 작업을 동시에 실행해도 겹치지 않습니다.
+
+명령줄 사용 예:
+    python -m job_queue submit --workflow workflows/sample.json --base-image char.png --system-prompt prompts/prompts_template.json --priority 5
+    python -m job_queue submit --workflow workflows/sample.json --base-images characters/ --system-prompt prompts/prompts_template.json
+    python -m job_queue status
+    python -m job_queue cancel 12
+    python -m job_queue worker --max-jobs 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+from dataset_sweep import DEFAULT_MAX_PARALLEL_INPUTS, list_base_images, sweep_async
+from image_payload import PayloadCache
+from model_client import get_model_client, load_config
+from output_store import memory_limit_from_config
+from output_writer import writer_options_from_config
+from pipeline_engine import PipelineEngine, app_base_dir, load_system_prompt_file, load_workflow_file, read_api_key
+from pipeline_graph import PipelineGraph
+from result_cache import ResultCache
+from run_budget import budget_from_config
+
+QUEUE_FILE = "jobs.sqlite3"
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+STATUS_LABELS = {
+    STATUS_QUEUED: "대기",
+    STATUS_RUNNING: "실행 중",
+    STATUS_DONE: "완료",
+    STATUS_FAILED: "실패",
+    STATUS_CANCELLED: "취소",
+}
+
+# 작업자가 새 작업을 확인하는 간격(초)과 동시에 실행할 최대 작업 수
+DEFAULT_POLL_SECONDS = 2.0
+DEFAULT_MAX_JOBS = 2
+
+# 실행 중인 작업의 진행 메시지를 대기열 파일에 기록하는 최소 간격(초)
+PROGRESS_INTERVAL_SECONDS = 2.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    name TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    worker TEXT,
+    message TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority DESC, id);
+"""
+
+
+def default_queue_path():
+    return os.path.join(app_base_dir(), QUEUE_FILE)
+
+
+def worker_id():
+    """작업을 가져간 작업자를 구분하는 '<호스트 이름>:<프로세스 ID>'입니다."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 권한이 없는 경우 등: 살아 있는 것으로 봅니다.
+        return True
+    return True
+
+
+def job_run_name(job_id, spec):
+    """작업의 결과물 폴더와 매니페스트 이름입니다. 작업 ID를 붙여, 이름이 같은 작업끼리 결과물이나 매니페스트를 덮어쓰지 않게 합니다."""
+    return f"{spec['name']}_job{job_id}"
+
+
+def make_job_spec(name, node_specs, system_prompt_data, output_dir, base_image=None, base_images=None, batches=1, parallel_batches=1,
+                  use_cache=True):
+    """
+    작업 하나의 실행 설정입니다. base_image(파일 하나) 또는 base_images(폴더/glob, 데이터셋 스윕) 중 하나를 줍니다.
+    경로는 작업자가 다른 작업 폴더에서 실행되어도 같은 파일을 가리키도록 절대 경로로 저장합니다.
+    """
+    if bool(base_image) == bool(base_images):
+        raise ValueError("기본 이미지 파일과 기본 이미지 폴더 중 하나만 지정해야 합니다.")
+    node_specs = [dict(spec, image_path=os.path.abspath(spec["image_path"]) if spec.get("image_path") else None) for spec in node_specs]
+    # 제출 시점에 그래프를 검증해, 잘못된 워크플로우가 대기열에 들어가지 않게 합니다.
+    PipelineGraph(node_specs)
+    return {
+        "name": name,
+        "node_specs": node_specs,
+        "system_prompt": system_prompt_data,
+        "output_dir": os.path.abspath(output_dir),
+        "base_image": os.path.abspath(base_image) if base_image else None,
+        "base_images": os.path.abspath(base_images) if base_images else None,
+        "batches": max(1, batches),
+        "parallel_batches": max(1, parallel_batches),
+        "use_cache": use_cache,
+    }
+
+
+class JobQueue:
+    """
+    SQLite 파일에 저장된 작업 대기열입니다. 여러 프로세스(GUI, 명령줄, 작업자)가 같은 파일을 동시에 써도 되며,
+    한 프로세스 안에서는 여러 스레드가 이 객체를 함께 써도 됩니다.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_queue_path()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def submit(self, spec, priority=0):
+        """작업을 대기열에 넣고 작업 ID를 돌려줍니다. priority가 큰 작업이 먼저 실행됩니다."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (priority, status, name, spec, created_at) VALUES (?, ?, ?, ?, ?)",
+                (priority, STATUS_QUEUED, spec["name"], json.dumps(spec, ensure_ascii=False), time.time()))
+            return cursor.lastrowid
+
+    def claim(self, worker):
+        """
+        우선순위가 가장 높은(같으면 먼저 들어온) 대기 작업 하나를 실행 중으로 바꾸고 (작업 ID, 실행 설정)을 돌려줍니다.
+        여러 작업자가 동시에 불러도 한 작업은 한 작업자만 가져갑니다. 대기 작업이 없으면 None입니다.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, spec FROM jobs WHERE status = ? ORDER BY priority DESC, id LIMIT 1", (STATUS_QUEUED,)).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE jobs SET status = ?, worker = ?, started_at = ?, message = NULL WHERE id = ?",
+                                       (STATUS_RUNNING, worker, time.time(), row["id"]))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return None if row is None else (row["id"], json.loads(row["spec"]))
+
+    def update_progress(self, job_id, message):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET message = ? WHERE id = ? AND status = ?", (message, job_id, STATUS_RUNNING))
+
+    def finish(self, job_id, status, message):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ?, message = ?, finished_at = ? WHERE id = ?",
+                               (status, message, time.time(), job_id))
+
+    def cancel(self, job_id):
+        """대기 중인 작업을 취소합니다. 이미 실행 중이거나 끝난 작업이면 False입니다."""
+        with self._lock:
+            cursor = self._conn.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                                        (STATUS_CANCELLED, time.time(), job_id, STATUS_QUEUED))
+            return cursor.rowcount > 0
+
+    def requeue_orphans(self):
+        """
+        이 호스트에서 실행 중이던 작업 중 작업자 프로세스가 이미 끝난 작업을 다시 대기 상태로 돌립니다.
+        작업은 이어하기(resume)로 실행되므로 다시 실행해도 끝난 결과물은 새로 만들지 않습니다.
+        """
+        host = socket.gethostname()
+        with self._lock:
+            rows = self._conn.execute("SELECT id, worker FROM jobs WHERE status = ?", (STATUS_RUNNING,)).fetchall()
+            orphans = []
+            for row in rows:
+                worker_host, _, pid = (row["worker"] or "").rpartition(":")
+                if worker_host == host and pid.isdigit() and not _pid_alive(int(pid)):
+                    orphans.append(row["id"])
+            for job_id in orphans:
+                self._conn.execute("UPDATE jobs SET status = ?, worker = NULL, message = ? WHERE id = ? AND status = ?",
+                                   (STATUS_QUEUED, "작업자가 종료되어 다시 대기합니다.", job_id, STATUS_RUNNING))
+        return len(orphans)
+
+    def list_jobs(self, limit=50):
+        """최근 작업부터 {"id", "priority", "status", "name", "message", "created_at", "started_at", "finished_at"} 리스트입니다."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, priority, status, name, message, created_at, started_at, finished_at FROM jobs ORDER BY id DESC LIMIT ?",
+                (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def format_jobs(jobs):
+    """list_jobs()를 작업당 한 줄씩 사람이 읽을 수 있는 문자열 리스트로 만듭니다."""
+    lines = []
+    for job in jobs:
+        line = f"#{job['id']} [{STATUS_LABELS.get(job['status'], job['status'])}] {job['name']} (우선순위 {job['priority']})"
+        if job["message"]:
+            line += f" - {job['message']}"
+        lines.append(line)
+    return lines
+
+
+class ProgressWriter:
+    """
+    실행 중인 작업의 진행 메시지를 대기열 파일에 쓰는 전용 스레드입니다.
+    진행 메시지는 모델 클라이언트의 이벤트 루프에서 오므로, SQLite 쓰기가 잠금 경합으로 오래 기다려도 다른 작업이 멈추지 않도록
+    post()는 작업별 마지막 메시지만 남겨두고 바로 돌아오며, 이 스레드가 interval초마다 모아서 씁니다.
+    """
+
+    def __init__(self, queue, interval=PROGRESS_INTERVAL_SECONDS):
+        self.queue = queue
+        self.interval = interval
+        self._lock = threading.Lock()
+        # 작업 ID -> 아직 쓰지 않은 마지막 진행 메시지
+        self._pending = {}
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="job-progress-writer", daemon=True)
+        self._thread.start()
+
+    def post(self, job_id, message):
+        with self._lock:
+            self._pending[job_id] = message
+        self._wake.set()
+
+    def discard(self, job_id):
+        """끝난 작업의 아직 쓰지 않은 진행 메시지를 버립니다."""
+        with self._lock:
+            self._pending.pop(job_id, None)
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wake.wait()
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._wake.clear()
+            for job_id, message in pending.items():
+                try:
+                    self.queue.update_progress(job_id, message)
+                except sqlite3.Error:
+                    # 진행 메시지는 다음 메시지로 덮어쓰이므로 하나를 놓쳐도 작업은 계속합니다.
+                    pass
+            self._closed.wait(self.interval)
+
+    def close(self):
+        self._closed.set()
+        self._wake.set()
+        self._thread.join()
+
+
+class JobWorker:
+    """
+    대기열에서 작업을 꺼내 실행하는 작업자입니다. 모든 작업이 client(속도 제한, 동시 요청 수 제한 포함) 하나를 함께 쓰므로,
+    max_jobs개의 작업을 겹쳐 실행해 한 작업의 대기 시간 동안에도 API 할당량을 계속 채웁니다.
+    config.json의 실행당 예산은 작업마다 따로 적용하며, 예산이 부족해 끝내지 못한 작업은 실패로 남습니다.
+    """
+
+    def __init__(self, queue, client, config, cache_dir, max_jobs=DEFAULT_MAX_JOBS, poll_seconds=DEFAULT_POLL_SECONDS, log=print):
+        self.queue = queue
+        self.client = client
+        self.config = config
+        self.max_jobs = max(1, max_jobs)
+        self.poll_seconds = poll_seconds
+        self.log = log
+        self.worker = worker_id()
+        # 결과 캐시와 업로드 전처리 캐시는 작업 사이에 함께 씁니다.
+        self.result_cache = ResultCache(cache_dir)
+        self.payloads = PayloadCache.from_config(config)
+        self.progress_writer = None
+
+    def run(self, stop_when_empty=False):
+        """작업을 계속 처리합니다. stop_when_empty가 True이면 대기 작업이 없고 실행 중인 작업이 모두 끝나면 돌아옵니다."""
+        return self.client.run(self.run_async(stop_when_empty))
+
+    async def run_async(self, stop_when_empty=False):
+        self.progress_writer = ProgressWriter(self.queue)
+        try:
+            await self._run_jobs(stop_when_empty)
+        finally:
+            await asyncio.to_thread(self.progress_writer.close)
+
+    async def _run_jobs(self, stop_when_empty):
+        requeued = await asyncio.to_thread(self.queue.requeue_orphans)
+        if requeued:
+            self.log(f"중단된 작업 {requeued}개를 다시 대기열에 넣었습니다.")
+        running = set()
+        while True:
+            while len(running) < self.max_jobs:
+                job = await asyncio.to_thread(self.queue.claim, self.worker)
+                if job is None:
+                    break
+                task = asyncio.create_task(self._run_job(*job))
+                running.add(task)
+                task.add_done_callback(running.discard)
+            if not running:
+                if stop_when_empty:
+                    return
+                await asyncio.sleep(self.poll_seconds)
+            else:
+                # 작업 하나가 끝나면 바로 다음 작업을 꺼내고, 그렇지 않아도 주기적으로 새 작업을 확인합니다.
+                await asyncio.wait(running, timeout=self.poll_seconds, return_when=asyncio.FIRST_COMPLETED)
+
+    def _make_engine(self, job_id, spec):
+        def on_event(command, data):
+            # 이벤트 루프에서 불리므로 대기열 파일에는 직접 쓰지 않고 진행 메시지 작성 스레드에 맡깁니다.
+            if command == "update_status":
+                self.progress_writer.post(job_id, data)
+
+        return PipelineEngine(
+            self.client, spec["system_prompt"], spec["output_dir"], result_cache=self.result_cache, on_event=on_event,
+            payloads=self.payloads, writer_options=writer_options_from_config(self.config),
+            output_memory_limit=memory_limit_from_config(self.config), trace=self.config["trace_runs"],
+            chrome_trace=self.config["chrome_trace"], deterministic=self.config["deterministic_requests"]
+        )
+
+    async def _run_job(self, job_id, spec):
+        self.log(f"작업 #{job_id} '{spec['name']}' 시작")
+        try:
+            engine = self._make_engine(job_id, spec)
+            graph = PipelineGraph(spec["node_specs"])
+            run_name = job_run_name(job_id, spec)
+            budget = budget_from_config(self.config)
+            budget = budget if budget.limited else None
+            if spec.get("base_images"):
+                paths = await asyncio.to_thread(list_base_images, spec["base_images"])
+                if not paths:
+                    raise ValueError(f"'{spec['base_images']}'에서 처리할 이미지를 찾을 수 없습니다.")
+                progress = await sweep_async(engine, graph, run_name, paths, spec["batches"], spec["parallel_batches"],
+                                             DEFAULT_MAX_PARALLEL_INPUTS, spec["use_cache"], budget)
+                status = STATUS_FAILED if progress.failed or progress.refused else STATUS_DONE
+                message = progress.describe()
+                if budget is not None:
+                    message += f" - {budget.describe()}"
+            else:
+                # 작업자가 중간에 끊겼다가 다시 실행되어도 끝난 결과물은 건너뛰도록 항상 이어하기로 실행합니다.
+                await engine.run_async(graph, spec["base_image"], run_name, spec["batches"], spec["parallel_batches"],
+                                       spec["use_cache"], resume=True, budget=budget)
+                if budget is not None and budget.refused_batches:
+                    status, message = STATUS_FAILED, budget.describe()
+                else:
+                    status = STATUS_DONE
+                    message = f"이미지 {len(graph) * spec['batches']}개 저장"
+        except Exception as e:
+            status, message = STATUS_FAILED, f"오류: {e}"
+        self.progress_writer.discard(job_id)
+        await asyncio.to_thread(self.queue.finish, job_id, status, message)
+        self.log(f"작업 #{job_id} '{spec['name']}' {STATUS_LABELS[status]}: {message}")
+
+
+# --- 명령줄 실행 ---
+
+def build_arg_parser():
+    base_dir = app_base_dir()
+    parser = argparse.ArgumentParser(prog="python -m job_queue", description="Bananafy 작업 대기열에 작업을 넣고 실행합니다.")
+    parser.add_argument("--queue", default=default_queue_path(), help="작업 대기열 파일 (기본값: jobs.sqlite3)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="작업을 대기열에 넣습니다")
+    submit.add_argument("--workflow", required=True, help="워크플로우 JSON 파일 (GUI의 '워크플로우 저장' 형식)")
+    submit.add_argument("--system-prompt", required=True, help="시스템 프롬프트 JSON 파일 (prompts/prompts_template.json 형식)")
+    inputs = submit.add_mutually_exclusive_group(required=True)
+    inputs.add_argument("--base-image", help="전역 기본 이미지 파일")
+    inputs.add_argument("--base-images", help="기본 이미지 폴더 또는 glob 패턴 (데이터셋 스윕)")
+    submit.add_argument("--output-dir", default=os.path.join(base_dir, "img"), help="결과물을 저장할 폴더 (기본값: img)")
+    submit.add_argument("--name", help="결과물 하위 폴더 이름 (기본값: 워크플로우 파일 이름)")
+    submit.add_argument("--batches", type=int, default=1, help="전체 파이프라인 반복 횟수")
+    submit.add_argument("--parallel-batches", type=int, default=1, help="동시에 실행할 최대 배치 수")
+    submit.add_argument("--no-cache", action="store_true", help="캐시를 무시하고 모든 노드를 새로 생성합니다")
+    submit.add_argument("--priority", type=int, default=0, help="우선순위 (클수록 먼저 실행, 기본값: 0)")
+
+    status = commands.add_parser("status", help="최근 작업의 상태를 봅니다")
+    status.add_argument("--limit", type=int, default=20, help="보여줄 작업 수")
+
+    cancel = commands.add_parser("cancel", help="대기 중인 작업을 취소합니다")
+    cancel.add_argument("job_id", type=int)
+
+    worker = commands.add_parser("worker", help="대기열의 작업을 계속 실행합니다")
+    worker.add_argument("--max-jobs", type=int, default=DEFAULT_MAX_JOBS, help="동시에 실행할 최대 작업 수")
+    worker.add_argument("--poll-seconds", type=float, default=DEFAULT_POLL_SECONDS, help="새 작업을 확인하는 간격 (초)")
+    worker.add_argument("--until-empty", action="store_true", help="대기 작업이 없으면 종료합니다")
+    worker.add_argument("--cache-dir", default=os.path.join(base_dir, "cache"), help="결과 캐시 폴더")
+    worker.add_argument("--model", help="사용할 모델 이름 (기본값: config.json의 model_name)")
+    worker.add_argument("--api-key", help="Google AI Studio API 키 (기본값: GOOGLE_API_KEY 환경 변수 또는 api_key.txt)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    queue = JobQueue(args.queue)
+    try:
+        if args.command == "submit":
+            try:
+                node_specs = load_workflow_file(args.workflow, app_base_dir())
+                spec = make_job_spec(args.name or os.path.splitext(os.path.basename(args.workflow))[0], node_specs,
+                                     load_system_prompt_file(args.system_prompt), args.output_dir, args.base_image, args.base_images,
+                                     args.batches, args.parallel_batches, not args.no_cache)
+            except (OSError, ValueError) as e:
+                print(f"오류: {e}", file=sys.stderr)
+                return 1
+            print(f"작업 #{queue.submit(spec, args.priority)}을(를) 대기열에 넣었습니다.")
+        elif args.command == "status":
+            for line in format_jobs(queue.list_jobs(args.limit)) or ["대기열이 비어 있습니다."]:
+                print(line)
+        elif args.command == "cancel":
+            if not queue.cancel(args.job_id):
+                print(f"오류: 작업 #{args.job_id}은(는) 대기 중이 아니어서 취소할 수 없습니다.", file=sys.stderr)
+                return 1
+            print(f"작업 #{args.job_id}을(를) 취소했습니다.")
+        elif args.command == "worker":
+            api_key = read_api_key(args)
+            if not api_key:
+                print("오류: API 키가 없습니다. --api-key, GOOGLE_API_KEY 환경 변수 또는 api_key.txt를 사용하세요.", file=sys.stderr)
+                return 1
+            config = load_config(app_base_dir())
+            if args.model:
+                config["model_name"] = args.model
+            worker = JobWorker(queue, get_model_client(api_key, config), config, args.cache_dir, args.max_jobs, args.poll_seconds,
+                               log=lambda message: print(message, flush=True))
+            print(f"작업자 {worker.worker} 시작 (동시 작업 {worker.max_jobs}개, 대기열: {queue.path})", flush=True)
+            try:
+                worker.run(stop_when_empty=args.until_empty)
+            except KeyboardInterrupt:
+                print("작업자를 종료합니다. 실행 중이던 작업은 다음 작업자가 이어서 실행합니다.")
+        return 0
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
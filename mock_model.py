@@ -0,0 +1,113 @@
+"""
+네트워크 없이 파이프라인을 돌려볼 수 있는 가짜 Gemini 모델입니다.
+genai.GenerativeModel과 같은 모양(model_name, generate_content, generate_content_async)으로 응답을 돌려주며,
+지연 시간 분포(로그 정규), 오류 비율, 이미지 없는 응답 비율, 결과 이미지 크기와 형식을 설정할 수 있습니다.
+ModelClient(api_key, config, model=MockGenerativeModel(...))처럼 넘겨 벤치마크와 개발용 실행에 씁니다.
+"""
+import asyncio
+import io
+import math
+import random
+import threading
+import time
+
+from google.api_core import exceptions as google_exceptions
+from PIL import Image
+
+from image_payload import UPLOAD_FORMATS
+
+# 미리 만들어 돌려쓸 결과 이미지 수 (이미지 생성 비용이 측정에 섞이지 않도록)
+IMAGE_POOL_SIZE = 8
+
+
+class _InlineData:
+    def __init__(self, data, mime_type):
+        self.data = data
+        self.mime_type = mime_type
+
+
+class _Part:
+    def __init__(self, inline_data=None, text=None):
+        self.inline_data = inline_data
+        self.text = text
+
+
+class _Content:
+    def __init__(self, parts):
+        self.parts = parts
+
+
+class _Candidate:
+    def __init__(self, parts):
+        self.content = _Content(parts)
+
+
+class MockResponse:
+    """generate_content 응답 중 파이프라인이 읽는 부분(candidates, text)만 흉내 냅니다."""
+
+    def __init__(self, parts):
+        self.candidates = [_Candidate(parts)] if parts else []
+
+    @property
+    def text(self):
+        texts = [part.text for candidate in self.candidates for part in candidate.content.parts if part.text]
+        if not texts:
+            raise ValueError("응답에 텍스트 파트가 없습니다.")
+        return "".join(texts)
+
+
+class MockGenerativeModel:
+    """
+    latency_ms는 지연 시간의 중앙값, latency_sigma는 로그 정규 분포의 폭입니다(0이면 항상 같은 지연).
+    error_rate 비율의 요청은 ServiceUnavailable을, no_image_rate 비율의 요청은 이미지 없는 응답을 돌려줍니다.
+    image_size x image_size 크기의 노이즈 이미지를 image_format으로 인코딩해 돌려주므로 압축이 거의 되지 않는
+    실제 결과물과 비슷한 크기의 바이트가 오갑니다. seed를 주면 같은 순서의 요청에 같은 결과가 나옵니다.
+    """
+
+    def __init__(self, model_name="mock-image-model", latency_ms=50.0, latency_sigma=0.5, error_rate=0.0, no_image_rate=0.0,
+                 image_size=1024, image_format="PNG", seed=None):
+        self.model_name = "models/" + model_name
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.no_image_rate = no_image_rate
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._mime_type = UPLOAD_FORMATS[image_format.upper()]
+        self._images = [self._make_image(image_size, image_format, index) for index in range(IMAGE_POOL_SIZE)]
+
+    def _make_image(self, size, image_format, index):
+        noise = Image.effect_noise((size, size), 64 + index).convert("RGB")
+        buffer = io.BytesIO()
+        noise.save(buffer, format=image_format)
+        return buffer.getvalue()
+
+    def _plan(self):
+        """요청 하나의 지연 시간(초)과 결과 종류를 정합니다."""
+        with self._lock:
+            self.requests += 1
+            latency = self.latency_ms / 1000.0
+            if self.latency_sigma > 0:
+                latency *= math.exp(self._random.gauss(0, self.latency_sigma))
+            roll = self._random.random()
+            image = self._images[self.requests % len(self._images)]
+        if roll < self.error_rate:
+            return latency, None, google_exceptions.ServiceUnavailable("가짜 모델: 일시적인 서버 오류")
+        if roll < self.error_rate + self.no_image_rate:
+            return latency, MockResponse([_Part(text="이미지를 만들 수 없습니다.")]), None
+        return latency, MockResponse([_Part(inline_data=_InlineData(image, self._mime_type))]), None
+
+    async def generate_content_async(self, contents, **kwargs):
+        latency, response, error = self._plan()
+        await asyncio.sleep(latency)
+        if error is not None:
+            raise error
+        return response
+
+    def generate_content(self, contents, **kwargs):
+        latency, response, error = self._plan()
+        time.sleep(latency)
+        if error is not None:
+            raise error
+        return response
@@ -0,0 +1,259 @@
+"""
+Gemini 모델 호출을 담당하는 공용 클라이언트입니다.
+API 설정(genai.configure)과 GenerativeModel 생성은 한 번만 하고,
+모든 요청은 백그라운드 스레드의 이벤트 루프 하나에서 generate_content_async로 보냅니다.
+동시에 보내는 요청 수는 세마포어로 제한하므로, 요청이 수백 개여도 OS 스레드는 늘어나지 않습니다.
+요청 속도는 토큰 버킷으로 할당량에 맞추고, 일시적인 오류는 지터가 있는 지수 백오프로 재시도합니다.
+google.generativeai는 grpc/protobuf까지 불러와 시작 시간을 크게 늘리므로, 처음 클라이언트를 만들 때(또는 warm_up()에서) 불러옵니다.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+from image_payload import DEFAULT_UPLOAD_FORMAT, DEFAULT_UPLOAD_MAX_EDGE, DEFAULT_UPLOAD_QUALITY
+from output_store import DEFAULT_MEMORY_LIMIT_MB
+from output_writer import DEFAULT_OUTPUT_FORMAT, DEFAULT_OUTPUT_QUEUE_SIZE, DEFAULT_OUTPUT_WORKERS, DEFAULT_PNG_COMPRESS_LEVEL
+from rate_limit import LatencyTracker, NoImageError, RequestStats, TokenBucket, backoff_delay, is_retryable, retryable_exceptions
+from run_progress import DEFAULT_METRICS_INTERVAL_SECONDS
+
+CONFIG_FILE = "config.json"
+
+DEFAULT_MODEL_NAME = 'gemini-2.5-flash-image-preview'
+DEFAULT_MAX_CONCURRENT_REQUESTS = 16
+
+DEFAULT_CONFIG = {
+    "model_name": DEFAULT_MODEL_NAME,
+    "max_concurrent_requests": DEFAULT_MAX_CONCURRENT_REQUESTS,
+    # 토큰 버킷: 분당 요청 수(0이면 제한 없음)와 한 번에 몰아 보낼 수 있는 요청 수
+    "requests_per_minute": 60,
+    "burst": 10,
+    # 재시도: 최대 횟수와 지수 백오프의 시작/최대 대기 시간(초)
+    "max_retries": 4,
+    "retry_base_delay": 1.0,
+    "retry_max_delay": 30.0,
+    # 헤지: 요청이 최근 지연 시간의 hedge_percentile 백분위수를 넘기면 같은 요청을 하나 더 보냅니다.
+    "hedge_requests": False,
+    "hedge_percentile": 0.95,
+    # 업로드 전처리: 긴 변의 최대 길이(0이면 줄이지 않음), 형식(JPEG/WEBP/PNG), JPEG/WEBP 품질
+    "upload_max_edge": DEFAULT_UPLOAD_MAX_EDGE,
+    "upload_format": DEFAULT_UPLOAD_FORMAT,
+    "upload_quality": DEFAULT_UPLOAD_QUALITY,
+    # 결과물 저장: 형식(png/webp/raw), PNG 압축 수준, 작성기 스레드 수, 대기열 크기, fsync 여부
+    "output_format": DEFAULT_OUTPUT_FORMAT,
+    "png_compress_level": DEFAULT_PNG_COMPRESS_LEVEL,
+    "output_workers": DEFAULT_OUTPUT_WORKERS,
+    "output_queue_size": DEFAULT_OUTPUT_QUEUE_SIZE,
+    "output_fsync": True,
+    # 실행 중 결과물의 메모리 상한(MB). 넘으면 하위 노드가 다 쓴 결과물부터 임시 파일로 내보냅니다.
+    "output_memory_limit_mb": DEFAULT_MEMORY_LIMIT_MB,
+    # 실행 추적: 구간별 시간을 '<워크플로우>.trace.jsonl'로, Chrome 추적 형식을 '<워크플로우>.trace.json'으로 남길지
+    "trace_runs": False,
+    "chrome_trace": False,
+    # 같은 요청에 같은 결과를 원할 때: 동시에 진행 중인 똑같은 요청(모델, 프롬프트, 입력 이미지, 배치 번호가 같은 요청)을 하나로 합칩니다.
+    "deterministic_requests": False,
+    # 진행 지표: GUI 실행 중 Prometheus 텍스트 형식으로 주기적으로 다시 쓸 파일(빈 문자열이면 쓰지 않음, 상대 경로는 프로그램 폴더 기준)과 간격(초)
+    "metrics_file": "",
+    "metrics_interval_seconds": DEFAULT_METRICS_INTERVAL_SECONDS,
+    # 실행당 예산: API 호출 수, 업로드 MB, 실행 시간(분). 0이면 제한하지 않습니다.
+    # 예산이 부족해지면 시작한 배치만 끝내고 새 배치는 시작하지 않습니다.
+    "max_calls_per_run": 0,
+    "max_upload_mb_per_run": 0,
+    "max_minutes_per_run": 0,
+    # GUI에서 예상 API 호출 수가 이보다 많으면 실행 전에 확인을 받습니다. (0이면 묻지 않음)
+    "confirm_calls_above": 100,
+}
+
+
+def load_config(base_dir):
+    """base_dir의 config.json을 읽어 기본값 위에 덮어씁니다. 파일이 없으면 기본값을 그대로 씁니다."""
+    config = dict(DEFAULT_CONFIG)
+    path = os.path.join(base_dir, CONFIG_FILE)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+    return config
+
+
+def load_genai():
+    """google.generativeai 모듈입니다. 처음 부를 때만 실제로 불러옵니다."""
+    import google.generativeai as genai
+    return genai
+
+
+def warm_up(api_key=None, config=None):
+    """
+    백그라운드 스레드에서 SDK를 미리 불러오고, api_key가 있으면 클라이언트까지 만들어 둡니다.
+    창을 띄운 뒤에 부르면 사용자가 설정하는 동안 준비가 끝나 첫 요청을 기다리지 않고 보낼 수 있습니다.
+    """
+    def prepare():
+        try:
+            if api_key:
+                get_model_client(api_key, config)
+            else:
+                load_genai()
+            retryable_exceptions()
+        except Exception:
+            # 준비 중 오류는 실제로 실행할 때 다시 나며, 그때 사용자에게 보여줍니다.
+            pass
+
+    thread = threading.Thread(target=prepare, name="model-client-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+class ModelClient:
+    """
+    설정된 모델 하나와 전용 이벤트 루프를 묶은 클라이언트입니다.
+    어느 스레드에서든 run(코루틴)으로 이 루프에서 작업을 실행할 수 있습니다.
+    model을 넘기면 genai 설정 없이 그 객체(예: mock_model.MockGenerativeModel)를 모델로 씁니다.
+    """
+
+    def __init__(self, api_key, config=None, model=None):
+        config = dict(DEFAULT_CONFIG, **(config or {}))
+        if model is None:
+            genai = load_genai()
+            genai.configure(api_key=api_key)
+            model = genai.GenerativeModel(config["model_name"])
+        self.model = model
+        self.model_name = self.model.model_name
+        self.max_concurrent_requests = max(1, config["max_concurrent_requests"])
+        self.requests_per_minute = config["requests_per_minute"]
+        self.max_retries = config["max_retries"]
+        self.retry_base_delay = config["retry_base_delay"]
+        self.retry_max_delay = config["retry_max_delay"]
+        self.hedge_requests = config["hedge_requests"]
+        self.hedge_percentile = config["hedge_percentile"]
+        self.stats = RequestStats()
+
+        # 비동기 gRPC 채널은 만든 루프에 묶이므로, 루프 하나를 계속 살려두고 연결을 재사용합니다.
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        self._bucket = TokenBucket(config["requests_per_minute"] / 60.0, config["burst"])
+        self._latency = LatencyTracker()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="model-client-loop", daemon=True)
+        self._thread.start()
+
+    def run(self, coro):
+        """코루틴을 클라이언트의 이벤트 루프에서 실행하고 끝날 때까지 기다려 결과를 돌려줍니다."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def generate_image_async(self, contents, info=None, before_send=None):
+        """
+        이미지를 생성해 원본 바이트를 돌려줍니다.
+        재시도할 수 있는 오류(할당량 초과, 서버 오류, 이미지 없는 응답 등)는 max_retries번까지 다시 시도합니다.
+        info(dict)를 넘기면 이 요청의 재시도 횟수를 info["retries"]에 남깁니다.
+        before_send를 넘기면 재시도와 헤지를 포함해 요청을 실제로 보내기 직전마다 부릅니다. 여기서 예외가 나면 그 요청은 보내지 않습니다.
+        """
+        attempt = 0
+        while True:
+            if info is not None:
+                info["retries"] = attempt
+            try:
+                return await self._hedged_attempt(contents, before_send)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                self.stats.retries += 1
+                await asyncio.sleep(backoff_delay(attempt, self.retry_base_delay, self.retry_max_delay))
+                attempt += 1
+
+    def generate_image(self, contents):
+        """generate_image_async의 동기 버전입니다. 이벤트 루프 스레드가 아닌 곳에서만 호출해야 합니다."""
+        return self.run(self.generate_image_async(contents))
+
+    async def _attempt(self, contents, sent=None, before_send=None):
+        """속도 제한과 동시 요청 수 제한을 지켜 요청을 한 번 보냅니다. 실제로 보낸 순간 sent 이벤트를 켭니다."""
+        waited = await self._bucket.acquire()
+        if waited > 0:
+            self.stats.throttle_waits += 1
+            self.stats.throttle_seconds += waited
+
+        async with self._semaphore:
+            if before_send is not None:
+                before_send()
+            if sent is not None:
+                sent.set()
+            self.stats.requests += 1
+            started = time.monotonic()
+            response = await self.model.generate_content_async(contents)
+            self._latency.record(time.monotonic() - started)
+
+        image_data = extract_image_bytes(response)
+        if image_data is None:
+            raise NoImageError(f"모델이 이미지를 반환하지 않았습니다. 응답: {response_text(response)}")
+        return image_data
+
+    async def _hedged_attempt(self, contents, before_send=None):
+        """
+        헤지가 켜져 있으면, 보낸 요청이 최근 지연 시간의 백분위수 기준을 넘길 때 같은 요청을 하나 더 보내
+        먼저 성공한 응답을 씁니다. 남은 요청은 취소합니다.
+        """
+        sent = asyncio.Event()
+        tasks = [asyncio.ensure_future(self._attempt(contents, sent, before_send))]
+        try:
+            threshold = self._latency.percentile(self.hedge_percentile) if self.hedge_requests else None
+            if threshold is None:
+                return await tasks[0]
+
+            # 대기열에서 기다린 시간은 빼고, 실제로 요청을 보낸 뒤부터 시간을 잽니다.
+            sent_waiter = asyncio.ensure_future(sent.wait())
+            await asyncio.wait([tasks[0], sent_waiter], return_when=asyncio.FIRST_COMPLETED)
+            sent_waiter.cancel()
+            done, _ = await asyncio.wait(tasks, timeout=threshold)
+            if not done:
+                self.stats.hedges += 1
+                tasks.append(asyncio.ensure_future(self._attempt(contents, before_send=before_send)))
+
+            pending = set(tasks)
+            first_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self.stats.hedge_wins += 1
+                        return task.result()
+                    first_error = first_error or task.exception()
+            raise first_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def extract_image_bytes(response):
+    """응답에서 첫 번째 이미지 파트의 원본 바이트를 꺼냅니다. 이미지가 없으면 None입니다."""
+    if not response.candidates:
+        return None
+    for part in response.candidates[0].content.parts:
+        if part.inline_data:
+            return part.inline_data.data
+    return None
+
+
+def response_text(response):
+    """오류 메시지용 응답 텍스트입니다. 텍스트 파트가 없어 response.text가 실패하면 빈 문자열입니다."""
+    try:
+        return response.text
+    except ValueError:
+        return ""
+
+
+_clients_lock = threading.Lock()
+_clients = {}
+
+
+def get_model_client(api_key, config=None):
+    """
+    (API 키, 설정)마다 하나의 클라이언트를 만들어 재사용합니다.
+    GUI에서 파이프라인을 여러 번 실행해도 설정과 연결은 처음 한 번만 만들어집니다.
+    """
+    config = dict(DEFAULT_CONFIG, **(config or {}))
+    key = (api_key, json.dumps(config, sort_keys=True))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = ModelClient(api_key, config)
+            _clients[key] = client
+        return client
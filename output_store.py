@@ -0,0 +1,96 @@
+"""
+한 번의 실행 동안 노드 결과물(EncodedImage)을 메모리 상한 안에서 관리하는 저장소입니다.
+결과물마다 아직 그것을 입력으로 쓸 하위 노드(소비자)의 수를 세어, 소비자가 모두 끝난 결과물은
+디코딩된 픽셀을 놓고, 메모리 사용량이 상한을 넘으면 오래된 것부터 임시 파일로 내보냅니다(spill).
+소비자가 끝난 결과물만으로 상한 아래로 내려가지 않으면 아직 소비자가 남은 결과물도 내보내므로,
+병렬 배치가 많고 그래프가 넓어도 상한은 저장소의 모든 결과물에 적용됩니다.
+내보낸 결과물도 data를 읽으면 파일에서 다시 불러오므로 하위 노드의 입력이나 개별 노드 실행의 입력으로 그대로 쓸 수 있습니다.
+"""
+import threading
+from collections import OrderedDict
+
+# 저장소의 결과물을 메모리에 둘 최대 크기
+DEFAULT_MEMORY_LIMIT_MB = 512
+DEFAULT_MAX_MEMORY_BYTES = DEFAULT_MEMORY_LIMIT_MB * 1024 * 1024
+
+
+def memory_limit_from_config(config):
+    """config.json의 output_memory_limit_mb 값을 바이트로 바꿉니다."""
+    return int(config.get("output_memory_limit_mb", DEFAULT_MEMORY_LIMIT_MB) * 1024 * 1024)
+
+
+class OutputStore:
+    """
+    add()로 결과물과 소비자 수를 등록하고, 소비자가 입력을 다 쓰면 release()를 부릅니다.
+    keep=False인 결과물은 소비자가 모두 끝나면 저장소에서 빠지고(마지막 배치가 아닌 배치의 결과물),
+    keep=True인 결과물은 남겨두되 메모리 상한을 넘으면 spill 대상이 됩니다.
+    상한을 넘으면 소비자가 끝난 결과물을 먼저, 그래도 넘으면 소비자가 남은 결과물을 오래된 순서로 내보냅니다.
+    여러 스레드에서 동시에 사용할 수 있습니다.
+    """
+
+    def __init__(self, max_memory_bytes=DEFAULT_MAX_MEMORY_BYTES, spill_dir=None):
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dir = spill_dir
+        self.spilled = 0
+        self._lock = threading.Lock()
+        # 키 -> [결과물, 남은 소비자 수, keep]
+        self._entries = {}
+        # 소비자가 모두 끝나 내보낼 수 있는 결과물 (오래된 순서)
+        self._idle = OrderedDict()
+
+    def add(self, key, output, consumers, keep=True):
+        with self._lock:
+            self._entries[key] = [output, consumers, keep]
+            if consumers <= 0:
+                self._retire_locked(key)
+            self._enforce_locked()
+
+    def release(self, key):
+        """key 결과물의 소비자 하나가 입력을 다 썼음을 알립니다."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                self._retire_locked(key)
+                self._enforce_locked()
+
+    def resident_bytes(self):
+        with self._lock:
+            return self._resident_locked()
+
+    def _resident_locked(self):
+        return sum(output.resident_bytes() for output, _, _ in self._entries.values())
+
+    def _retire_locked(self, key):
+        output, _, keep = self._entries[key]
+        if not keep:
+            # 작성기가 아직 쓰고 있다면 작성기가 참조를 놓을 때 메모리에서 사라집니다.
+            del self._entries[key]
+            return
+        output.release_pixels()
+        self._idle[key] = output
+
+    def _enforce_locked(self):
+        # 아직 소비자가 남은 결과물은 곧 다시 읽히므로 소비자가 끝난 결과물부터 내보냅니다.
+        resident = self._resident_locked()
+        while resident > self.max_memory_bytes and self._idle:
+            _, output = self._idle.popitem(last=False)
+            if not output.spilled:
+                resident -= self._spill_locked(output)
+        if resident <= self.max_memory_bytes:
+            return
+        # 그래도 넘으면 소비자가 남은 결과물도 오래된 순서로 내보냅니다. 하위 노드가 입력을 읽을 때 파일에서 다시 불러옵니다.
+        for output, consumers, _ in list(self._entries.values()):
+            if resident <= self.max_memory_bytes:
+                break
+            if consumers > 0 and not output.spilled:
+                resident -= self._spill_locked(output)
+
+    def _spill_locked(self, output):
+        """output을 내보내고 줄어든 메모리 크기를 돌려줍니다."""
+        before = output.resident_bytes()
+        output.spill(self.spill_dir)
+        self.spilled += 1
+        return before
@@ -0,0 +1,148 @@
+"""
+생성된 이미지를 백그라운드 스레드에서 파일로 쓰는 출력 작성기입니다.
+PNG 압축처럼 시간이 걸리는 인코딩이 다음 API 호출을 막지 않도록, 쓰기 작업은 제한된 크기의 대기열을 거쳐
+작업자 스레드에서 처리됩니다. 실행이 끝날 때 flush()로 모든 파일이 디스크에 기록될 때까지 기다립니다.
+"""
+import hashlib
+import io
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from run_trace import NULL_TRACER
+
+# png: PNG로 다시 인코딩 (compress_level 적용)
+# webp: 무손실 WebP로 다시 인코딩
+# raw: 모델이 돌려준 바이트를 디코딩/재인코딩 없이 그대로 저장
+# (png 형식이라도 모델이 이미 PNG를 돌려줬다면 다시 인코딩하지 않고 그대로 씁니다.)
+OUTPUT_FORMATS = ("png", "webp", "raw")
+
+DEFAULT_OUTPUT_FORMAT = "png"
+DEFAULT_PNG_COMPRESS_LEVEL = 6
+DEFAULT_OUTPUT_WORKERS = 2
+DEFAULT_OUTPUT_QUEUE_SIZE = 32
+
+MIME_EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+}
+
+
+def writer_options_from_config(config):
+    """config.json 값에서 OutputWriter 생성 인자를 만듭니다."""
+    return dict(
+        output_format=config.get("output_format", DEFAULT_OUTPUT_FORMAT),
+        png_compress_level=config.get("png_compress_level", DEFAULT_PNG_COMPRESS_LEVEL),
+        max_workers=config.get("output_workers", DEFAULT_OUTPUT_WORKERS),
+        max_pending=config.get("output_queue_size", DEFAULT_OUTPUT_QUEUE_SIZE),
+        fsync=config.get("output_fsync", True),
+    )
+
+
+class OutputWriter:
+    """
+    submit()으로 쓰기 작업을 맡기고 flush()로 완료를 기다립니다.
+    대기 중인 작업이 max_pending개에 이르면 submit()은 자리가 날 때까지 기다립니다.
+    """
+
+    def __init__(self, output_format=DEFAULT_OUTPUT_FORMAT, png_compress_level=DEFAULT_PNG_COMPRESS_LEVEL,
+                 max_workers=DEFAULT_OUTPUT_WORKERS, max_pending=DEFAULT_OUTPUT_QUEUE_SIZE, fsync=True, tracer=NULL_TRACER):
+        output_format = output_format.lower()
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"지원하지 않는 출력 형식입니다: {output_format} (가능한 값: {', '.join(OUTPUT_FORMATS)})")
+        self.output_format = output_format
+        self.png_compress_level = png_compress_level
+        self.fsync = fsync
+        self.tracer = tracer
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="output-writer")
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Lock()
+        self._futures = []
+        self._directories = set()
+
+    def extension_for(self, encoded):
+        if self.output_format == "raw":
+            return MIME_EXTENSIONS.get(encoded.mime_type, ".png")
+        return "." + self.output_format
+
+    def submit(self, path_stem, encoded, on_written=None, trace_args=None):
+        """
+        path_stem(확장자 제외 경로)에 EncodedImage를 쓰도록 예약하고 최종 파일 경로를 돌려줍니다.
+        on_written(최종 경로, 파일 내용의 SHA-256)은 파일이 디스크에 완전히 기록된 뒤 작업자 스레드에서 호출됩니다.
+        trace_args는 이 쓰기 작업의 추적 구간(save)에 함께 기록할 정보입니다.
+        """
+        final_path = path_stem + self.extension_for(encoded)
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._write, final_path, encoded, on_written, trace_args or {})
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        with self._lock:
+            self._futures.append(future)
+            self._directories.add(os.path.dirname(final_path))
+        return final_path
+
+    def _write(self, final_path, encoded, on_written=None, trace_args=None):
+        with self.tracer.span("save", lane=threading.current_thread().name, **(trace_args or {})) as span:
+            if self.output_format == "raw" or (self.output_format == "png" and encoded.mime_type == "image/png"):
+                # 이미 원하는 형식이므로 디코딩/재인코딩 없이 그대로 씁니다.
+                data = encoded.data
+                span["reencoded"] = False
+            else:
+                buffer = io.BytesIO()
+                if self.output_format == "png":
+                    encoded.image.save(buffer, format="PNG", compress_level=self.png_compress_level)
+                else:
+                    encoded.image.save(buffer, format="WEBP", lossless=True)
+                data = buffer.getvalue()
+                span["reencoded"] = True
+            span["bytes"] = len(data)
+
+            # 쓰는 도중에 중단되어도 깨진 파일이 남지 않도록 임시 파일에 쓴 뒤 이름을 바꿉니다.
+            # 여러 프로세스/컴퓨터가 같은 출력 폴더에 쓸 수 있으므로 임시 파일 이름에 컴퓨터 이름, PID, 스레드를 넣습니다.
+            tmp_path = f"{final_path}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, final_path)
+        if on_written is not None:
+            on_written(final_path, hashlib.sha256(data).hexdigest())
+
+    def flush(self):
+        """
+        지금까지 맡긴 모든 쓰기 작업이 끝날 때까지 기다립니다(배리어).
+        fsync가 켜져 있으면 폴더 항목까지 디스크에 기록하며, 실패한 작업이 있으면 첫 오류를 다시 발생시킵니다.
+        """
+        with self._lock:
+            futures, self._futures = self._futures, []
+            directories, self._directories = self._directories, set()
+
+        first_error = None
+        for future in futures:
+            error = future.exception()
+            if error is not None and first_error is None:
+                first_error = error
+
+        if self.fsync and hasattr(os, "O_DIRECTORY"):
+            for directory in directories:
+                fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+        if first_error is not None:
+            raise first_error
+
+    def close(self):
+        """남은 작업을 모두 기록하고 작업자 스레드를 정리합니다."""
+        try:
+            self.flush()
+        finally:
+            self._pool.shutdown(wait=True)
@@ -0,0 +1,675 @@
+"""
+Tkinter와 분리된 파이프라인 실행 엔진입니다.
+워크플로우 JSON(save_workflow가 저장하는 형식), 기본 이미지, 시스템 프롬프트 JSON을 받아
+GUI 없이도 파이프라인을 실행할 수 있습니다.
+
+명령줄 사용 예:
+    python -m pipeline_engine --workflow workflows/sample.json --base-image char.png --system-prompt prompts/prompts_template.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+from functools import partial
+
+from model_client import get_model_client, load_config
+from rate_limit import format_request_stats
+from image_payload import EncodedImage, Payload, PayloadCache
+from output_store import DEFAULT_MAX_MEMORY_BYTES, OutputStore, memory_limit_from_config
+from output_writer import OutputWriter, writer_options_from_config
+from pipeline_graph import PipelineGraph, PREVIOUS_NODE, new_node_id, reference_digest, resolve_node_name, run_batches_async
+from prompt_template import compile_graph_prompts, compile_prompt
+from result_cache import ResultCache, make_cache_key
+from run_budget import MEGABYTE, RunBudget, node_upload_sizes, output_size_guess, plan_run
+from run_manifest import MANIFEST_SUFFIX, RunManifest, run_fingerprint
+from run_progress import DEFAULT_METRICS_INTERVAL_SECONDS, RunProgress, start_metrics_exporter
+from run_trace import CHROME_TRACE_SUFFIX, NODE_SPAN, NULL_TRACER, TRACE_SUFFIX, Tracer, format_trace_summary
+
+# API 키를 저장할 파일 이름
+API_KEY_FILE = "api_key.txt"
+
+def app_base_dir():
+    """프로그램의 기준 경로입니다. .exe로 실행되면 실행 파일 위치, 스크립트면 이 파일의 위치입니다."""
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(os.path.abspath(sys.executable))
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def safe_name(text):
+    """파일/폴더 이름에 쓸 수 있도록 영숫자, 공백, 밑줄만 남기고 공백은 밑줄로 바꿉니다."""
+    return "".join(c for c in text if c.isalnum() or c in (' ', '_')).rstrip().replace(' ', '_')
+
+
+def output_stem(node_name, index, batch_index, iterations):
+    """노드 결과물의 확장자를 뺀 파일 이름입니다. 배치 번호로만 정해지므로 실행 순서와 무관하게 항상 같습니다."""
+    safe_filename = safe_name(node_name)
+    if not safe_filename: safe_filename = f"node_{index + 1}"
+    if iterations > 1:
+        return f"{safe_filename}_batch{batch_index + 1}"
+    return safe_filename
+
+
+# --- 워크플로우 파일 형식 ---
+
+# 워크플로우 파일 형식의 버전. 1은 노드 dict의 리스트(부모를 이름으로 지정), 2는 노드 ID로 부모를 지정합니다.
+WORKFLOW_VERSION = 2
+
+
+def _legacy_node_id(index, node_data):
+    """
+    (버전 1 파일) ID가 없는 노드의 ID입니다. 같은 파일을 몇 번을 불러와도 같은 ID가 되도록 위치와 이름으로 정하므로,
+    ID가 들어가는 실행 지문이 바뀌지 않아 명령줄이나 작업 대기열에서 이어하기가 동작합니다.
+    """
+    return hashlib.sha256(f"{index}:{node_data.get('name', '')}".encode("utf-8")).hexdigest()[:12]
+
+
+def _node_spec_from_data(node_data, base_dir, node_id=None):
+    image_path = node_data.get("image_path", None)
+    if image_path and not os.path.isabs(image_path):
+        image_path = os.path.join(base_dir, image_path)
+    return {
+        "id": node_data.get("id") or node_id or new_node_id(),
+        "name": node_data.get("name", ""),
+        "prompt": node_data.get("prompt", ""),
+        "image_path": image_path,
+        "image_sha256": node_data.get("image_sha256"),
+        "parent": node_data.get("parent", PREVIOUS_NODE),
+        "parent_id": node_data.get("parent_id"),
+    }
+
+
+def _link_parents_by_name(node_specs):
+    """(버전 1 파일) 이름으로 지정된 부모를 노드 ID로 바꿔, 불러온 뒤에 이름을 바꿔도 연결이 유지되게 합니다."""
+    ids_by_name = {}
+    for i, spec in enumerate(node_specs):
+        ids_by_name.setdefault(resolve_node_name(spec["name"], i), []).append(spec["id"])
+    for spec in node_specs:
+        candidates = ids_by_name.get((spec["parent"] or "").strip(), [])
+        if len(candidates) == 1:
+            spec["parent_id"] = candidates[0]
+
+
+def workflow_from_data(workflow_data, base_dir):
+    """
+    워크플로우 JSON 데이터를 노드 spec 리스트로 바꿉니다. 상대 경로인 참조 이미지는 base_dir 기준 절대 경로로 바꿉니다.
+    버전 1(리스트) 파일도 읽으며, 이때 노드 위치와 이름으로 ID를 정하고 이름으로 지정된 부모를 ID로 연결합니다.
+    """
+    if isinstance(workflow_data, list):
+        node_specs = [_node_spec_from_data(node_data, base_dir, _legacy_node_id(i, node_data)) for i, node_data in enumerate(workflow_data)]
+        _link_parents_by_name(node_specs)
+        return node_specs
+    version = workflow_data.get("version")
+    if version != WORKFLOW_VERSION:
+        raise ValueError(f"지원하지 않는 워크플로우 파일 버전입니다: {version} (지원: {WORKFLOW_VERSION})")
+    return [_node_spec_from_data(node_data, base_dir) for node_data in workflow_data.get("nodes", [])]
+
+
+def workflow_to_data(node_specs, base_dir):
+    """
+    노드 spec 리스트를 저장용 JSON 데이터(버전 2)로 바꿉니다. 참조 이미지는 가능하면 base_dir 기준 상대 경로로 저장하고,
+    불러올 때 저장 이후 바뀌었는지 알 수 있도록 내용의 해시를 함께 남깁니다.
+    """
+    nodes = []
+    for spec in node_specs:
+        relative_image_path = None
+        if spec["image_path"]:
+            try:
+                relative_image_path = os.path.relpath(spec["image_path"], base_dir)
+            except ValueError:
+                # 다른 드라이브에 있는 경우 등 상대 경로 계산이 불가능하면 절대 경로 유지
+                relative_image_path = spec["image_path"]
+        nodes.append({
+            "id": spec.get("id") or new_node_id(),
+            "name": spec["name"],
+            "prompt": spec["prompt"],
+            "image_path": relative_image_path,
+            "image_sha256": reference_digest(spec["image_path"]) if spec["image_path"] else None,
+            "parent": spec["parent"],
+            "parent_id": spec.get("parent_id"),
+        })
+    return {"version": WORKFLOW_VERSION, "nodes": nodes}
+
+
+def changed_references(node_specs):
+    """저장할 때와 내용이 달라졌거나 없어진 참조 이미지를 가진 노드 이름 리스트입니다."""
+    return [
+        spec["name"] for spec in node_specs
+        if spec["image_path"] and spec.get("image_sha256") and reference_digest(spec["image_path"]) != spec["image_sha256"]
+    ]
+
+
+def load_workflow_file(filepath, base_dir):
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return workflow_from_data(json.load(f), base_dir)
+
+
+def save_workflow_file(filepath, node_specs, base_dir):
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(workflow_to_data(node_specs, base_dir), f, indent=2, ensure_ascii=False)
+
+
+def load_system_prompt_file(filepath):
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# --- 증분 실행 ---
+
+def global_signature(base_image_path, system_prompt_data):
+    """모든 노드에 영향을 주는 전역 설정(기본 이미지, 시스템 프롬프트)의 서명입니다."""
+    base_image_mtime = os.path.getmtime(base_image_path) if os.path.exists(base_image_path) else None
+    return (base_image_path, base_image_mtime, json.dumps(system_prompt_data, sort_keys=True, ensure_ascii=False))
+
+
+def plan_incremental_reuse(graph, node_signatures, last_signatures, last_outputs):
+    """
+    마지막 실행 이후 서명이 바뀌었거나 결과물이 없는 노드와 그 하위 노드를 제외한
+    나머지 노드의 {인덱스: 이전 결과물}을 돌려줍니다. 서명과 결과물 dict는 노드 ID를 키로 씁니다.
+    """
+    changed = [
+        i for i, node_id in enumerate(graph.ids)
+        if last_signatures.get(node_id) != node_signatures[node_id] or node_id not in last_outputs
+    ]
+    dirty = graph.descendants(changed)
+    return {i: last_outputs[graph.ids[i]] for i in range(len(graph)) if i not in dirty}
+
+
+class PipelineEngine:
+    """
+    파이프라인 한 번의 실행에 필요한 설정을 묶어 실행하는 엔진입니다.
+    on_event(command, data)로 진행 상황을 알립니다.
+      - ("update_status", 메시지)
+      - ("node_finished", (배치 인덱스, 노드 인덱스, 결과물 EncodedImage, 저장 경로))
+    위젯을 전혀 참조하지 않으므로 작업자 스레드나 GUI 없는 환경에서 안전하게 실행할 수 있습니다.
+    완료/전체 단위 수, 처리 속도, 남은 시간은 progress(RunProgress)에 기록하므로 다른 스레드에서 언제든 읽을 수 있습니다.
+    모델 호출은 공용 ModelClient의 이벤트 루프에서 비동기로 이루어지며,
+    파일 입출력과 해시 계산처럼 시간이 걸리는 동기 작업은 asyncio.to_thread로 넘깁니다.
+    노드 결과물은 모델이 돌려준 바이트를 그대로 담은 EncodedImage로 주고받으며, 픽셀은 필요할 때만 디코딩합니다.
+    """
+
+    def __init__(self, client, system_prompt_data, output_dir, result_cache=None, on_event=None, payloads=None,
+                 writer_options=None, output_memory_limit=DEFAULT_MAX_MEMORY_BYTES, spill_dir=None, trace=False, chrome_trace=False,
+                 deterministic=False, progress=None):
+        self.client = client
+        # 업로드 전처리 설정과 파일 인코딩 캐시 (실행 사이에 재사용하려면 같은 PayloadCache를 넘겨주세요)
+        self.payloads = payloads or PayloadCache()
+        # 결과물 파일 형식과 백그라운드 쓰기 설정 (OutputWriter 생성 인자)
+        self.writer_options = writer_options or {}
+        # 실행 중 결과물이 메모리에 머무를 수 있는 상한과, 넘칠 때 내보낼 폴더 (None이면 시스템 임시 폴더)
+        self.output_memory_limit = output_memory_limit
+        self.spill_dir = spill_dir
+        # 실행 추적 파일(JSON Lines)과 Chrome 추적 파일을 결과물 폴더 옆에 남길지
+        self.trace = trace
+        self.chrome_trace = chrome_trace
+        # 같은 요청에 같은 결과를 원하면, 동시에 진행 중인 똑같은 요청(모델, 프롬프트, 입력 이미지, 배치 번호가 같은 요청)을
+        # API 호출 하나로 합칩니다. 같은 부모와 프롬프트를 가진 형제 노드가 대표적입니다.
+        self.deterministic = deterministic
+        # 진행 중인 요청 키 -> 결과를 기다리는 Future (클라이언트 이벤트 루프에서만 씁니다)
+        self._inflight = {}
+        self.coalesced = 0
+        self.system_prompt = system_prompt_data.get("prompt", "")
+        self.output_dir = output_dir
+        self.result_cache = result_cache
+        self.on_event = on_event or (lambda command, data: None)
+        # 진행 상황 (엔진을 복사해 여러 입력을 실행하는 스윕에서는 복사본들이 함께 씁니다)
+        self.progress = progress or RunProgress()
+        # 마지막 실행 동안의 요청/재시도/속도 제한 대기/헤지 횟수 (RequestStats.since 형식)
+        self.last_request_stats = None
+        # 마지막 실행의 추적기(구간 기록 전체)와 노드별 실행 시간 요약 (Tracer.node_summary 형식)
+        self.last_tracer = None
+        self.last_trace_summary = None
+
+    def workflow_output_dir(self, workflow_name):
+        path = os.path.join(self.output_dir, safe_name(workflow_name))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _payloads(self, input_value, reference_path):
+        """입력(Payload 또는 EncodedImage)과 참조 이미지 파일을 업로드용 Payload 리스트로 전처리합니다."""
+        payloads = [input_value if isinstance(input_value, Payload) else self.payloads.encoded_payload(input_value)]
+        if reference_path:
+            payloads.append(self.payloads.file_payload(reference_path))
+        return payloads
+
+    async def generate_image(self, prompt, input_value, reference_path, use_cache=True, variant=0, tracer=NULL_TRACER, lane="main",
+                             ticket=None):
+        """
+        프롬프트(PromptTemplate)와 입력/참조 이미지로 이미지를 생성하고, 모델이 돌려준 원본 바이트를 돌려줍니다.
+        같은 모델, 프롬프트, 업로드 이미지, variant(배치 번호) 조합의 결과가 캐시에 있으면 API를 호출하지 않습니다.
+        use_cache가 False이면 캐시를 읽지 않고 새로 생성한 결과로 캐시를 갱신합니다.
+        deterministic 엔진에서는 같은 조합의 요청이 이미 진행 중이면 새로 보내지 않고 그 결과를 함께 받습니다.
+        각 단계(업로드 전처리, 캐시 조회, 생성 요청, 캐시 저장)는 tracer의 lane에 구간으로 기록됩니다.
+        ticket(BatchTicket)을 주면 재시도와 헤지를 포함해 API를 실제로 호출하기 직전마다 예산을 쓰고, 받은 결과물의 크기를 예산에 알립니다.
+        """
+        with tracer.span("payloads", lane) as span:
+            payloads = await asyncio.to_thread(self._payloads, input_value, reference_path)
+            span["bytes"] = sum(len(payload.data) for payload in payloads)
+
+        request_key = make_cache_key(self.client.model_name, prompt.digest, [payload.digest for payload in payloads], variant)
+        if not self.deterministic:
+            return await self._generate_uncoalesced(request_key, prompt, payloads, use_cache, tracer, lane, ticket)
+
+        pending = self._inflight.get(request_key)
+        if pending is not None:
+            self.coalesced += 1
+            with tracer.span("coalesced", lane):
+                # 이 노드가 취소되어도 먼저 보낸 요청은 계속 진행되도록 shield로 기다립니다.
+                return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[request_key] = future
+        try:
+            image_data = await self._generate_uncoalesced(request_key, prompt, payloads, use_cache, tracer, lane, ticket)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 기다리는 요청이 없어도 '처리되지 않은 예외' 경고가 남지 않도록 표시해 둡니다.
+            future.exception()
+            raise
+        else:
+            future.set_result(image_data)
+            return image_data
+        finally:
+            del self._inflight[request_key]
+
+    async def _generate_uncoalesced(self, cache_key, prompt, payloads, use_cache, tracer, lane, ticket=None):
+        image_data = None
+        if self.result_cache is not None and use_cache:
+            with tracer.span("cache_lookup", lane) as span:
+                image_data = await asyncio.to_thread(self.result_cache.get, cache_key)
+                span["hit"] = image_data is not None
+
+        if image_data is None:
+            contents = [prompt.text] + [payload.as_part() for payload in payloads]
+            # 재시도와 헤지도 업로드를 다시 하는 실제 호출이므로, 보낼 때마다 예산을 씁니다.
+            before_send = partial(ticket.charge, sum(len(payload.data) for payload in payloads)) if ticket is not None else None
+
+            # 재시도, 속도 제한, 헤지는 클라이언트가 처리합니다.
+            with tracer.span("generate", lane) as span:
+                image_data = await self.client.generate_image_async(contents, info=span, before_send=before_send)
+                span["bytes"] = len(image_data)
+            if self.result_cache is not None:
+                with tracer.span("cache_store", lane):
+                    await asyncio.to_thread(self.result_cache.put, cache_key, image_data)
+
+        if ticket is not None:
+            ticket.observe_output(len(image_data))
+        return image_data
+
+    def _open_tracer(self, workflow_name, suffix=""):
+        """실행 하나의 추적기를 만듭니다. 구간은 항상 메모리에 모으고, trace가 켜져 있으면 파일에도 씁니다."""
+        trace_path = os.path.join(self.output_dir, safe_name(workflow_name) + suffix + TRACE_SUFFIX) if self.trace else None
+        return Tracer(trace_path)
+
+    def _close_tracer(self, tracer, workflow_name, suffix=""):
+        tracer.close()
+        if self.chrome_trace:
+            tracer.write_chrome_trace(os.path.join(self.output_dir, safe_name(workflow_name) + suffix + CHROME_TRACE_SUFFIX))
+        self.last_tracer = tracer
+        self.last_trace_summary = tracer.node_summary()
+
+    def manifest_path(self, workflow_name, suffix=""):
+        """실행 매니페스트 경로입니다. 결과물 폴더 옆에 '<폴더 이름><suffix>.manifest.jsonl'로 둡니다."""
+        return os.path.join(self.output_dir, safe_name(workflow_name) + suffix + MANIFEST_SUFFIX)
+
+    def run_fingerprint(self, graph, base_image_path):
+        """이 엔진으로 graph를 실행할 때 매니페스트에 남는 실행 설정의 지문입니다."""
+        return run_fingerprint(self.client.model_name, self.system_prompt, base_image_path,
+                               [graph.node_signature(i) for i in range(len(graph))])
+
+    def run(self, graph, base_image_path, workflow_name, iterations=1, parallel_batches=1, use_cache=True, reuse=None, resume=False,
+            batch_range=None, budget=None):
+        """
+        전체 파이프라인을 iterations번 실행하고 마지막 배치의 결과물 dict({노드 ID: EncodedImage})를 돌려줍니다.
+        reuse({노드 인덱스: EncodedImage})에 있는 노드는 다시 실행하지 않고 이전 결과물을 사용합니다.
+        이전 결과물은 배치마다 다르므로 reuse는 배치가 하나인 실행에서만 쓸 수 있습니다. 그렇지 않으면 ValueError입니다.
+        resume이 True이면 같은 설정으로 중단된 실행의 매니페스트를 읽어, 이미 끝난 (배치, 노드)는 건너뜁니다.
+        batch_range((시작, 끝))를 주면 그 범위의 배치만 실행합니다(여러 작업자가 배치를 나눠 실행할 때).
+        이때 매니페스트는 범위마다 따로 두며, 마지막 배치가 범위에 없으면 빈 dict를 돌려줍니다.
+        budget(RunBudget)을 주면 남은 예산으로 끝낼 수 있는 배치만 시작하고, 시작하지 않은 배치는 budget.refused_batches에 남습니다.
+        """
+        return self.client.run(self.run_async(graph, base_image_path, workflow_name, iterations, parallel_batches, use_cache, reuse, resume,
+                                              batch_range, budget))
+
+    async def run_async(self, graph, base_image_path, workflow_name, iterations=1, parallel_batches=1, use_cache=True, reuse=None,
+                        resume=False, batch_range=None, budget=None):
+        workflow_output_dir = self.workflow_output_dir(workflow_name)
+        reuse = reuse or {}
+        if reuse and iterations > 1:
+            raise ValueError("증분 실행(reuse)은 배치가 하나인 실행에서만 쓸 수 있습니다.")
+        batch_indices = range(*batch_range) if batch_range else range(iterations)
+        manifest_suffix = f"_batch{batch_indices.start + 1}-{batch_indices.stop}" if batch_range else ""
+        manifest = await asyncio.to_thread(RunManifest.open, self.manifest_path(workflow_name, manifest_suffix),
+                                           self.run_fingerprint(graph, base_image_path), resume,
+                                           self.writer_options.get("fsync", True))
+        if resume and manifest.completed:
+            self.on_event("update_status", f"이전 실행에서 완료된 {len(manifest.completed)}개 결과물을 이어서 사용합니다.")
+        tracer = self._open_tracer(workflow_name, manifest_suffix)
+        writer = OutputWriter(tracer=tracer, **self.writer_options)
+        store = OutputStore(self.output_memory_limit, self.spill_dir)
+        for i, output in reuse.items():
+            # 재사용하는 결과물은 모든 배치의 (재사용되지 않는) 자식 노드가 입력으로 씁니다.
+            consumers = sum(1 for child in graph.children[i] if child not in reuse) * len(batch_indices)
+            store.add(("reuse", i), output, consumers)
+        # 프롬프트는 실행마다 한 번만 만들어 모든 배치가 함께 씁니다.
+        prompts = compile_graph_prompts(self.system_prompt, graph)
+        self.progress.add_planned(graph.names[i] for _ in batch_indices for i in range(len(graph)) if i not in reuse)
+        run_batch = partial(self._run_batch, graph, prompts, base_image_path, iterations, workflow_output_dir, use_cache, reuse, writer,
+                            store, manifest, tracer)
+        if budget is not None:
+            budget.start()
+            base_payload = await asyncio.to_thread(self.payloads.file_payload, base_image_path)
+            reuse_payloads = {i: await asyncio.to_thread(self.payloads.encoded_payload, output) for i, output in reuse.items()}
+            upload_sizes = await asyncio.to_thread(node_upload_sizes, self.payloads, graph, base_payload, reuse_payloads)
+            output_guess = await asyncio.to_thread(output_size_guess, base_payload)
+            run_batch = partial(self._run_budgeted_batch, graph, iterations, reuse, manifest, budget, upload_sizes, output_guess, run_batch)
+        stats_before = self.client.stats.snapshot()
+        try:
+            # 배치마다 독립된 결과물 dict를 쓰므로 여러 배치를 동시에 실행할 수 있습니다.
+            batch_results = await run_batches_async(run_batch, batch_indices, max_parallel=parallel_batches)
+        finally:
+            # 실패한 실행이라도 이미 끝난 결과물은 모두 디스크에 기록하고 매니페스트에 남긴 뒤 마칩니다.
+            try:
+                await asyncio.to_thread(writer.close)
+            finally:
+                manifest.close()
+                await asyncio.to_thread(self._close_tracer, tracer, workflow_name, manifest_suffix)
+            self.last_request_stats = self.client.stats.since(stats_before)
+            self.on_event("update_status", format_request_stats(self.last_request_stats))
+        return batch_results.get(iterations - 1, {})
+
+    async def _run_budgeted_batch(self, graph, iterations, reuse, manifest, budget, upload_sizes, output_guess, run_batch, batch_index):
+        """
+        예산 안에서 배치 하나를 실행합니다. 이 배치에서 실행할 노드가 모두 API를 호출한다고 보고 예산을 예약하며,
+        남은 예산으로 끝낼 수 없으면 시작하지 않습니다. 부모 결과물을 업로드하는 노드는 지금까지 받은 결과물 크기로 어림합니다.
+        배치가 끝나면 쓰지 않은 예약(캐시 재사용 등)은 돌려받습니다.
+        """
+        pending = [i for i in range(len(graph)) if i not in reuse and not manifest.is_done(batch_index, i)]
+        if not pending:
+            return await run_batch(batch_index)
+        ticket = budget.admit_batch(batch_index, len(pending), budget.estimate_upload([upload_sizes[i] for i in pending], output_guess))
+        if ticket is None:
+            self.progress.unplan(graph.names[i] for i in pending)
+            self.on_event("update_status", f"--- 배치 {batch_index + 1}/{iterations}: 예산이 부족해 시작하지 않음 ---")
+            return {}
+        completed = False
+        try:
+            result = await run_batch(batch_index, ticket=ticket)
+            completed = True
+            return result
+        finally:
+            budget.finish_batch(ticket, completed)
+
+    async def _run_batch(self, graph, prompts, base_image_path, iterations, workflow_output_dir, use_cache, reuse, writer, store, manifest, tracer,
+                         batch_index, ticket=None):
+        """
+        배치 하나를 실행합니다. 마지막 배치는 결과물 dict를 돌려주고,
+        나머지 배치의 결과물은 하위 노드가 모두 쓰고 나면 바로 놓으므로 빈 dict를 돌려줍니다.
+        매니페스트에 완료로 기록된 노드는 실행하지 않고 저장된 결과물 파일을 입력으로 씁니다.
+        """
+        keep = batch_index == iterations - 1
+        finished = [i for i in range(len(graph)) if i not in reuse and manifest.is_done(batch_index, i)]
+        if not keep and len(finished) + len(reuse) == len(graph):
+            # 결과물을 돌려줄 필요가 없는 배치가 모두 끝나 있으면 파일도 읽지 않고 건너뜁니다.
+            for i in finished:
+                self.progress.skip(graph.names[i])
+            self.on_event("update_status", f"--- 배치 {batch_index + 1}/{iterations}: 이미 완료됨, 건너뜀 ---")
+            return {}
+        self.on_event("update_status", f"--- 배치 {batch_index + 1}/{iterations} 시작 ---")
+
+        # 기본 이미지는 파일 단위로 캐시된 업로드용 Payload를 그대로 입력으로 씁니다.
+        base_payload = await asyncio.to_thread(self.payloads.file_payload, base_image_path)
+
+        # 이 배치에서 실행하지 않을 노드: 전체 실행의 reuse + 매니페스트에서 이어받은 결과물
+        batch_reuse = dict(reuse)
+        for i in finished:
+            output = await asyncio.to_thread(manifest.load_output, batch_index, i)
+            if output is not None:
+                batch_reuse[i] = output
+                self.progress.skip(graph.names[i])
+        for i in batch_reuse.keys() - reuse.keys():
+            consumers = sum(1 for child in graph.children[i] if child not in batch_reuse)
+            await asyncio.to_thread(store.add, (batch_index, i), batch_reuse[i], consumers, keep)
+            if keep:
+                self.on_event("node_finished", (batch_index, i, batch_reuse[i], manifest.completed[(batch_index, i)]["path"]))
+
+        batch_outputs = {}
+        if keep:
+            for i, output in batch_reuse.items():
+                batch_outputs[graph.ids[i]] = output
+
+        async def run_node(i, input_value):
+            node_spec = graph.node_specs[i]
+            node_name = graph.names[i]
+            lane = f"배치 {batch_index + 1} / {node_name}"
+            self.on_event("update_status", f"배치 {batch_index + 1}/{iterations} - 노드 '{node_name}' 실행 중...")
+
+            with self.progress.track(node_name), tracer.span(NODE_SPAN, lane, batch=batch_index, node=node_name):
+                # 1. API 호출 (입력 이미지는 스케줄러가 부모 노드의 결과물로 전달)
+                image_data = await self.generate_image(prompts[i], input_value, node_spec["image_path"], use_cache, variant=batch_index,
+                                                       tracer=tracer, lane=lane, ticket=ticket)
+                # 입력을 다 썼으므로 부모 결과물의 소비자 수를 줄입니다.
+                input_value = None
+                parent = graph.parents[i]
+                if parent is not None:
+                    await asyncio.to_thread(store.release, ("reuse", parent) if parent in reuse else (batch_index, parent))
+                # 디코딩하지 않고 바이트 그대로 다음 노드와 작성기에 넘깁니다.
+                output = EncodedImage(image_data)
+
+                # 2. 결과물 저장 (백그라운드 작성기에 맡기고 바로 다음 노드로 넘어갑니다)
+                #    파일이 디스크에 기록되면 매니페스트에 완료로 남깁니다.
+                path_stem = os.path.join(workflow_output_dir, output_stem(node_name, i, batch_index, iterations))
+                on_written = partial(manifest.record, batch_index, i, node_name)
+                with tracer.span("write_queue", lane):
+                    final_path = await asyncio.to_thread(writer.submit, path_stem, output, on_written,
+                                                         {"batch": batch_index, "node": node_name})
+
+                # 3. 결과물을 개별 노드 실행을 위해 기록 (마지막 배치만)
+                consumers = sum(1 for child in graph.children[i] if child not in batch_reuse)
+                await asyncio.to_thread(store.add, (batch_index, i), output, consumers, keep)
+                if keep:
+                    batch_outputs[graph.ids[i]] = output
+            self.on_event("node_finished", (batch_index, i, output, final_path))
+            return output
+
+        # 부모가 준비된 노드부터 동시에 실행
+        await graph.run_async(run_node, base_payload, reuse=batch_reuse)
+        return batch_outputs
+
+    def run_single_node(self, graph, index, node_outputs, base_image_path, workflow_name, use_cache=True):
+        """
+        지정된 노드 하나만 실행합니다. 입력은 node_outputs({노드 ID: EncodedImage})에 남아 있는 이전 실행 결과물을 사용하며,
+        새 결과물도 node_outputs에 기록합니다. (결과물 EncodedImage, 저장 경로)를 돌려줍니다.
+        """
+        node_name = graph.names[index]
+        node_spec = graph.node_specs[index]
+
+        # 1. 입력 이미지 결정 (전역 기본 이미지이거나, 캐시된 부모 노드의 결과물)
+        parent = graph.parents[index]
+        if parent is None:
+            input_value = self.payloads.file_payload(base_image_path)
+        else:
+            parent_id = graph.ids[parent]
+            if parent_id not in node_outputs:
+                raise ValueError(f"입력으로 지정된 '{graph.names[parent]}'의 결과물을 찾을 수 없습니다. 먼저 전체 파이프라인이나 해당 노드를 실행해주세요.")
+            input_value = node_outputs[parent_id]
+
+        # 2. API 호출
+        tracer = self._open_tracer(workflow_name, "_single")
+        lane = f"개별 실행 / {node_name}"
+        writer = OutputWriter(tracer=tracer, **self.writer_options)
+        try:
+            with tracer.span(NODE_SPAN, lane, node=node_name):
+                self.on_event("update_status", f"개별 노드 '{node_name}' 실행 중...")
+                # 전체 실행과 같은 프롬프트를 쓰므로 전체 실행 때 캐시된 결과를 그대로 재사용할 수 있습니다.
+                prompt = compile_prompt(self.system_prompt, node_spec["prompt"])
+                image_data = self.client.run(self.generate_image(prompt, input_value, node_spec["image_path"], use_cache, tracer=tracer, lane=lane))
+                output = EncodedImage(image_data)
+
+                # 3. 결과 저장 및 캐시 업데이트
+                path_stem = os.path.join(self.workflow_output_dir(workflow_name), f"{safe_name(node_name)}_single") # 단일 실행임을 표시
+                final_path = writer.submit(path_stem, output, trace_args={"node": node_name})
+        finally:
+            try:
+                writer.close()
+            finally:
+                self._close_tracer(tracer, workflow_name, "_single")
+
+        node_outputs[graph.ids[index]] = output
+        return output, final_path
+
+
+# --- 명령줄 실행 ---
+
+def read_api_key(args):
+    if args.api_key:
+        return args.api_key
+    if os.environ.get("GOOGLE_API_KEY"):
+        return os.environ["GOOGLE_API_KEY"]
+    if os.path.exists(API_KEY_FILE):
+        with open(API_KEY_FILE, 'r') as f: return f.read().strip()
+    return None
+
+
+def add_run_arguments(parser):
+    """기본 이미지를 뺀 실행 인자(워크플로우, 시스템 프롬프트, 출력/캐시/모델 설정)를 parser에 추가합니다."""
+    base_dir = app_base_dir()
+    parser.add_argument("--workflow", required=True, help="워크플로우 JSON 파일 (GUI의 '워크플로우 저장' 형식)")
+    parser.add_argument("--system-prompt", required=True, help="시스템 프롬프트 JSON 파일 (prompts/prompts_template.json 형식)")
+    parser.add_argument("--output-dir", default=os.path.join(base_dir, "img"), help="결과물을 저장할 폴더 (기본값: img)")
+    parser.add_argument("--name", help="결과물 하위 폴더 이름 (기본값: 워크플로우 파일 이름)")
+    parser.add_argument("--batches", type=int, default=1, help="전체 파이프라인 반복 횟수")
+    parser.add_argument("--parallel-batches", type=int, default=1, help="동시에 실행할 최대 배치 수")
+    parser.add_argument("--model", help="사용할 모델 이름 (기본값: config.json의 model_name)")
+    parser.add_argument("--max-concurrent-requests", type=int, help="동시에 보낼 최대 API 요청 수 (기본값: config.json의 max_concurrent_requests)")
+    parser.add_argument("--cache-dir", default=os.path.join(base_dir, "cache"), help="결과 캐시 폴더")
+    parser.add_argument("--no-cache", action="store_true", help="캐시를 무시하고 모든 노드를 새로 생성합니다")
+    parser.add_argument("--trace", action="store_true", help="구간별 실행 시간을 '<출력 폴더>/<이름>.trace.jsonl'에 기록합니다")
+    parser.add_argument("--chrome-trace", action="store_true", help="Chrome 추적 형식 파일 '<출력 폴더>/<이름>.trace.json'도 씁니다")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="같은 입력에는 같은 결과를 씁니다. 동시에 진행 중인 똑같은 요청을 API 호출 하나로 합칩니다")
+    parser.add_argument("--metrics-file", help="진행 지표를 Prometheus 텍스트 형식으로 주기적으로 다시 쓸 파일 (node exporter textfile collector용)")
+    parser.add_argument("--metrics-interval", type=float, default=DEFAULT_METRICS_INTERVAL_SECONDS, help="진행 지표 파일을 다시 쓰는 간격 (초)")
+    parser.add_argument("--max-calls", type=int, help="이 실행의 최대 API 호출 수 (기본값: config.json의 max_calls_per_run, 0이면 제한 없음)")
+    parser.add_argument("--max-upload-mb", type=float, help="이 실행의 최대 업로드 크기 MB (기본값: config.json의 max_upload_mb_per_run)")
+    parser.add_argument("--max-minutes", type=float,
+                        help="이 실행의 최대 실행 시간 분. 시작한 배치는 끝까지 실행하므로 조금 넘을 수 있습니다 (기본값: config.json의 max_minutes_per_run)")
+    parser.add_argument("--api-key", help="Google AI Studio API 키 (기본값: GOOGLE_API_KEY 환경 변수 또는 api_key.txt)")
+    return parser
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(prog="python -m pipeline_engine", description="Bananafy 워크플로우를 GUI 없이 실행합니다.")
+    parser.add_argument("--base-image", required=True, help="전역 기본 이미지 파일")
+    parser.add_argument("--resume", action="store_true", help="같은 설정으로 중단된 실행을 이어서, 이미 끝난 배치/노드는 건너뜁니다")
+    parser.add_argument("--plan-only", action="store_true", help="예상 API 호출 수와 업로드 크기만 출력하고 실행하지 않습니다")
+    return add_run_arguments(parser)
+
+
+def print_event(command, data):
+    """명령줄 실행에서 엔진 이벤트를 출력합니다."""
+    if command == "update_status":
+        print(data, flush=True)
+    elif command == "node_finished":
+        print(f"  저장됨: {data[3]}", flush=True)
+
+
+def engine_from_args(args, on_event=print_event):
+    """
+    add_run_arguments()로 받은 인자로 (엔진, 그래프, 결과물 이름)을 만듭니다.
+    API 키가 없거나 워크플로우/시스템 프롬프트를 읽을 수 없으면 ValueError(또는 OSError)입니다.
+    """
+    api_key = read_api_key(args)
+    if not api_key:
+        raise ValueError("API 키가 없습니다. --api-key, GOOGLE_API_KEY 환경 변수 또는 api_key.txt를 사용하세요.")
+
+    # 워크플로우 안의 상대 경로는 GUI와 마찬가지로 프로그램 기준 경로를 기준으로 해석합니다.
+    node_specs = load_workflow_file(args.workflow, app_base_dir())
+    graph = PipelineGraph(node_specs)
+    system_prompt_data = load_system_prompt_file(args.system_prompt)
+
+    config = load_config(app_base_dir())
+    if args.model:
+        config["model_name"] = args.model
+    if args.max_concurrent_requests:
+        config["max_concurrent_requests"] = args.max_concurrent_requests
+
+    engine = PipelineEngine(
+        get_model_client(api_key, config), system_prompt_data, args.output_dir,
+        result_cache=ResultCache(args.cache_dir), on_event=on_event, payloads=PayloadCache.from_config(config),
+        writer_options=writer_options_from_config(config), output_memory_limit=memory_limit_from_config(config),
+        trace=args.trace or config["trace_runs"], chrome_trace=args.chrome_trace or config["chrome_trace"],
+        deterministic=args.deterministic or config["deterministic_requests"]
+    )
+    workflow_name = args.name or os.path.splitext(os.path.basename(args.workflow))[0]
+    return engine, graph, workflow_name
+
+
+def metrics_exporter_from_args(args, engine, workflow_name):
+    """--metrics-file을 주었으면 engine의 진행 상황을 내보내는 MetricsExporter를 시작해 돌려주고, 아니면 None입니다."""
+    return start_metrics_exporter(args.metrics_file, engine.progress, engine.client, {"workflow": workflow_name}, args.metrics_interval)
+
+
+def budget_from_args(args):
+    """--max-calls, --max-upload-mb, --max-minutes(주지 않으면 config.json 값)로 RunBudget을 만듭니다."""
+    config = load_config(app_base_dir())
+    return RunBudget(
+        config["max_calls_per_run"] if args.max_calls is None else args.max_calls,
+        (config["max_upload_mb_per_run"] if args.max_upload_mb is None else args.max_upload_mb) * MEGABYTE,
+        (config["max_minutes_per_run"] if args.max_minutes is None else args.max_minutes) * 60,
+    )
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+
+    try:
+        engine, graph, workflow_name = engine_from_args(args)
+    except (OSError, ValueError) as e:
+        print(f"오류: {e}", file=sys.stderr)
+        return 1
+
+    iterations = max(1, args.batches)
+    try:
+        plan = plan_run(engine, graph, args.base_image, workflow_name, iterations, use_cache=not args.no_cache, resume=args.resume)
+    except (OSError, ValueError) as e:
+        print(f"오류: {e}", file=sys.stderr)
+        return 1
+    print(plan.describe())
+    if args.plan_only:
+        return 0
+
+    budget = budget_from_args(args)
+    exporter = metrics_exporter_from_args(args, engine, workflow_name)
+    try:
+        engine.run(graph, args.base_image, workflow_name, iterations=iterations,
+                   parallel_batches=max(1, args.parallel_batches), use_cache=not args.no_cache, resume=args.resume,
+                   budget=budget if budget.limited else None)
+    except Exception as e:
+        print(f"파이프라인 실행 중 오류가 발생했습니다: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if exporter is not None:
+            exporter.close()
+        print(engine.progress.describe())
+        if budget.limited:
+            print(budget.describe())
+
+    if budget.refused_batches:
+        print(f"예산이 부족해 배치 {len(budget.refused_batches)}개를 실행하지 않았습니다. "
+              "예산을 늘리고 --resume으로 다시 실행하면 남은 배치를 이어서 실행합니다.", file=sys.stderr)
+        return 1
+    print(f"파이프라인 실행 완료! 총 {len(graph) * iterations}개의 이미지가 저장되었습니다. "
+          f"(캐시 재사용 {engine.result_cache.hits}개, 중복 요청 병합 {engine.coalesced}개)")
+    print("노드별 실행 시간:")
+    for line in format_trace_summary(engine.last_trace_summary):
+        print(f"  {line}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+파이프라인 노드의 '입력' 연결을 의존성 그래프(DAG)로 변환하고,
+준비된 노드부터 asyncio 태스크로 병렬 실행하는 스케줄러입니다.
+노드는 이름이 아니라 바뀌지 않는 노드 ID로 서로를 가리키므로, 노드 이름을 바꿔도 입력 연결이 끊기지 않습니다.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import uuid
+
+# 부모 선택 드롭다운의 특수 항목
+PREVIOUS_NODE = "이전 노드"
+GLOBAL_INPUT = "전역 기본 이미지"
+
+
+class PipelineGraphError(ValueError):
+    """누락된 부모, 순환 참조 등 실행 전에 발견된 그래프 오류입니다."""
+
+
+def new_node_id():
+    """새 노드의 ID입니다. 워크플로우 파일에 저장되어 이름을 바꾸거나 노드 순서를 바꿔도 유지됩니다."""
+    return uuid.uuid4().hex[:12]
+
+
+# 참조 이미지 경로 -> (수정 시각(ns), 크기, sha256). 파일이 바뀌지 않았으면 다시 읽지 않습니다.
+_reference_digests = {}
+_reference_digests_lock = threading.Lock()
+
+
+def reference_digest(path):
+    """참조 이미지 파일 내용의 sha256입니다. 파일이 없으면 None입니다."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = os.path.abspath(path)
+    with _reference_digests_lock:
+        cached = _reference_digests.get(key)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+    with _reference_digests_lock:
+        _reference_digests[key] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+def resolve_node_name(name, index):
+    """노드 이름을 정리하고, 비어 있으면 실행 시 사용하는 기본 이름을 돌려줍니다."""
+    name = (name or "").strip()
+    return name if name else f"이름없는_노드_{index + 1}"
+
+
+class PipelineGraph:
+    """
+    노드 spec 리스트를 한 번에 인덱스 기반 노드 표로 바꿉니다.
+    노드 ID, 부모 인덱스, 위상 정렬 순서, 참조 이미지 해시를 미리 계산해 두므로 실행 중에는 이름으로 찾지 않습니다.
+    부모가 None인 노드는 전역 기본 이미지를 입력으로 사용합니다.
+    spec에 parent_id가 있으면 그 ID의 노드가 부모이고, 없으면 parent(이름, '이전 노드', '전역 기본 이미지')로 찾습니다.
+    id가 없는 spec(명령줄로 만든 워크플로우 등)은 노드 이름을 ID로 씁니다.
+    참조 이미지가 없는 노드가 있으면 실행하기 전에 PipelineGraphError가 납니다.
+    """
+
+    def __init__(self, node_specs):
+        self.node_specs = list(node_specs)
+        self.names = [resolve_node_name(spec.get("name"), i) for i, spec in enumerate(self.node_specs)]
+        self.ids = []
+        self.index_of = {}
+        for i, (spec, name) in enumerate(zip(self.node_specs, self.names)):
+            node_id = spec.get("id")
+            if not node_id:
+                # ID가 없으면 이름을 ID로 쓰고, 같은 이름이 이미 있으면 순서 번호를 붙입니다.
+                node_id = name if name not in self.index_of else f"{name}#{i + 1}"
+            elif node_id in self.index_of:
+                raise PipelineGraphError(f"노드 '{name}'의 ID '{node_id}'가 다른 노드와 겹칩니다. 워크플로우 파일을 확인해주세요.")
+            self.ids.append(node_id)
+            self.index_of[node_id] = i
+        self.parents = self._resolve_parents()
+        self.reference_digests = self._reference_digests()
+        self.children = [[] for _ in self.node_specs]
+        for i, parent in enumerate(self.parents):
+            if parent is not None:
+                self.children[parent].append(i)
+        self.order = self._topological_order()
+
+    def __len__(self):
+        return len(self.node_specs)
+
+    def _resolve_parents(self):
+        """부모 선택 값을 노드 인덱스로 변환합니다. 존재하지 않는 부모는 즉시 오류입니다."""
+        name_to_indices = {}
+        for i, name in enumerate(self.names):
+            name_to_indices.setdefault(name, []).append(i)
+
+        parents = []
+        for i, spec in enumerate(self.node_specs):
+            parent_id = spec.get("parent_id")
+            if parent_id:
+                if parent_id not in self.index_of:
+                    raise PipelineGraphError(f"노드 '{self.names[i]}'의 입력으로 지정된 노드(ID '{parent_id}')가 존재하지 않습니다.")
+                parents.append(self.index_of[parent_id])
+                continue
+            selection = (spec.get("parent") or PREVIOUS_NODE).strip()
+            if selection == PREVIOUS_NODE:
+                parents.append(i - 1 if i > 0 else None)
+            elif selection == GLOBAL_INPUT:
+                parents.append(None)
+            else:
+                candidates = name_to_indices.get(selection)
+                if not candidates:
+                    raise PipelineGraphError(f"노드 '{self.names[i]}'의 입력으로 지정된 '{selection}' 노드가 존재하지 않습니다.")
+                if len(candidates) > 1:
+                    raise PipelineGraphError(f"노드 '{self.names[i]}'의 입력 '{selection}'과(와) 같은 이름의 노드가 여러 개 있습니다. 노드 이름을 구분해주세요.")
+                parents.append(candidates[0])
+        return parents
+
+    def _reference_digests(self):
+        digests = []
+        for i, spec in enumerate(self.node_specs):
+            image_path = spec.get("image_path")
+            digest = reference_digest(image_path) if image_path else None
+            if image_path and digest is None:
+                raise PipelineGraphError(f"노드 '{self.names[i]}'의 참조 이미지 '{image_path}'를 찾을 수 없습니다.")
+            digests.append(digest)
+        return digests
+
+    def _topological_order(self):
+        """Kahn 알고리즘으로 실행 순서를 구합니다. 같은 깊이에서는 원래 목록 순서를 유지합니다."""
+        order = [i for i, parent in enumerate(self.parents) if parent is None]
+        cursor = 0
+        while cursor < len(order):
+            order.extend(self.children[order[cursor]])
+            cursor += 1
+
+        if len(order) != len(self.node_specs):
+            visited = set(order)
+            cycle_names = [self.names[i] for i in range(len(self.node_specs)) if i not in visited]
+            raise PipelineGraphError(f"노드 입력 연결에 순환이 있습니다: {', '.join(cycle_names)}")
+        return order
+
+    def node_signature(self, index):
+        """
+        노드 결과물에 영향을 주는 설정(이름, 실제 부모, 보조 프롬프트, 참조 이미지 내용)을 튜플로 돌려줍니다.
+        이전 실행 때의 값과 다르면 그 노드는 다시 실행해야 합니다.
+        """
+        spec = self.node_specs[index]
+        parent = self.parents[index]
+        parent_id = GLOBAL_INPUT if parent is None else self.ids[parent]
+        return (self.names[index], parent_id, spec.get("prompt", ""), self.reference_digests[index])
+
+    def descendants(self, indices):
+        """주어진 노드들과, 그 결과물을 직간접적으로 입력으로 쓰는 모든 하위 노드의 인덱스 집합입니다."""
+        result = set()
+        stack = list(indices)
+        while stack:
+            index = stack.pop()
+            if index in result:
+                continue
+            result.add(index)
+            stack.extend(self.children[index])
+        return result
+
+    async def run_async(self, run_node, root_input, reuse=None):
+        """
+        코루틴 run_node(index, input_value)를 의존성 순서에 맞춰 실행합니다.
+        부모가 끝난 노드는 곧바로 태스크로 시작되고, 부모의 출력이 자식의 input_value로 전달됩니다.
+        reuse({인덱스: 출력})에 있는 노드는 실행하지 않고 그 출력을 그대로 사용합니다.
+        출력을 모아두지 않으므로, 필요한 출력은 run_node가 직접 기록해야 합니다.
+        한 노드라도 실패하면 나머지 노드를 취소하고 그 오류를 다시 발생시킵니다.
+        """
+        reuse = reuse or {}
+
+        async def run_subtree(index, input_value):
+            output = await run_node(index, input_value)
+            # 하위 트리가 끝날 때까지 부모/자신의 출력을 붙잡고 있지 않도록 참조를 바로 놓습니다.
+            input_value = None
+            subtrees = [run_subtree(child, output) for child in self.children[index] if child not in reuse]
+            output = None
+            await gather_or_cancel(subtrees)
+
+        starts = []
+        for index in self.order:
+            if index in reuse:
+                continue
+            parent = self.parents[index]
+            if parent is None:
+                starts.append(run_subtree(index, root_input))
+            elif parent in reuse:
+                starts.append(run_subtree(index, reuse[parent]))
+        await gather_or_cancel(starts)
+
+
+async def gather_or_cancel(coros):
+    """
+    코루틴들을 동시에 실행하고 결과 리스트를 돌려줍니다.
+    asyncio.gather와 달리, 하나가 실패하면 남은 태스크를 모두 취소하고 정리한 뒤 첫 오류를 발생시킵니다.
+    """
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def run_batches_async(run_batch, batch_indices, max_parallel=1):
+    """
+    batch_indices(예: range(iterations))의 배치마다 코루틴 run_batch(batch_index)를 실행하고 {배치 인덱스: 결과} dict를 돌려줍니다.
+    동시에 진행되는 배치는 최대 max_parallel개입니다. 배치 하나가 실패하면 나머지는 취소됩니다.
+    """
+    batch_indices = list(batch_indices)
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+
+    async def limited(batch_index):
+        async with semaphore:
+            return await run_batch(batch_index)
+
+    results = await gather_or_cancel([limited(batch_index) for batch_index in batch_indices])
+    return dict(zip(batch_indices, results))
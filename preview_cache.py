@@ -0,0 +1,76 @@
+"""
+GUI 미리보기용 작은 이미지(썸네일)를 만들고 캐시합니다.
+원본 전체를 디코딩하지 않도록 JPEG은 draft 모드로 필요한 크기에 가깝게만 읽고,
+같은 파일(경로, 수정 시각, 크기)이나 같은 결과물 바이트의 미리보기는 한 번만 만듭니다.
+render()는 Tk를 전혀 건드리지 않으므로 작업자 스레드에서 호출할 수 있습니다.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from image_payload import EncodedImage
+
+# 미리보기 이미지의 고정 높이 (픽셀)
+PREVIEW_HEIGHT = 150
+
+# 메모리에 남겨둘 미리보기의 최대 개수
+DEFAULT_MAX_PREVIEWS = 256
+
+
+class PreviewCache:
+    """이미지 파일 경로, EncodedImage, PIL 이미지로부터 높이가 고정된 미리보기를 만들어 캐시합니다."""
+
+    def __init__(self, height=PREVIEW_HEIGHT, max_entries=DEFAULT_MAX_PREVIEWS):
+        self.height = height
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._previews = OrderedDict()
+
+    def _identity(self, source):
+        """캐시 키입니다. PIL 이미지처럼 내용을 싸게 식별할 수 없으면 None입니다."""
+        if isinstance(source, str):
+            stat = os.stat(source)
+            return ("file", os.path.abspath(source), stat.st_mtime_ns, stat.st_size)
+        if isinstance(source, EncodedImage):
+            return ("encoded", hashlib.sha256(source.data).hexdigest())
+        return None
+
+    def render(self, source):
+        """미리보기용 PIL 이미지를 돌려줍니다. 원본 높이가 0이면 None입니다."""
+        identity = self._identity(source)
+        if identity is not None:
+            with self._lock:
+                preview = self._previews.get(identity)
+                if preview is not None:
+                    self._previews.move_to_end(identity)
+                    return preview
+
+        if isinstance(source, str):
+            with Image.open(source) as image:
+                preview = self._shrink(image)
+        elif isinstance(source, EncodedImage):
+            with Image.open(io.BytesIO(source.data)) as image:
+                preview = self._shrink(image)
+        else:
+            preview = self._shrink(source)
+
+        if identity is not None and preview is not None:
+            with self._lock:
+                self._previews[identity] = preview
+                while len(self._previews) > self.max_entries:
+                    self._previews.popitem(last=False)
+        return preview
+
+    def _shrink(self, image):
+        img_w, img_h = image.size
+        if img_h == 0:
+            return None
+        new_h = self.height
+        new_w = max(1, int(new_h * img_w / img_h))
+        # JPEG은 목표 크기에 가까운 축소 배율로만 디코딩합니다. (다른 형식에서는 아무 일도 하지 않습니다)
+        image.draft(image.mode if image.mode in ("RGB", "L") else "RGB", (new_w, new_h))
+        return image.resize((new_w, new_h), Image.Resampling.LANCZOS, reducing_gap=3.0)
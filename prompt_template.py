@@ -0,0 +1,43 @@
+"""
+모델에 보내는 최종 프롬프트를 만드는 곳입니다.
+전체 실행과 개별 노드 실행이 같은 함수로 프롬프트를 만들므로, 같은 노드는 어느 경로로 실행해도 바이트 단위로 같은 요청이 되고
+결과 캐시와 중복 요청 병합이 두 경로에서 똑같이 동작합니다.
+프롬프트는 (시스템 프롬프트, 보조 프롬프트) 조합마다 한 번만 만들고 해시를 함께 계산해 둡니다.
+"""
+import hashlib
+from functools import lru_cache
+
+INSTRUCTIONAL_PREFIX = "You are an image generation pipeline. Follow the user's instructions precisely. Generate a single image as the output. Do not respond with text."
+
+# 미리 만들어 둘 (시스템 프롬프트, 보조 프롬프트) 조합 수
+PROMPT_CACHE_SIZE = 4096
+
+
+def canonical_text(text):
+    """줄바꿈을 \\n으로 통일하고 줄 끝과 앞뒤 공백을 지웁니다. 편집기나 OS에 따라 달라지는 부분만 정리합니다."""
+    lines = (text or "").replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def build_full_prompt(system_prompt, aux_prompt, instructional_prefix=INSTRUCTIONAL_PREFIX):
+    return f"{instructional_prefix}\n\n## System Prompt:\n{system_prompt}\n\n## User Instruction for this step:\n{aux_prompt}"
+
+
+class PromptTemplate:
+    """완성된 프롬프트 문자열(text)과 그 sha256 해시(digest)입니다. 캐시 키와 중복 요청 판별에는 digest를 씁니다."""
+    __slots__ = ("text", "digest")
+
+    def __init__(self, text):
+        self.text = text
+        self.digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def compile_prompt(system_prompt, aux_prompt):
+    """시스템 프롬프트와 노드의 보조 프롬프트로 PromptTemplate을 만듭니다. 같은 조합은 한 번만 만듭니다."""
+    return PromptTemplate(build_full_prompt(canonical_text(system_prompt), canonical_text(aux_prompt)))
+
+
+def compile_graph_prompts(system_prompt, graph):
+    """graph의 노드 인덱스 순서대로 PromptTemplate 리스트를 만듭니다."""
+    return [compile_prompt(system_prompt, spec.get("prompt", "")) for spec in graph.node_specs]
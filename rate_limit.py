@@ -0,0 +1,118 @@
+"""
+모델 요청의 속도 제한, 재시도, 헤지(hedged request)에 쓰는 도구 모음입니다.
+모두 ModelClient의 이벤트 루프 안에서만 사용하므로 별도의 스레드 잠금은 없습니다.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def retryable_exceptions():
+    """
+    잠시 후 다시 시도하면 성공할 수 있는 오류들입니다.
+    google.api_core는 grpc까지 불러오므로 프로그램 시작이 아니라 처음 오류를 판별할 때 불러옵니다.
+    """
+    from google.api_core import exceptions as google_exceptions
+    return (
+        google_exceptions.TooManyRequests,
+        google_exceptions.ResourceExhausted,
+        google_exceptions.InternalServerError,
+        google_exceptions.BadGateway,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.GatewayTimeout,
+        google_exceptions.DeadlineExceeded,
+        asyncio.TimeoutError,
+        ConnectionError,
+    )
+
+
+class NoImageError(ValueError):
+    """모델 응답에 이미지(inline_data)가 없을 때 발생합니다. 다시 요청하면 대개 해결되므로 재시도 대상입니다."""
+
+
+def is_retryable(error):
+    return isinstance(error, (NoImageError,) + retryable_exceptions())
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """attempt번째 재시도 전에 기다릴 시간입니다. 지수적으로 늘어나는 상한 안에서 무작위로 고릅니다(full jitter)."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+class TokenBucket:
+    """
+    초당 rate개의 토큰이 채워지고 최대 capacity개까지 쌓이는 토큰 버킷입니다.
+    요청마다 토큰 하나를 쓰며, 토큰이 없으면 채워질 때까지 기다립니다.
+    rate가 0 이하이면 제한하지 않습니다.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """토큰 하나를 얻고, 기다린 시간(초)을 돌려줍니다."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+
+class LatencyTracker:
+    """최근 요청의 지연 시간을 기록해 백분위수를 계산합니다."""
+
+    def __init__(self, window=200, min_samples=20):
+        self._samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, fraction):
+        """표본이 min_samples개보다 적으면 None을 돌려줍니다."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class RequestStats:
+    """요청, 재시도, 속도 제한 대기, 헤지 횟수를 셉니다."""
+
+    FIELDS = ("requests", "retries", "throttle_waits", "throttle_seconds", "hedges", "hedge_wins")
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+    def snapshot(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def since(self, snapshot):
+        """snapshot 이후 늘어난 값들을 dict로 돌려줍니다."""
+        return {field: getattr(self, field) - snapshot[field] for field in self.FIELDS}
+
+
+def format_request_stats(stats):
+    """since()가 돌려준 dict를 상태 표시줄용 한 줄 요약으로 만듭니다."""
+    return (
+        f"요청 {stats['requests']}회, 재시도 {stats['retries']}회, "
+        f"속도 제한 대기 {stats['throttle_waits']}회({stats['throttle_seconds']:.1f}초), "
+        f"헤지 {stats['hedges']}회(채택 {stats['hedge_wins']}회)"
+    )
@@ -0,0 +1,124 @@
+"""
+generate_content 결과를 디스크에 저장해두는 내용 주소 기반(content-addressed) 캐시입니다.
+모델 이름, 최종 프롬프트의 해시, 업로드하는 입력/참조 이미지 바이트의 해시를 키로 사용하고,
+전체 크기가 상한을 넘으면 가장 오래 사용하지 않은 항목부터 지웁니다(LRU).
+"""
+import hashlib
+import os
+import socket
+import threading
+import time
+
+# 캐시 디렉터리의 기본 최대 크기 (바이트)
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+CACHE_FILE_SUFFIX = ".img"
+
+
+def make_cache_key(model_name, prompt_digest, image_digests, variant=0):
+    """
+    모델 이름, 프롬프트 해시(PromptTemplate.digest), 이미지 해시 목록(순서 포함)으로 캐시 키를 만듭니다.
+    variant는 같은 요청의 서로 다른 생성 결과(배치 번호)를 구분합니다.
+    """
+    hasher = hashlib.sha256()
+    for field in [model_name, prompt_digest, *image_digests, str(variant)]:
+        encoded = field.encode("utf-8")
+        # 필드 경계가 섞이지 않도록 길이를 함께 기록합니다.
+        hasher.update(len(encoded).to_bytes(8, "big"))
+        hasher.update(encoded)
+    return hasher.hexdigest()
+
+
+class ResultCache:
+    """
+    생성된 이미지의 원본 바이트를 키별 파일로 저장하는 캐시입니다.
+    여러 작업자 스레드에서 동시에 사용할 수 있습니다.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 키 -> [크기, 마지막 사용 시각]
+        self._entries = {}
+        self._total_bytes = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._scan()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_FILE_SUFFIX)
+
+    def _scan(self):
+        """프로그램 시작 시 디렉터리를 훑어 항목 크기와 마지막 사용 시각(mtime)을 읽어옵니다."""
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(CACHE_FILE_SUFFIX):
+                stat = entry.stat()
+                key = entry.name[:-len(CACHE_FILE_SUFFIX)]
+                self._entries[key] = [stat.st_size, stat.st_mtime]
+                self._total_bytes += stat.st_size
+
+    def get(self, key):
+        """캐시된 바이트를 돌려주고, 없으면 None을 돌려줍니다."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry[1] = time.time()
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+            # 마지막 사용 시각을 파일에도 남겨 다음 실행에서도 LRU 순서가 유지되게 합니다.
+            os.utime(self._path(key))
+        except OSError:
+            with self._lock:
+                if self._entries.pop(key, None) is not None:
+                    self._total_bytes -= entry[0]
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def peek(self, key):
+        """get()과 같지만 적중/실패 횟수와 마지막 사용 시각을 바꾸지 않습니다. 실행 계획을 세울 때 씁니다."""
+        with self._lock:
+            if key not in self._entries:
+                return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key, data):
+        """바이트를 저장하고, 최대 크기를 넘으면 오래된 항목부터 지웁니다."""
+        path = self._path(key)
+        # 같은 캐시 폴더를 여러 프로세스/컴퓨터가 함께 쓰므로 임시 파일 이름에 컴퓨터 이름, PID, 스레드를 넣습니다.
+        tmp_path = f"{path}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._total_bytes -= previous[0]
+            self._entries[key] = [len(data), time.time()]
+            self._total_bytes += len(data)
+            self._evict_locked()
+
+    def _evict_locked(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key, (size, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            del self._entries[key]
+            self._total_bytes -= size
@@ -0,0 +1,291 @@
+"""
+실행 전에 API 호출 수와 업로드 바이트를 미리 세어 보고(plan_run), 실행 중에는 호출 수, 업로드 바이트, 실행 시간 상한을 지키는(RunBudget) 곳입니다.
+예산이 부족해지면 이미 시작한 배치는 끝까지 실행하고, 남은 예산으로 끝낼 수 없는 새 배치는 시작하지 않습니다.
+반쯤 끝난 배치를 여러 개 남기는 대신 완성된 배치만 남기므로, 예산을 늘려 '이어하기'로 실행하면 나머지 배치부터 실행합니다.
+"""
+import io
+import time
+
+from PIL import Image
+
+from image_payload import EncodedImage
+from prompt_template import compile_graph_prompts
+from result_cache import make_cache_key
+from run_manifest import RunManifest
+from run_progress import format_duration
+
+MEGABYTE = 1024 * 1024
+
+# 하위 노드의 업로드를 어림할 때 지금까지 본 가장 큰 결과물 크기에 곱하는 여유
+OUTPUT_ESTIMATE_MARGIN = 1.25
+
+
+class BudgetExceededError(RuntimeError):
+    """예약을 넘는 요청(재시도, 헤지)을 보낼 예산이 남아 있지 않을 때 그 요청을 보내지 않고 냅니다."""
+
+
+def format_size(num_bytes):
+    if num_bytes >= MEGABYTE / 10:
+        return f"{num_bytes / MEGABYTE:.1f}MB"
+    return f"{num_bytes / 1024:.0f}KB"
+
+
+class RunPlan:
+    """
+    실행 하나의 예상치입니다. calls는 실제로 API를 호출할 것으로 보이는 요청 수이고,
+    캐시에 결과가 있는 요청(cache_hits), 진행 중인 같은 요청과 합쳐질 요청(coalesced),
+    이전 실행에서 이어받을 결과물(resumed), 증분 실행으로 재사용할 결과물(reused)은 호출하지 않습니다.
+    """
+
+    def __init__(self, iterations):
+        self.iterations = iterations
+        self.calls = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.resumed = 0
+        self.reused = 0
+        self.upload_bytes = 0
+        # 배치별 예상 호출 수
+        self.batch_calls = [0] * iterations
+        # 분당 요청 수 제한으로 계산한 최소 실행 시간(초). 제한이 없으면 None입니다.
+        self.minimum_seconds = None
+
+    def describe(self):
+        text = (f"예상 API 호출 {self.calls}회 (배치 {self.iterations}개, 재시도/헤지 제외), 업로드 최대 약 {format_size(self.upload_bytes)}"
+                f" - 캐시 재사용 {self.cache_hits}개, 이어받기 {self.resumed}개, 재사용 {self.reused}개")
+        if self.coalesced:
+            text += f", 중복 요청 병합 {self.coalesced}개"
+        if self.minimum_seconds:
+            text += f" - 속도 제한 기준 최소 {format_duration(self.minimum_seconds)}"
+        return text
+
+
+def node_upload_sizes(payloads, graph, base_payload, reuse_payloads=None):
+    """
+    노드별 요청 하나의 (입력 바이트, 참조 이미지 바이트)입니다.
+    입력이 이번 실행에서 만들어질 부모 결과물이면 실행 전에는 크기를 알 수 없으므로 입력 바이트는 None입니다.
+    """
+    reuse_payloads = reuse_payloads or {}
+    sizes = []
+    for i, spec in enumerate(graph.node_specs):
+        parent = graph.parents[i]
+        if parent is None:
+            input_bytes = len(base_payload.data)
+        elif parent in reuse_payloads:
+            input_bytes = len(reuse_payloads[parent].data)
+        else:
+            input_bytes = None
+        reference_bytes = len(payloads.file_payload(spec["image_path"]).data) if spec.get("image_path") else 0
+        sizes.append((input_bytes, reference_bytes))
+    return sizes
+
+
+def output_size_guess(base_payload):
+    """
+    모델 결과물을 아직 하나도 보지 못했을 때 쓰는 결과물 크기 어림치입니다.
+    결과물(대개 PNG)은 업로드할 때 다시 압축하지 않고 그대로 보내므로, 기본 이미지와 같은 해상도의 압축하지 않은 RGBA 크기로 넉넉하게 잡습니다.
+    """
+    with Image.open(io.BytesIO(base_payload.data)) as header:
+        width, height = header.size
+    return width * height * 4
+
+
+def plan_run(engine, graph, base_image_path, workflow_name, iterations=1, use_cache=True, reuse=None, resume=False):
+    """
+    engine으로 graph를 iterations번 실행할 때의 RunPlan을 만듭니다. API는 호출하지 않습니다.
+    입력을 실행 전에 알 수 있는 요청(기본 이미지를 입력으로 받거나, 부모의 결과가 캐시에 있는 요청)만 캐시를 확인하고,
+    나머지는 호출하는 것으로 셉니다. 따라서 호출 수는 실제보다 많게 나올 수는 있어도 적게 나오지는 않습니다.
+    """
+    reuse = reuse or {}
+    plan = RunPlan(iterations)
+    payloads = engine.payloads
+    prompts = compile_graph_prompts(engine.system_prompt, graph)
+    base_payload = payloads.file_payload(base_image_path)
+    references = {i: payloads.file_payload(spec["image_path"]) for i, spec in enumerate(graph.node_specs) if spec.get("image_path")}
+    reuse_payloads = {i: payloads.encoded_payload(output) for i, output in reuse.items()}
+    output_guess = output_size_guess(base_payload)
+    completed = {}
+    if resume:
+        completed = RunManifest.read_completed(engine.manifest_path(workflow_name), engine.run_fingerprint(graph, base_image_path)) or {}
+    predict_cache = use_cache and engine.result_cache is not None
+
+    for batch_index in range(iterations):
+        # 노드 인덱스 -> 하위 노드에 넘겨질 업로드용 Payload (실행 전에 알 수 있는 경우만)
+        known = dict(reuse_payloads)
+        requests = set()
+        for i in graph.order:
+            if i in reuse:
+                plan.reused += 1
+                continue
+            if (batch_index, i) in completed:
+                plan.resumed += 1
+                continue
+            parent = graph.parents[i]
+            input_payload = base_payload if parent is None else known.get(parent)
+            reference = references.get(i)
+            if input_payload is not None:
+                digests = [input_payload.digest] + ([reference.digest] if reference else [])
+                cache_key = make_cache_key(engine.client.model_name, prompts[i].digest, digests, batch_index)
+                data = engine.result_cache.peek(cache_key) if predict_cache else None
+                if data is not None:
+                    plan.cache_hits += 1
+                    known[i] = payloads.encoded_payload(EncodedImage(data))
+                    continue
+                request = cache_key
+            else:
+                # 입력을 모르는 요청은 (부모, 프롬프트, 참조 이미지)가 같으면 같은 요청입니다.
+                request = (parent, prompts[i].digest, reference.digest if reference else None)
+            if engine.deterministic and request in requests:
+                plan.coalesced += 1
+                continue
+            requests.add(request)
+            plan.calls += 1
+            plan.batch_calls[batch_index] += 1
+            if input_payload is not None:
+                plan.upload_bytes += len(input_payload.data) + (len(reference.data) if reference else 0)
+            else:
+                plan.upload_bytes += output_guess + (len(reference.data) if reference else 0)
+
+    requests_per_minute = engine.client.requests_per_minute
+    if requests_per_minute > 0:
+        plan.minimum_seconds = plan.calls / requests_per_minute * 60
+    return plan
+
+
+class BatchTicket:
+    """RunBudget이 시작을 허락한 배치 하나입니다. 배치의 요청은 이 티켓으로 예산을 씁니다."""
+
+    def __init__(self, budget, calls, upload_bytes):
+        self.budget = budget
+        self.reserved_calls = calls
+        self.reserved_bytes = upload_bytes
+        self.started = time.monotonic()
+
+    def charge(self, upload_bytes):
+        """재시도와 헤지를 포함해 API 요청 하나를 실제로 보내기 직전마다 부릅니다. 보낼 예산이 없으면 BudgetExceededError를 냅니다."""
+        self.budget.charge(self, upload_bytes)
+
+    def observe_output(self, num_bytes):
+        """이 배치에서 받은 결과물의 크기를 알려, 이후 배치의 업로드 어림치에 반영합니다."""
+        self.budget.observe_output(num_bytes)
+
+
+class RunBudget:
+    """
+    실행 하나의 예산입니다. max_calls(API 호출 수), max_upload_bytes(업로드 바이트), max_seconds(실행 시간) 중 0이나 None은 제한하지 않습니다.
+    배치를 시작할 때마다 그 배치의 요청마다 호출 한 번과 예상 업로드 바이트를 예약하고, 남은 예산으로 부족하거나
+    실행 시간이 모자라면 그 배치와 이후 배치를 시작하지 않습니다.
+    호출 수는 재시도와 헤지를 포함해 실제로 보낸 요청마다 셉니다. 예약을 넘는 요청(재시도, 헤지)은 예약되지 않은 예산이 남아 있을 때만 보내고,
+    없으면 보내지 않고 BudgetExceededError로 그 요청을 실패시키므로 호출 수는 상한을 넘지 않습니다.
+    업로드는 어림치이므로 결과물이 지금까지보다 훨씬 크면 상한을 조금 넘을 수 있습니다.
+    실행 시간은 배치를 시작할 때만 확인하는 느슨한 상한입니다. 앞선 배치의 평균 실행 시간으로 새 배치가 시간 안에 끝날지 어림하지만,
+    처음 동시에 시작하는 배치들은 걸리는 시간을 모른 채 시작하고 시작한 배치는 끝까지 실행하므로 상한을 넘을 수 있습니다.
+    ModelClient의 이벤트 루프 안에서만 사용하므로 별도의 스레드 잠금은 없습니다.
+    """
+
+    def __init__(self, max_calls=None, max_upload_bytes=None, max_seconds=None):
+        self.max_calls = max_calls or None
+        self.max_upload_bytes = max_upload_bytes or None
+        self.max_seconds = max_seconds or None
+        self.started = None
+        self.used_calls = 0
+        self.used_bytes = 0
+        # 지금까지 받은 가장 큰 결과물 크기
+        self.largest_output = 0
+        # 예산이 부족해 시작하지 않은 배치 인덱스
+        self.refused_batches = []
+        # 예산이 부족해 보내지 않은 재시도/헤지 요청 수
+        self.refused_attempts = 0
+        self._tickets = set()
+        self._batch_seconds = []
+
+    @property
+    def limited(self):
+        return any((self.max_calls, self.max_upload_bytes, self.max_seconds))
+
+    def start(self):
+        """실행 시간을 재기 시작합니다. 여러 번 불러도 처음 한 번만 반영됩니다."""
+        if self.started is None:
+            self.started = time.monotonic()
+
+    def elapsed(self):
+        return time.monotonic() - self.started if self.started is not None else 0.0
+
+    def _remaining(self):
+        reserved_calls = sum(ticket.reserved_calls for ticket in self._tickets)
+        reserved_bytes = sum(ticket.reserved_bytes for ticket in self._tickets)
+        calls = self.max_calls - self.used_calls - reserved_calls if self.max_calls else None
+        upload_bytes = self.max_upload_bytes - self.used_bytes - reserved_bytes if self.max_upload_bytes else None
+        return calls, upload_bytes
+
+    def observe_output(self, num_bytes):
+        self.largest_output = max(self.largest_output, num_bytes)
+
+    def estimate_upload(self, sizes, output_guess):
+        """
+        sizes(node_upload_sizes()의 항목들)에 해당하는 요청들의 업로드 바이트를 어림합니다.
+        입력이 부모 결과물인 요청은 지금까지 본 가장 큰 결과물에 여유(OUTPUT_ESTIMATE_MARGIN)를 더해, 아직 본 적이 없으면 output_guess로 셉니다.
+        """
+        child_bytes = int(self.largest_output * OUTPUT_ESTIMATE_MARGIN) if self.largest_output else output_guess
+        return sum(reference_bytes + (child_bytes if input_bytes is None else input_bytes) for input_bytes, reference_bytes in sizes)
+
+    def admit_batch(self, batch_index, calls, upload_bytes):
+        """
+        배치를 시작해도 되면 BatchTicket을, 남은 예산으로 끝낼 수 없으면 None을 돌려줍니다.
+        한 번 거절한 뒤에는 더 작은 배치가 와도 시작하지 않아, 결과물이 앞쪽 배치부터 빈틈없이 채워지게 합니다.
+        """
+        self.start()
+        fits = not self.refused_batches
+        remaining_calls, remaining_bytes = self._remaining()
+        if fits and remaining_calls is not None and calls > remaining_calls:
+            fits = False
+        if fits and remaining_bytes is not None and upload_bytes > remaining_bytes:
+            fits = False
+        if fits and self.max_seconds:
+            # 앞선 배치들의 평균 실행 시간으로 이 배치가 시간 안에 끝날지 어림합니다.
+            expected = sum(self._batch_seconds) / len(self._batch_seconds) if self._batch_seconds else 0.0
+            fits = self.elapsed() + expected <= self.max_seconds
+        if not fits:
+            self.refused_batches.append(batch_index)
+            return None
+        ticket = BatchTicket(self, calls, upload_bytes)
+        self._tickets.add(ticket)
+        return ticket
+
+    def charge(self, ticket, upload_bytes):
+        """
+        시작한 배치의 요청 하나를 씁니다. 배치의 예약이 남아 있으면 예약에서 쓰고, 상한은 확인하지 않습니다.
+        예약을 다 쓴 뒤의 요청(재시도, 헤지)은 예약되지 않은 예산에서 쓰며, 모자라면 BudgetExceededError를 냅니다.
+        """
+        if ticket.reserved_calls <= 0:
+            remaining_calls, remaining_bytes = self._remaining()
+            if ((remaining_calls is not None and remaining_calls < 1)
+                    or (remaining_bytes is not None and remaining_bytes + ticket.reserved_bytes < upload_bytes)):
+                self.refused_attempts += 1
+                raise BudgetExceededError("예산이 부족해 재시도/헤지 요청을 보내지 않았습니다.")
+        self.used_calls += 1
+        self.used_bytes += upload_bytes
+        ticket.reserved_calls = max(0, ticket.reserved_calls - 1)
+        ticket.reserved_bytes = max(0, ticket.reserved_bytes - upload_bytes)
+
+    def finish_batch(self, ticket, completed=True):
+        """배치가 끝나면 쓰지 않은 예약(캐시 재사용 등)을 돌려받고, 끝까지 실행된 배치의 실행 시간을 기록합니다."""
+        self._tickets.discard(ticket)
+        if completed:
+            self._batch_seconds.append(time.monotonic() - ticket.started)
+
+    def describe(self):
+        parts = [f"API 호출 {self.used_calls}" + (f"/{self.max_calls}회" if self.max_calls else "회"),
+                 f"업로드 {format_size(self.used_bytes)}" + (f"/{format_size(self.max_upload_bytes)}" if self.max_upload_bytes else ""),
+                 f"시간 {format_duration(self.elapsed())}" + (f"/{format_duration(self.max_seconds)}" if self.max_seconds else "")]
+        text = "예산 사용: " + ", ".join(parts)
+        if self.refused_batches:
+            text += f" - 예산이 부족해 배치 {len(self.refused_batches)}개를 시작하지 않았습니다"
+        if self.refused_attempts:
+            text += f" - 예산이 부족해 재시도/헤지 요청 {self.refused_attempts}개를 보내지 않았습니다"
+        return text
+
+
+def budget_from_config(config):
+    """config.json의 실행당 예산 설정(max_calls_per_run, max_upload_mb_per_run, max_minutes_per_run)으로 RunBudget을 만듭니다."""
+    return RunBudget(config["max_calls_per_run"], config["max_upload_mb_per_run"] * MEGABYTE, config["max_minutes_per_run"] * 60)
@@ -0,0 +1,138 @@
+"""
+배치 실행의 진행 상황을 기록하는 실행 매니페스트입니다.
+결과물 파일이 디스크에 완전히 기록될 때마다 (배치, 노드, 파일 경로, 파일 해시)를 한 줄씩 덧붙이므로,
+실행이 중간에 끊겨도 이어하기(resume) 모드에서 이미 끝난 단위는 건너뛰고 그 결과물을 입력으로 다시 씁니다.
+첫 줄에는 실행 설정의 지문(fingerprint)이 있어, 워크플로우나 프롬프트가 바뀐 실행은 이어하지 않습니다.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from image_payload import EncodedImage
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = ".manifest.jsonl"
+
+
+def run_fingerprint(model_name, system_prompt, base_image_path, node_signatures):
+    """실행 결과에 영향을 주는 설정(모델, 시스템 프롬프트, 기본 이미지, 노드별 서명)의 해시입니다."""
+    base_image_mtime = os.path.getmtime(base_image_path) if os.path.exists(base_image_path) else None
+    data = [model_name, system_prompt, os.path.abspath(base_image_path), base_image_mtime, node_signatures]
+    return hashlib.sha256(json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def _truncate_torn_line(path):
+    """기록하는 도중에 끊긴 마지막 줄(줄바꿈으로 끝나지 않은 부분)을 잘라내, 이어서 쓰는 기록이 그 줄에 붙지 않게 합니다."""
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            chunk_start = max(0, position - 4096)
+            f.seek(chunk_start)
+            chunk = f.read(position - chunk_start)
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                keep = chunk_start + newline + 1
+                break
+            position = chunk_start
+        else:
+            keep = 0
+        if keep < end:
+            f.truncate(keep)
+
+
+class RunManifest:
+    """
+    open()으로 열고, 결과물이 기록될 때마다 record()를 부릅니다.
+    여러 스레드(출력 작성기)에서 동시에 record()를 불러도 됩니다.
+    """
+
+    def __init__(self, path, fingerprint, completed, fsync=True):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.fsync = fsync
+        # (배치 인덱스, 노드 인덱스) -> {"name", "path", "sha256"}
+        self.completed = completed
+        self._lock = threading.Lock()
+        self._file = None
+
+    @classmethod
+    def open(cls, path, fingerprint, resume=False, fsync=True):
+        """
+        resume이 True이고 기존 매니페스트의 지문이 같으면 완료 기록을 이어받고 그 뒤에 덧붙입니다.
+        그렇지 않으면 새 매니페스트를 씁니다.
+        """
+        completed = cls.read_completed(path, fingerprint) if resume else None
+        manifest = cls(path, fingerprint, completed or {}, fsync)
+        if completed is None:
+            manifest._file = open(path, 'w', encoding='utf-8')
+            manifest._write_line({"version": MANIFEST_VERSION, "fingerprint": fingerprint})
+        else:
+            _truncate_torn_line(path)
+            manifest._file = open(path, 'a', encoding='utf-8')
+        return manifest
+
+    @staticmethod
+    def read_completed(path, fingerprint):
+        """지문이 같은 매니페스트의 완료 기록을 읽습니다. 파일이 없거나 지문이 다르면 None입니다."""
+        if not os.path.exists(path):
+            return None
+        completed = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            header = f.readline()
+            try:
+                header = json.loads(header)
+            except ValueError:
+                return None
+            if header.get("version") != MANIFEST_VERSION or header.get("fingerprint") != fingerprint:
+                return None
+            for line in f:
+                try:
+                    unit = json.loads(line)
+                except ValueError:
+                    # 기록하는 도중에 끊긴 마지막 줄은 무시합니다.
+                    continue
+                completed[(unit["batch"], unit["node"])] = {"name": unit["name"], "path": unit["path"], "sha256": unit["sha256"]}
+        return completed
+
+    def _write_line(self, data):
+        self._file.write(json.dumps(data, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def record(self, batch_index, node_index, node_name, path, digest):
+        """결과물 파일이 디스크에 기록된 뒤에 호출합니다."""
+        with self._lock:
+            self.completed[(batch_index, node_index)] = {"name": node_name, "path": path, "sha256": digest}
+            if self._file is not None:
+                self._write_line({"batch": batch_index, "node": node_index, "name": node_name, "path": path, "sha256": digest})
+
+    def is_done(self, batch_index, node_index):
+        return (batch_index, node_index) in self.completed
+
+    def load_output(self, batch_index, node_index):
+        """
+        완료된 단위의 결과물 파일을 EncodedImage로 다시 읽습니다.
+        파일이 없거나 해시가 기록과 다르면 완료 기록을 지우고 None을 돌려줍니다(다시 실행 대상).
+        """
+        unit = self.completed.get((batch_index, node_index))
+        if unit is None:
+            return None
+        try:
+            with open(unit["path"], 'rb') as f:
+                data = f.read()
+        except OSError:
+            data = None
+        if data is None or hashlib.sha256(data).hexdigest() != unit["sha256"]:
+            with self._lock:
+                self.completed.pop((batch_index, node_index), None)
+            return None
+        return EncodedImage(data)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
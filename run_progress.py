@@ -0,0 +1,250 @@
+"""
+긴 실행의 진행 상황(완료/전체, 최근 처리 속도, 남은 시간)을 모으고 내보내는 곳입니다.
+엔진이 노드를 시작하고 끝낼 때마다 RunProgress에 기록하며, GUI는 이 값을 주기적으로 읽어 표시하고
+MetricsExporter는 Prometheus 텍스트 형식 파일로 주기적으로 다시 써서 node exporter(textfile collector)가 가져갈 수 있게 합니다.
+기록은 클라이언트 이벤트 루프에서, 읽기는 GUI나 내보내기 스레드에서 하므로 모든 값은 잠금 안에서 다룹니다.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+# 처리 속도를 계산할 최근 구간(초)과 노드별로 기억할 최근 실행 시간 수
+ROLLING_WINDOW_SECONDS = 300.0
+LATENCY_HISTORY = 50
+
+DEFAULT_METRICS_INTERVAL_SECONDS = 15.0
+METRIC_PREFIX = "bananafy_"
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}시간 {minutes}분"
+    if minutes:
+        return f"{minutes}분 {seconds}초"
+    return f"{seconds}초"
+
+
+class RunProgress:
+    """
+    노드 실행 하나를 단위로 센 진행 상황입니다.
+    이어하기나 증분 실행으로 건너뛴 단위는 완료로 세지만 처리 속도 계산에서는 뺍니다.
+    남은 시간은 노드별 최근 실행 시간으로 남은 작업량(초)을 구하고, 최근 구간에서 실제로 동시에 처리된 정도로 나눠 계산합니다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.total = 0
+        self.completed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.in_flight = 0
+        # 노드 이름 -> 아직 끝나지 않은 단위 수
+        self._remaining = Counter()
+        # 노드 이름 -> 최근 실행 시간(초)
+        self._latencies = {}
+        # 최근 구간에 끝난 단위의 (끝난 시각, 실행 시간)
+        self._finished = deque()
+
+    def add_planned(self, node_names):
+        """실행할 단위(노드 이름 하나가 단위 하나)를 전체에 더합니다."""
+        with self._lock:
+            for name in node_names:
+                self.total += 1
+                self._remaining[name] += 1
+
+    def unplan(self, node_names):
+        """실행하지 않기로 한 단위(예산이 부족해 시작하지 않은 배치 등)를 전체에서 뺍니다."""
+        with self._lock:
+            for name in node_names:
+                self.total -= 1
+                self._remaining[name] -= 1
+
+    def skip(self, node_name):
+        """이전 실행의 결과물을 이어받아 실행하지 않은 단위입니다."""
+        with self._lock:
+            self.skipped += 1
+            self._remaining[node_name] -= 1
+
+    @contextmanager
+    def track(self, node_name):
+        """with 블록 하나를 노드 실행 하나로 기록합니다. 취소된 실행은 끝나지 않은 것으로 남깁니다."""
+        with self._lock:
+            self.in_flight += 1
+        started = time.monotonic()
+        try:
+            yield
+        except asyncio.CancelledError:
+            with self._lock:
+                self.in_flight -= 1
+            raise
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+                self.failed += 1
+                self._remaining[node_name] -= 1
+            raise
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self._remaining[node_name] -= 1
+            self._latencies.setdefault(node_name, deque(maxlen=LATENCY_HISTORY)).append(now - started)
+            self._finished.append((now, now - started))
+
+    def _prune(self, now):
+        while self._finished and self._finished[0][0] < now - ROLLING_WINDOW_SECONDS:
+            self._finished.popleft()
+
+    def snapshot(self):
+        """현재 값을 dict로 돌려줍니다. 아직 계산할 수 없는 처리 속도와 남은 시간은 None입니다."""
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            span = min(ROLLING_WINDOW_SECONDS, now - self.started)
+            node_latency = {name: sum(samples) / len(samples) for name, samples in self._latencies.items() if samples}
+            remaining = {name: count for name, count in self._remaining.items() if count > 0}
+            images_per_minute = len(self._finished) / span * 60 if span > 0 and self._finished else None
+
+            eta_seconds = None
+            if node_latency and remaining:
+                # 한 번도 끝나지 않은 노드는 전체 평균 실행 시간으로 어림합니다.
+                default_latency = sum(node_latency.values()) / len(node_latency)
+                work_seconds = sum(count * node_latency.get(name, default_latency) for name, count in remaining.items())
+                # 최근 구간에 끝난 단위들의 실행 시간 합 / 구간 길이 = 실제로 동시에 처리된 단위 수
+                parallelism = sum(seconds for _, seconds in self._finished) / span if span > 0 else 0
+                if parallelism > 0:
+                    eta_seconds = work_seconds / parallelism
+            elif self.total and not remaining:
+                eta_seconds = 0.0
+
+            attempted = self.completed + self.failed
+            return {
+                "total": self.total,
+                "completed": self.completed,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "in_flight": self.in_flight,
+                "queued": max(0, sum(remaining.values()) - self.in_flight),
+                "images_per_minute": images_per_minute,
+                "eta_seconds": eta_seconds,
+                "error_rate": self.failed / attempted if attempted else 0.0,
+                "elapsed_seconds": now - self.started,
+                "node_latency": node_latency,
+            }
+
+    def describe(self, snapshot=None):
+        """상태 표시줄용 한 줄 요약입니다."""
+        snapshot = snapshot or self.snapshot()
+        done = snapshot["completed"] + snapshot["skipped"]
+        percent = done / snapshot["total"] * 100 if snapshot["total"] else 0
+        text = f"진행 {done}/{snapshot['total']} ({percent:.0f}%) - 실행 중 {snapshot['in_flight']}, 대기 {snapshot['queued']}"
+        if snapshot["images_per_minute"] is not None:
+            text += f" - 분당 {snapshot['images_per_minute']:.1f}장"
+        if snapshot["eta_seconds"] is not None and done < snapshot["total"]:
+            text += f", 남은 시간 약 {format_duration(snapshot['eta_seconds'])}"
+        if snapshot["failed"]:
+            text += f" - 오류 {snapshot['failed']}개 ({snapshot['error_rate']:.0%})"
+        return text
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in sorted(labels.items())) + "}"
+
+
+def format_prometheus(snapshot, request_stats=None, labels=None):
+    """snapshot()(과 RequestStats.snapshot() 형식의 누적 요청 통계)을 Prometheus 텍스트 형식 문자열로 만듭니다."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {METRIC_PREFIX}{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+        for sample_labels, value in samples:
+            value = value if isinstance(value, int) else repr(float(value))
+            lines.append(f"{METRIC_PREFIX}{name}{_label_text(dict(labels or {}, **sample_labels))} {value}")
+
+    metric("units_planned", "gauge", "Planned node executions.", [({}, snapshot["total"])])
+    metric("units_completed", "gauge", "Node executions finished in this run.", [({}, snapshot["completed"])])
+    metric("units_skipped", "gauge", "Node executions resumed from earlier runs.", [({}, snapshot["skipped"])])
+    metric("units_failed", "gauge", "Node executions that failed.", [({}, snapshot["failed"])])
+    metric("units_in_flight", "gauge", "Node executions currently running.", [({}, snapshot["in_flight"])])
+    metric("units_queued", "gauge", "Node executions not started yet.", [({}, snapshot["queued"])])
+    metric("error_ratio", "gauge", "Failed node executions per attempted execution.", [({}, snapshot["error_rate"])])
+    metric("elapsed_seconds", "gauge", "Seconds since the run started.", [({}, snapshot["elapsed_seconds"])])
+    if snapshot["images_per_minute"] is not None:
+        metric("images_per_minute", "gauge", "Images finished per minute over the recent window.", [({}, snapshot["images_per_minute"])])
+    if snapshot["eta_seconds"] is not None:
+        metric("eta_seconds", "gauge", "Estimated seconds until the run finishes.", [({}, snapshot["eta_seconds"])])
+    if snapshot["node_latency"]:
+        metric("node_latency_seconds", "gauge", "Mean recent execution time per node.",
+               [({"node": name}, seconds) for name, seconds in sorted(snapshot["node_latency"].items())])
+    if request_stats:
+        for field in ("requests", "retries", "throttle_waits", "hedges"):
+            metric(f"{field}_total", "counter", f"Model client {field.replace('_', ' ')} since startup.", [({}, request_stats[field])])
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path, text):
+    """node exporter가 쓰다 만 파일을 읽지 않도록 임시 파일에 쓴 뒤 한 번에 바꿉니다."""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+class MetricsExporter:
+    """
+    progress를 interval초마다 Prometheus 텍스트 형식으로 path에 다시 씁니다. close()하면 마지막 값을 한 번 더 씁니다.
+    client를 주면 모델 클라이언트의 누적 요청/재시도/속도 제한 대기/헤지 횟수도 함께 씁니다.
+    """
+
+    def __init__(self, path, progress, client=None, labels=None, interval=DEFAULT_METRICS_INTERVAL_SECONDS):
+        self.path = path
+        self.progress = progress
+        self.client = client
+        self.labels = labels or {}
+        self.interval = max(1.0, interval)
+        self._stop = threading.Event()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+        self._thread.start()
+
+    def write(self):
+        request_stats = self.client.stats.snapshot() if self.client is not None else None
+        write_prometheus(self.path, format_prometheus(self.progress.snapshot(), request_stats, self.labels))
+
+    def _run(self):
+        while True:
+            try:
+                self.write()
+            except OSError:
+                # 지표 파일을 쓰지 못해도 실행은 계속합니다. 다음 주기에 다시 시도합니다.
+                pass
+            if self._stop.wait(self.interval):
+                return
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        try:
+            self.write()
+        except OSError:
+            pass
+
+
+def start_metrics_exporter(path, progress, client=None, labels=None, interval=DEFAULT_METRICS_INTERVAL_SECONDS):
+    """path가 비어 있으면 None, 아니면 시작된 MetricsExporter입니다."""
+    return MetricsExporter(path, progress, client, labels, interval) if path else None
@@ -0,0 +1,116 @@
+"""
+파이프라인 실행 구간(span)의 시간을 재는 추적기입니다.
+구간마다 이름, 레인(lane), 시작 시각, 걸린 시간과 추가 정보(바이트 수, 재시도 횟수 등)를 기록하고,
+JSON Lines 추적 파일, 노드별 p50/p95/최대 시간 요약, Chrome 추적 형식(chrome://tracing, Perfetto)으로 내보냅니다.
+레인은 Chrome 추적에서 한 줄로 그려지는 단위로, 노드 하나의 구간들은 같은 레인에 순서대로 놓입니다.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_SUFFIX = ".trace.jsonl"
+CHROME_TRACE_SUFFIX = ".trace.json"
+
+# 노드 하나의 전체 실행을 감싸는 구간 이름 (요약은 이 구간을 기준으로 합니다)
+NODE_SPAN = "node"
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Tracer:
+    """
+    span()으로 구간을 기록합니다. 여러 스레드와 코루틴에서 동시에 써도 됩니다.
+    trace_path가 있으면 끝난 구간을 바로 JSON Lines로 덧붙이고, enabled가 False이면 아무것도 기록하지 않습니다.
+    """
+
+    def __init__(self, trace_path=None, enabled=True):
+        self.enabled = enabled
+        self.spans = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._file = open(trace_path, 'w', encoding='utf-8') if enabled and trace_path else None
+
+    @contextmanager
+    def span(self, name, lane="main", **args):
+        """
+        with 블록을 하나의 구간으로 기록합니다. as로 받은 dict에 넣은 값은 구간의 추가 정보로 함께 기록됩니다.
+        블록에서 예외가 나면 error에 예외 이름을 남깁니다.
+        """
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = type(e).__name__
+            raise
+        finally:
+            if self.enabled:
+                self._add(name, lane, start, time.perf_counter(), args)
+
+    def _add(self, name, lane, start, end, args):
+        record = dict(args, name=name, lane=lane, start=round(start - self._origin, 6), duration=round(end - start, 6))
+        with self._lock:
+            self.spans.append(record)
+            if self._file is not None:
+                self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def node_summary(self):
+        """노드 이름별 {"count", "p50", "p95", "max"} (초)입니다. 실패한 구간은 빼고 계산합니다."""
+        durations = {}
+        with self._lock:
+            for record in self.spans:
+                if record["name"] == NODE_SPAN and "error" not in record:
+                    durations.setdefault(record.get("node"), []).append(record["duration"])
+        summary = {}
+        for node, values in durations.items():
+            values.sort()
+            summary[node] = {"count": len(values), "p50": _percentile(values, 0.5), "p95": _percentile(values, 0.95), "max": values[-1]}
+        return summary
+
+    def stage_totals(self):
+        """구간 이름별 걸린 시간의 합(초)입니다. 동시에 진행된 구간은 겹쳐서 더해집니다."""
+        totals = {}
+        with self._lock:
+            for record in self.spans:
+                totals[record["name"]] = totals.get(record["name"], 0.0) + record["duration"]
+        return totals
+
+    def write_chrome_trace(self, path):
+        """Chrome 추적 형식(JSON)으로 씁니다. 레인마다 한 줄로 표시되어 동시 실행과 빈 시간을 볼 수 있습니다."""
+        with self._lock:
+            spans = list(self.spans)
+        lanes = {}
+        events = []
+        for record in spans:
+            tid = lanes.setdefault(record["lane"], len(lanes) + 1)
+            args = {key: value for key, value in record.items() if key not in ("name", "lane", "start", "duration")}
+            events.append({
+                "name": record["name"], "ph": "X", "pid": 1, "tid": tid,
+                "ts": int(record["start"] * 1e6), "dur": int(record["duration"] * 1e6), "args": args,
+            })
+        for lane, tid in lanes.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": str(lane)}})
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False, default=str)
+
+    def close(self):
+        """노드별 요약과 구간별 합계를 추적 파일 마지막 줄에 남기고 파일을 닫습니다."""
+        with self._lock:
+            file, self._file = self._file, None
+        if file is not None:
+            file.write(json.dumps({"name": "summary", "nodes": self.node_summary(), "stages": self.stage_totals()}, ensure_ascii=False) + "\n")
+            file.close()
+
+
+# 추적하지 않을 때 쓰는 빈 추적기
+NULL_TRACER = Tracer(enabled=False)
+
+
+def format_trace_summary(summary):
+    """node_summary()를 노드당 한 줄씩 사람이 읽을 수 있는 문자열 리스트로 만듭니다."""
+    return [
+        f"{node}: {stats['count']}회, p50 {stats['p50']:.2f}초, p95 {stats['p95']:.2f}초, 최대 {stats['max']:.2f}초"
+        for node, stats in summary.items()
+    ]
@@ -0,0 +1,512 @@
+"""
+큰 배치와 데이터셋 스윕을 (입력, 배치 범위) 조각(shard)으로 나눠 여러 프로세스와 여러 컴퓨터가 함께 실행하는 분산 실행입니다.
+조정자(plan)가 공유 폴더(네트워크 드라이브 등)에 실행 설정과 조각 파일을 만들면,
+각 컴퓨터의 작업자(work)가 조각을 하나씩 가져가 실행하고 결과물은 모두 같은 출력 폴더에 씁니다.
+
+대기열 폴더 구조:
+    job.json                           실행 설정 (계획한 순간의 노드 설정과 시스템 프롬프트)
+    pending/<조각>.json                 아직 아무도 가져가지 않은 조각
+    running/<조각>@<작업자>.json        실행 중인 조각. 파일 수정 시각이 작업자의 마지막 하트비트입니다.
+    done/<조각>.json, failed/<조각>.json
+
+조각을 가져가는 것은 파일 이름 바꾸기(os.rename) 한 번이므로 여러 작업자가 동시에 가져가려 해도 한 작업자만 성공합니다.
+하트비트가 lease_seconds 넘게 끊긴 조각은 다른 작업자가 pending으로 되돌려 다시 실행하며,
+조각은 이어하기(resume)로 실행되므로 중간에 끊긴 조각을 다시 실행해도 이미 저장된 결과물은 새로 만들지 않습니다.
+
+명령줄 사용 예:
+    python -m shard_queue plan --queue-dir //nas/bananafy/run1 --workflow workflows/sample.json --base-images characters/ \\
+        --system-prompt prompts/prompts_template.json --output-dir //nas/bananafy/img --batches 20 --batches-per-shard 5
+    python -m shard_queue work --queue-dir //nas/bananafy/run1 --processes 4
+    python -m shard_queue status --queue-dir //nas/bananafy/run1
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from dataset_sweep import input_name, list_base_images
+from image_payload import PayloadCache
+from job_queue import make_job_spec
+from model_client import get_model_client, load_config
+from output_store import memory_limit_from_config
+from output_writer import writer_options_from_config
+from pipeline_engine import PipelineEngine, app_base_dir, load_system_prompt_file, load_workflow_file, read_api_key, safe_name
+from pipeline_graph import PipelineGraph
+from result_cache import ResultCache
+from run_budget import BudgetExceededError, budget_from_config
+from run_progress import DEFAULT_METRICS_INTERVAL_SECONDS, RunProgress, start_metrics_exporter
+
+JOB_FILE = "job.json"
+
+STATE_PENDING = "pending"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+STATES = (STATE_PENDING, STATE_RUNNING, STATE_DONE, STATE_FAILED)
+
+STATE_LABELS = {
+    STATE_PENDING: "대기",
+    STATE_RUNNING: "실행 중",
+    STATE_DONE: "완료",
+    STATE_FAILED: "실패",
+}
+
+# 작업자가 하트비트를 남기는 간격(초)과, 하트비트가 이만큼 끊기면 조각을 다른 작업자에게 넘기는 시간(초)
+# 컴퓨터 사이의 시계 차이보다 충분히 길어야 합니다.
+DEFAULT_HEARTBEAT_SECONDS = 10.0
+DEFAULT_LEASE_SECONDS = 120.0
+
+# 한 조각을 오류로 다시 시도하는 최대 횟수 (넘으면 failed로 옮깁니다)
+MAX_ATTEMPTS = 3
+
+# 작업자 프로세스 하나가 동시에 실행할 최대 조각 수와 새 조각을 확인하는 간격(초)
+DEFAULT_MAX_SHARDS = 2
+DEFAULT_POLL_SECONDS = 2.0
+
+
+def worker_tag():
+    """조각 파일 이름에 붙일 작업자 이름 '<호스트 이름>-<프로세스 ID>'입니다."""
+    return f"{safe_name(socket.gethostname()) or 'host'}-{os.getpid()}"
+
+
+def _write_json(path, data):
+    """다른 작업자가 쓰다 만 파일을 읽지 않도록 임시 파일에 쓴 뒤 한 번에 바꿉니다."""
+    temp_path = f"{path}.{worker_tag()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def make_shards(spec, batches_per_shard=0):
+    """
+    실행 설정을 (입력, 배치 범위) 조각 리스트로 나눕니다. batches_per_shard가 0이면 입력 하나가 조각 하나입니다.
+    스윕이면 입력마다 결과물 폴더 이름(input_name)을 함께 담아, 어느 작업자가 실행해도 데이터셋 스윕과 같은 위치에 씁니다.
+    """
+    if spec.get("base_images"):
+        paths = list_base_images(spec["base_images"])
+        if not paths:
+            raise ValueError(f"'{spec['base_images']}'에서 처리할 이미지를 찾을 수 없습니다.")
+        inputs = [(path, input_name(path)) for path in paths]
+    else:
+        inputs = [(spec["base_image"], None)]
+    batches = spec["batches"]
+    step = batches_per_shard if batches_per_shard > 0 else batches
+    shards = []
+    for path, name in inputs:
+        for start in range(0, batches, step):
+            shards.append({"id": f"{len(shards):06d}", "base_image": path, "input_name": name,
+                           "batch_range": [start, min(start + step, batches)], "attempts": 0})
+    return shards
+
+
+class ShardLease:
+    """작업자가 가져간 조각 하나입니다. path는 running 폴더의 조각 파일이고, 그 수정 시각이 하트비트입니다."""
+
+    def __init__(self, path, shard):
+        self.path = path
+        self.shard = shard
+
+    @property
+    def shard_id(self):
+        return self.shard["id"]
+
+
+class ShardQueue:
+    """
+    공유 폴더에 있는 조각 대기열입니다. 상태 변경은 모두 파일 이름 바꾸기 한 번으로 이루어지므로,
+    여러 컴퓨터의 작업자가 같은 폴더를 잠금 없이 함께 써도 한 조각을 두 작업자가 동시에 가져가지 않습니다.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def _dir(self, state):
+        return os.path.join(self.root, state)
+
+    def _names(self, state):
+        try:
+            return sorted(name for name in os.listdir(self._dir(state)) if name.endswith(".json"))
+        except FileNotFoundError:
+            return []
+
+    def plan(self, spec, batches_per_shard=0):
+        """실행 설정과 조각 파일을 만들고 조각 수를 돌려줍니다. 이미 계획된 폴더면 ValueError입니다."""
+        if os.path.exists(os.path.join(self.root, JOB_FILE)):
+            raise ValueError(f"'{self.root}'에는 이미 계획된 실행이 있습니다. 새 폴더를 지정하세요.")
+        shards = make_shards(spec, batches_per_shard)
+        for state in STATES:
+            os.makedirs(self._dir(state), exist_ok=True)
+        # 작업자는 실행 설정을 먼저 읽으므로 조각보다 먼저 씁니다.
+        _write_json(os.path.join(self.root, JOB_FILE), dict(spec, shard_count=len(shards)))
+        for shard in shards:
+            _write_json(os.path.join(self._dir(STATE_PENDING), shard["id"] + ".json"), shard)
+        return len(shards)
+
+    def load_spec(self):
+        path = os.path.join(self.root, JOB_FILE)
+        if not os.path.exists(path):
+            raise ValueError(f"'{self.root}'에 계획된 실행이 없습니다. 먼저 'plan'을 실행하세요.")
+        return _read_json(path)
+
+    def claim(self, worker):
+        """대기 중인 조각 하나를 가져와 ShardLease로 돌려줍니다. 가져갈 조각이 없으면 None입니다."""
+        for name in self._names(STATE_PENDING):
+            source = os.path.join(self._dir(STATE_PENDING), name)
+            target = os.path.join(self._dir(STATE_RUNNING), f"{name[:-len('.json')]}@{worker}.json")
+            try:
+                # 이름을 바꾸면 수정 시각은 그대로이므로, 가져가자마자 만료된 것으로 보이지 않게 시각을 먼저 갱신합니다.
+                os.utime(source)
+                os.rename(source, target)
+            except FileNotFoundError:
+                # 다른 작업자가 먼저 가져갔습니다.
+                continue
+            return ShardLease(target, _read_json(target))
+        return None
+
+    def heartbeat(self, lease):
+        """하트비트를 남깁니다. 조각이 이미 다른 작업자에게 넘어갔으면 False입니다."""
+        try:
+            os.utime(lease.path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _move(self, lease, state, shard):
+        # 먼저 다른 작업자에게 보이지 않는 이름으로 바꿔 조각을 확보한 뒤 내용을 고쳐 옮깁니다.
+        # pending으로 옮긴 뒤에 내용을 고치면 그사이 다른 작업자가 가져간 조각이 한 번 더 대기하게 됩니다.
+        staging = lease.path + ".moving"
+        try:
+            os.rename(lease.path, staging)
+        except FileNotFoundError:
+            return False
+        _write_json(staging, shard)
+        os.rename(staging, os.path.join(self._dir(state), lease.shard_id + ".json"))
+        return True
+
+    def complete(self, lease, worker, message):
+        """조각을 done으로 옮깁니다. 그사이 조각이 다른 작업자에게 넘어갔으면 False입니다."""
+        return self._move(lease, STATE_DONE, dict(lease.shard, worker=worker, message=message, finished_at=time.time()))
+
+    def fail(self, lease, worker, error):
+        """
+        실패한 조각을 다시 대기시키거나, MAX_ATTEMPTS번 실패했으면 failed로 옮기고 옮긴 상태를 돌려줍니다.
+        그사이 조각이 다른 작업자에게 넘어갔으면 None입니다.
+        """
+        shard = dict(lease.shard, attempts=lease.shard.get("attempts", 0) + 1, worker=worker, message=f"오류: {error}")
+        state = STATE_FAILED if shard["attempts"] >= MAX_ATTEMPTS else STATE_PENDING
+        return state if self._move(lease, state, shard) else None
+
+    def reap(self, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """하트비트가 lease_seconds 넘게 끊긴 조각을 다시 대기시키고 그 수를 돌려줍니다."""
+        deadline = time.time() - lease_seconds
+        reaped = 0
+        for name in self._names(STATE_RUNNING):
+            path = os.path.join(self._dir(STATE_RUNNING), name)
+            try:
+                if os.path.getmtime(path) >= deadline:
+                    continue
+                os.rename(path, os.path.join(self._dir(STATE_PENDING), name.partition("@")[0] + ".json"))
+            except FileNotFoundError:
+                # 그사이 끝났거나 다른 작업자가 먼저 되돌렸습니다.
+                continue
+            reaped += 1
+        return reaped
+
+    def counts(self):
+        return {state: len(self._names(state)) for state in STATES}
+
+    def running(self):
+        """실행 중인 조각의 (조각 ID, 작업자, 마지막 하트비트 후 지난 시간(초)) 리스트입니다."""
+        now = time.time()
+        leases = []
+        for name in self._names(STATE_RUNNING):
+            shard_id, _, worker = name[:-len(".json")].partition("@")
+            try:
+                leases.append((shard_id, worker, now - os.path.getmtime(os.path.join(self._dir(STATE_RUNNING), name))))
+            except FileNotFoundError:
+                continue
+        return leases
+
+    def failures(self):
+        """실패한 조각 파일(조각 정보와 마지막 오류 메시지) 리스트입니다."""
+        return [_read_json(os.path.join(self._dir(STATE_FAILED), name)) for name in self._names(STATE_FAILED)]
+
+
+def format_status(queue):
+    counts = queue.counts()
+    total = sum(counts.values())
+    lines = [f"조각 {counts[STATE_DONE]}/{total} 완료 ("
+             + ", ".join(f"{STATE_LABELS[state]} {counts[state]}" for state in STATES) + ")"]
+    for shard_id, worker, age in queue.running():
+        lines.append(f"  조각 {shard_id} [{STATE_LABELS[STATE_RUNNING]}] {worker} - 마지막 하트비트 {age:.0f}초 전")
+    for shard in queue.failures():
+        start, stop = shard["batch_range"]
+        lines.append(f"  조각 {shard['id']} [{STATE_LABELS[STATE_FAILED]}] {os.path.basename(shard['base_image'])} "
+                     f"배치 {start + 1}-{stop}: {shard.get('message', '')}")
+    return lines
+
+
+class ShardWorker:
+    """
+    대기열의 조각을 가져와 실행하는 작업자 프로세스입니다. 한 프로세스의 조각들은 client(속도 제한 포함) 하나를 함께 쓰고,
+    실행 중인 조각마다 heartbeat_seconds 간격으로 하트비트를 남깁니다.
+    하트비트를 남기지 못하면(다른 작업자에게 넘어갔으면) 그 조각은 실행을 멈춥니다.
+    config.json의 실행당 예산은 조각마다 따로 적용하며, 예산이 부족해 끝내지 못한 조각은 실패한 조각처럼 다시 대기시킵니다.
+    """
+
+    def __init__(self, queue, client, config, cache_dir, max_shards=DEFAULT_MAX_SHARDS, poll_seconds=DEFAULT_POLL_SECONDS,
+                 heartbeat_seconds=DEFAULT_HEARTBEAT_SECONDS, lease_seconds=DEFAULT_LEASE_SECONDS, log=print):
+        self.queue = queue
+        self.client = client
+        self.config = config
+        self.max_shards = max(1, max_shards)
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.lease_seconds = lease_seconds
+        self.log = log
+        self.worker = worker_tag()
+        self.result_cache = ResultCache(cache_dir)
+        self.payloads = PayloadCache.from_config(config)
+        # 이 작업자가 실행한 모든 조각의 노드 단위 진행 상황
+        self.progress = RunProgress()
+        self.completed = 0
+        self.failed = 0
+
+    def run(self, stop_when_empty=False):
+        """조각을 계속 처리합니다. stop_when_empty가 True이면 대기 중이거나 실행 중인 조각이 모두 없어지면 돌아옵니다."""
+        return self.client.run(self.run_async(stop_when_empty))
+
+    async def run_async(self, stop_when_empty=False):
+        spec = await asyncio.to_thread(self.queue.load_spec)
+        graph = PipelineGraph(spec["node_specs"])
+        engine = self._make_engine(spec)
+        running = set()
+        while True:
+            reaped = await asyncio.to_thread(self.queue.reap, self.lease_seconds)
+            if reaped:
+                self.log(f"하트비트가 끊긴 조각 {reaped}개를 다시 대기시켰습니다.")
+            while len(running) < self.max_shards:
+                lease = await asyncio.to_thread(self.queue.claim, self.worker)
+                if lease is None:
+                    break
+                task = asyncio.create_task(self._run_shard(engine, graph, spec, lease))
+                running.add(task)
+                task.add_done_callback(running.discard)
+            if not running:
+                # 다른 작업자가 실행 중인 조각도 그 작업자가 죽으면 다시 대기하므로, 모두 끝날 때까지 기다립니다.
+                counts = await asyncio.to_thread(self.queue.counts)
+                if stop_when_empty and counts[STATE_PENDING] == 0 and counts[STATE_RUNNING] == 0:
+                    return
+                await asyncio.sleep(self.poll_seconds)
+            else:
+                await asyncio.wait(running, timeout=self.poll_seconds, return_when=asyncio.FIRST_COMPLETED)
+
+    def _make_engine(self, spec):
+        def on_event(command, data):
+            # 조각이 많으므로 결과물 하나하나가 아니라 오류만 출력합니다.
+            if command == "update_status" and "오류" in data:
+                self.log(data)
+
+        engine = PipelineEngine(
+            self.client, spec["system_prompt"], spec["output_dir"], result_cache=self.result_cache, on_event=on_event,
+            payloads=self.payloads, writer_options=writer_options_from_config(self.config),
+            output_memory_limit=memory_limit_from_config(self.config), trace=self.config["trace_runs"],
+            chrome_trace=self.config["chrome_trace"], deterministic=self.config["deterministic_requests"], progress=self.progress
+        )
+        if spec.get("base_images"):
+            # 데이터셋 스윕과 같이 입력별 결과물이 '<출력 폴더>/<이름>/<입력 이름>/'에 생기도록 출력 폴더를 바꿉니다.
+            engine.output_dir = engine.workflow_output_dir(spec["name"])
+        return engine
+
+    async def _heartbeat(self, lease, task):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            alive = await asyncio.to_thread(self.queue.heartbeat, lease)
+            if not alive:
+                task.cancel()
+                return
+
+    async def _run_shard(self, engine, graph, spec, lease):
+        shard = lease.shard
+        start, stop = shard["batch_range"]
+        label = f"조각 {shard['id']} ({os.path.basename(shard['base_image'])}, 배치 {start + 1}-{stop})"
+        self.log(f"{label} 시작")
+        budget = budget_from_config(self.config)
+        budget = budget if budget.limited else None
+
+        async def run():
+            await engine.run_async(graph, shard["base_image"], shard["input_name"] or spec["name"], spec["batches"],
+                                   spec["parallel_batches"], spec["use_cache"], resume=True, batch_range=(start, stop), budget=budget)
+            if budget is not None and budget.refused_batches:
+                raise BudgetExceededError(budget.describe())
+
+        work = asyncio.create_task(run())
+        beat = asyncio.create_task(self._heartbeat(lease, work))
+        try:
+            await work
+        except asyncio.CancelledError:
+            if beat.done():
+                # 하트비트가 끊겨 다른 작업자에게 넘어간 조각입니다. 그 작업자가 이어서 실행합니다.
+                self.log(f"{label}: 다른 작업자에게 넘어가 실행을 멈췄습니다.")
+                return
+            raise
+        except Exception as e:
+            state = await asyncio.to_thread(self.queue.fail, lease, self.worker, e)
+            self.failed += 1
+            if state is not None:
+                self.log(f"{label} 오류 ({STATE_LABELS[state]}): {e}")
+            return
+        finally:
+            beat.cancel()
+        if await asyncio.to_thread(self.queue.complete, lease, self.worker, f"이미지 {len(graph) * (stop - start)}개 저장"):
+            self.completed += 1
+            self.log(f"{label} 완료")
+
+
+# --- 명령줄 실행 ---
+
+def build_arg_parser():
+    base_dir = app_base_dir()
+    parser = argparse.ArgumentParser(prog="python -m shard_queue",
+                                     description="배치와 데이터셋 스윕을 조각으로 나눠 여러 프로세스와 컴퓨터에서 함께 실행합니다.")
+    parser.add_argument("--queue-dir", required=True, help="모든 작업자가 함께 쓰는 대기열 폴더")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    plan = commands.add_parser("plan", help="실행을 조각으로 나눠 대기열 폴더에 넣습니다")
+    plan.add_argument("--workflow", required=True, help="워크플로우 JSON 파일 (GUI의 '워크플로우 저장' 형식)")
+    plan.add_argument("--system-prompt", required=True, help="시스템 프롬프트 JSON 파일 (prompts/prompts_template.json 형식)")
+    inputs = plan.add_mutually_exclusive_group(required=True)
+    inputs.add_argument("--base-image", help="전역 기본 이미지 파일")
+    inputs.add_argument("--base-images", help="기본 이미지 폴더 또는 glob 패턴 (데이터셋 스윕)")
+    plan.add_argument("--output-dir", default=os.path.join(base_dir, "img"),
+                      help="결과물을 저장할 폴더. 모든 작업자가 같은 경로로 접근할 수 있어야 합니다 (기본값: img)")
+    plan.add_argument("--name", help="결과물 하위 폴더 이름 (기본값: 워크플로우 파일 이름)")
+    plan.add_argument("--batches", type=int, default=1, help="입력마다 전체 파이프라인 반복 횟수")
+    plan.add_argument("--batches-per-shard", type=int, default=0, help="조각 하나의 배치 수 (기본값: 0 = 입력 하나가 조각 하나)")
+    plan.add_argument("--parallel-batches", type=int, default=1, help="조각 안에서 동시에 실행할 최대 배치 수")
+    plan.add_argument("--no-cache", action="store_true", help="캐시를 무시하고 모든 노드를 새로 생성합니다")
+
+    commands.add_parser("status", help="조각별 진행 상황을 봅니다")
+
+    work = commands.add_parser("work", help="대기열의 조각을 실행합니다")
+    work.add_argument("--processes", type=int, default=1, help="이 컴퓨터에서 띄울 작업자 프로세스 수")
+    work.add_argument("--max-shards", type=int, default=DEFAULT_MAX_SHARDS, help="프로세스마다 동시에 실행할 최대 조각 수")
+    work.add_argument("--poll-seconds", type=float, default=DEFAULT_POLL_SECONDS, help="새 조각을 확인하는 간격 (초)")
+    work.add_argument("--heartbeat-seconds", type=float, default=DEFAULT_HEARTBEAT_SECONDS, help="하트비트 간격 (초)")
+    work.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS,
+                      help="하트비트가 이만큼 끊긴 조각을 다른 작업자가 가져갑니다 (초)")
+    work.add_argument("--forever", action="store_true", help="조각이 모두 끝나도 종료하지 않고 새 조각을 기다립니다")
+    work.add_argument("--requests-per-minute", type=float,
+                      help="이 컴퓨터 전체의 분당 최대 요청 수. 프로세스마다 나눠 적용합니다 (기본값: config.json 값)")
+    work.add_argument("--cache-dir", default=os.path.join(base_dir, "cache"), help="결과 캐시 폴더")
+    work.add_argument("--metrics-file",
+                      help="작업자의 진행 지표를 Prometheus 텍스트 형식으로 다시 쓸 파일. 프로세스가 여럿이면 '<이름>.<번호>.prom'으로 나눕니다")
+    work.add_argument("--metrics-interval", type=float, default=DEFAULT_METRICS_INTERVAL_SECONDS, help="진행 지표 파일을 다시 쓰는 간격 (초)")
+    work.add_argument("--model", help="사용할 모델 이름 (기본값: config.json의 model_name)")
+    work.add_argument("--api-key", help="Google AI Studio API 키 (기본값: GOOGLE_API_KEY 환경 변수 또는 api_key.txt)")
+    return parser
+
+
+def _child_argv(args, requests_per_minute, number):
+    argv = [sys.executable, "-m", "shard_queue", "--queue-dir", args.queue_dir, "work",
+            "--max-shards", str(args.max_shards), "--poll-seconds", str(args.poll_seconds),
+            "--heartbeat-seconds", str(args.heartbeat_seconds), "--lease-seconds", str(args.lease_seconds),
+            "--cache-dir", args.cache_dir]
+    if args.metrics_file:
+        stem, extension = os.path.splitext(args.metrics_file)
+        argv += ["--metrics-file", f"{stem}.{number}{extension or '.prom'}", "--metrics-interval", str(args.metrics_interval)]
+    if requests_per_minute:
+        argv += ["--requests-per-minute", str(requests_per_minute)]
+    if args.forever:
+        argv.append("--forever")
+    if args.model:
+        argv += ["--model", args.model]
+    return argv
+
+
+def run_processes(args, api_key):
+    """작업자 프로세스 args.processes개를 띄우고 모두 끝날 때까지 기다립니다. API 키는 명령줄 대신 환경 변수로 넘깁니다."""
+    # 분당 요청 수는 이 컴퓨터 전체의 한도이므로, 지정하지 않았을 때도 config.json 값을 프로세스 수로 나눠 줍니다.
+    total_requests_per_minute = args.requests_per_minute or load_config(app_base_dir()).get("requests_per_minute")
+    requests_per_minute = total_requests_per_minute / args.processes if total_requests_per_minute else None
+    env = dict(os.environ, GOOGLE_API_KEY=api_key)
+    processes = [subprocess.Popen(_child_argv(args, requests_per_minute, number + 1), cwd=app_base_dir(), env=env)
+                 for number in range(args.processes)]
+    try:
+        return max(process.wait() for process in processes)
+    except KeyboardInterrupt:
+        for process in processes:
+            process.wait()
+        print("작업자를 종료합니다. 실행 중이던 조각은 하트비트가 끊긴 뒤 다른 작업자가 이어서 실행합니다.")
+        return 0
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    queue = ShardQueue(args.queue_dir)
+
+    if args.command == "plan":
+        try:
+            node_specs = load_workflow_file(args.workflow, app_base_dir())
+            spec = make_job_spec(args.name or os.path.splitext(os.path.basename(args.workflow))[0], node_specs,
+                                 load_system_prompt_file(args.system_prompt), args.output_dir, args.base_image, args.base_images,
+                                 args.batches, args.parallel_batches, not args.no_cache)
+            count = queue.plan(spec, max(0, args.batches_per_shard))
+        except (OSError, ValueError) as e:
+            print(f"오류: {e}", file=sys.stderr)
+            return 1
+        print(f"조각 {count}개를 '{queue.root}'에 넣었습니다. 각 컴퓨터에서 'python -m shard_queue --queue-dir ... work'를 실행하세요.")
+        return 0
+
+    if args.command == "status":
+        try:
+            queue.load_spec()
+        except ValueError as e:
+            print(f"오류: {e}", file=sys.stderr)
+            return 1
+        for line in format_status(queue):
+            print(line)
+        return 0
+
+    api_key = read_api_key(args)
+    if not api_key:
+        print("오류: API 키가 없습니다. --api-key, GOOGLE_API_KEY 환경 변수 또는 api_key.txt를 사용하세요.", file=sys.stderr)
+        return 1
+    if args.processes > 1:
+        return run_processes(args, api_key)
+
+    config = load_config(app_base_dir())
+    if args.model:
+        config["model_name"] = args.model
+    if args.requests_per_minute:
+        config["requests_per_minute"] = args.requests_per_minute
+    worker = ShardWorker(queue, get_model_client(api_key, config), config, args.cache_dir, args.max_shards, args.poll_seconds,
+                         args.heartbeat_seconds, args.lease_seconds, log=lambda message: print(f"[{worker_tag()}] {message}", flush=True))
+    exporter = start_metrics_exporter(args.metrics_file, worker.progress, worker.client,
+                                      {"queue": os.path.basename(queue.root), "worker": worker.worker}, args.metrics_interval)
+    try:
+        worker.run(stop_when_empty=not args.forever)
+    except ValueError as e:
+        print(f"오류: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        print("작업자를 종료합니다. 실행 중이던 조각은 하트비트가 끊긴 뒤 다른 작업자가 이어서 실행합니다.")
+        return 0
+    finally:
+        if exporter is not None:
+            exporter.close()
+    print(f"[{worker.worker}] 조각 {worker.completed}개 완료, {worker.failed}번 실패")
+    return 1 if queue.counts()[STATE_FAILED] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
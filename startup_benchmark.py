@@ -0,0 +1,119 @@
+"""
+프로그램 시작 시간을 재는 벤치마크입니다.
+매번 새 프로세스를 띄워 프로세스 시작부터 다음 시점까지 걸린 시간을 잽니다.
+    - 모듈 준비: img_banana를 불러오기까지 (창을 만들기 직전)
+    - 첫 창: ImagePipelineApp을 만들고 창이 화면에 그려지기까지 (디스플레이가 없으면 건너뜀)
+    - 첫 요청: 실제 SDK로 모델 클라이언트를 만들고 요청 하나를 보내기까지
+      (네트워크 없이 재도록 클라이언트를 만든 뒤 모델만 가짜 모델로 바꿔 요청합니다)
+SDK를 시작할 때 불러오지 않도록 바꾼 뒤로 '모듈 준비'와 '첫 창'이 다시 느려지지 않았는지 확인하는 데 씁니다.
+
+명령줄 사용 예:
+    python -m startup_benchmark
+    python -m startup_benchmark --repeat 10 --json startup.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from pipeline_engine import app_base_dir
+
+# (측정값 이름, 표시 이름)
+MEASUREMENTS = (
+    ("import_seconds", "모듈 준비"),
+    ("window_seconds", "첫 창"),
+    ("first_request_seconds", "첫 요청"),
+)
+
+
+def measure_startup(spawned_at):
+    """(새 프로세스에서 실행됨) spawned_at(부모가 프로세스를 띄운 시각, time.time())부터 각 시점까지의 시간을 잽니다."""
+    result = {}
+    import img_banana
+    result["import_seconds"] = time.time() - spawned_at
+
+    try:
+        root = img_banana.tk.Tk()
+    except img_banana.tk.TclError:
+        # 디스플레이가 없는 환경
+        result["window_seconds"] = None
+    else:
+        # API 키 입력 창이 뜨지 않도록 키가 있는 것처럼 시작합니다.
+        img_banana.ImagePipelineApp.load_api_key = lambda self: "startup-benchmark"
+        img_banana.ImagePipelineApp(root)
+        root.update()
+        result["window_seconds"] = time.time() - spawned_at
+        root.destroy()
+
+    from mock_model import MockGenerativeModel
+    from model_client import DEFAULT_CONFIG, get_model_client
+    config = dict(DEFAULT_CONFIG, requests_per_minute=0)
+    client = get_model_client("startup-benchmark", config)
+    client.model = MockGenerativeModel(latency_ms=0, latency_sigma=0, image_size=64)
+    client.generate_image(["startup benchmark"])
+    result["first_request_seconds"] = time.time() - spawned_at
+    return result
+
+
+def run_once():
+    """새 프로세스 하나로 시작 시간을 한 번 재서 dict로 돌려줍니다."""
+    spawned_at = time.time()
+    completed = subprocess.run([sys.executable, "-m", "startup_benchmark", "--child", repr(spawned_at)],
+                               cwd=app_base_dir(), capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"시작 시간 측정 프로세스가 실패했습니다.\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs):
+    """측정값 이름별 {"median", "min", "max"} (초)입니다. 잴 수 없었던 값은 None입니다."""
+    summary = {}
+    for key, _ in MEASUREMENTS:
+        values = sorted(run[key] for run in runs if run[key] is not None)
+        summary[key] = {"median": statistics.median(values), "min": values[0], "max": values[-1]} if values else None
+    return summary
+
+
+def format_summary(summary, repeat):
+    lines = [f"시작 시간 ({repeat}회, 초)", f"{'':<10}{'중앙값':>8}{'최소':>8}{'최대':>8}"]
+    for key, label in MEASUREMENTS:
+        stats = summary[key]
+        if stats is None:
+            lines.append(f"{label:<10}{'-':>8}{'-':>8}{'-':>8}  (디스플레이 없음)")
+        else:
+            lines.append(f"{label:<10}{stats['median']:>8.2f}{stats['min']:>8.2f}{stats['max']:>8.2f}")
+    return "\n".join(lines)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(prog="python -m startup_benchmark", description="Bananafy의 시작 시간을 잽니다.")
+    parser.add_argument("--repeat", type=int, default=5, help="측정 횟수 (기본값: 5)")
+    parser.add_argument("--json", help="측정값을 JSON 파일로도 저장합니다")
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+
+    if args.child is not None:
+        print(json.dumps(measure_startup(args.child)))
+        return 0
+
+    try:
+        runs = [run_once() for _ in range(max(1, args.repeat))]
+    except RuntimeError as e:
+        print(f"오류: {e}", file=sys.stderr)
+        return 1
+    summary = summarize(runs)
+    print(format_summary(summary, len(runs)))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"runs": runs, "summary": summary}, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())